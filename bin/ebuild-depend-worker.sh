@@ -0,0 +1,40 @@
+#!/bin/bash
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+# A long-lived process which runs the "depend" phase of ebuild.sh for a
+# sequence of ebuilds, so that a new process does not have to be spawned
+# for each ebuild during metadata regeneration.
+#
+# Each request is read from stdin as a list of NUL-terminated changes
+# to the environment of this process ("+NAME=value" or "-NAME"), which
+# is terminated by an empty item. The depend phase is executed in a
+# subshell, so that changes to the environment and shell state do not
+# leak into subsequent requests. The metadata is written to
+# ${PORTAGE_PIPE_FD} by ebuild.sh, and it is followed by a line which
+# consists of a NUL byte and the exit status of the subshell.
+
+while true ; do
+	__depend_worker_eof=1
+	__depend_worker_ops=()
+	while IFS= read -r -d '' __depend_worker_op ; do
+		if [[ -z ${__depend_worker_op} ]] ; then
+			__depend_worker_eof=
+			break
+		fi
+		__depend_worker_ops+=("${__depend_worker_op}")
+	done
+	[[ -n ${__depend_worker_eof} ]] && exit 0
+
+	(
+		for __depend_worker_op in "${__depend_worker_ops[@]}" ; do
+			case ${__depend_worker_op} in
+				+*) export "${__depend_worker_op:1}" ;;
+				-*) unset "${__depend_worker_op:1}" ;;
+			esac
+		done 2>/dev/null
+		unset __depend_worker_eof __depend_worker_op __depend_worker_ops
+		source "${PORTAGE_BIN_PATH}/ebuild.sh" "$@"
+	) </dev/null
+	printf '\0%s\n' "$?" >&${PORTAGE_PIPE_FD}
+done
@@ -497,9 +497,18 @@ else
 fi
 # level the QA interceptors if we're in depend
 if [[ -n ${QA_INTERCEPTORS} ]] ; then
+	# Search PATH directly instead of using $(type -Pf ${BIN}), since
+	# a subshell for each interceptor is relatively expensive.
+	IFS=: read -r -a BIN_DIRS <<< "${PATH}"
 	for BIN in ${QA_INTERCEPTORS}; do
-		BIN_PATH=$(type -Pf ${BIN})
-		if [ "$?" != "0" ]; then
+		BIN_PATH=
+		for BIN_DIR in "${BIN_DIRS[@]}" ; do
+			if [[ -f ${BIN_DIR:-.}/${BIN} && -x ${BIN_DIR:-.}/${BIN} ]] ; then
+				BIN_PATH=${BIN_DIR:-.}/${BIN}
+				break
+			fi
+		done
+		if [[ -z ${BIN_PATH} ]] ; then
 			BODY="echo \"*** missing command: ${BIN}\" >&2; return 127"
 		else
 			BODY="${BIN_PATH} \"\$@\"; return \$?"
@@ -532,7 +541,7 @@ if [[ -n ${QA_INTERCEPTORS} ]] ; then
 		fi
 		eval "$FUNC_SRC" || echo "error creating QA interceptor ${BIN}" >&2
 	done
-	unset BIN_PATH BIN BODY FUNC_SRC
+	unset BIN_DIR BIN_DIRS BIN_PATH BIN BODY FUNC_SRC
 fi
 
 # Subshell/helper die support (must export for the die helper).
@@ -744,9 +753,15 @@ if [[ $EBUILD_PHASE = depend ]] ; then
 			echo $(echo ${!f}) >> "${dbkey}" || exit $?
 		done
 	else
+		# Remove newlines by word splitting, without the subshells
+		# that are needed for $(echo), since this is a hot path for
+		# metadata regeneration.
 		for f in ${auxdbkeys} ; do
-			eval "echo \$(echo \${!f}) 1>&${PORTAGE_PIPE_FD}" || exit $?
+			__auxdb_words=( ${!f} )
+			printf -v __auxdb_value '%s ' "${__auxdb_words[@]}"
+			eval "printf '%s\n' \"\${__auxdb_value% }\" 1>&${PORTAGE_PIPE_FD}" || exit $?
 		done
+		unset __auxdb_value __auxdb_words
 		eval "exec ${PORTAGE_PIPE_FD}>&-"
 	fi
 	set +f
@@ -46,6 +46,11 @@ class AbstractEbuildProcess(SpawnProcess):
 	# is left so we can temporarily disable it if any issues arise.
 	_enable_ipc_daemon = True
 
+	# PORTAGE_LOG_FILE belongs to a single package, and other messages
+	# are only written to it before the phase is spawned or after it
+	# exits (PipeLogger stops splicing if the log grows unexpectedly).
+	_log_file_exclusive = True
+
 	def __init__(self, **kwargs):
 		SpawnProcess.__init__(self, **kwargs)
 		if self.phase is None:
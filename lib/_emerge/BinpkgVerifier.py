@@ -4,6 +4,7 @@
 import errno
 import io
 import sys
+import time
 
 from _emerge.CompositeTask import CompositeTask
 import portage
@@ -12,10 +13,12 @@ from portage.checksum import (_apply_hash_filter,
 	_filter_unaccelarated_hashes, _hash_filter)
 from portage.output import EOutput
 from portage.util._async.FileDigester import FileDigester
+from portage.util._DigestCache import get_digest_cache
 from portage.package.ebuild.fetch import _checksum_failure_temp_file
 
 class BinpkgVerifier(CompositeTask):
-	__slots__ = ("logfile", "pkg", "_digests", "_pkg_path")
+	__slots__ = ("logfile", "pkg", "_digest_cache", "_digests", "_pkg_path",
+		"_pkg_stat", "_start_time")
 
 	def _start(self):
 
@@ -35,7 +38,7 @@ class BinpkgVerifier(CompositeTask):
 		self._digests = digests
 
 		try:
-			size = os.stat(self._pkg_path).st_size
+			st = os.stat(self._pkg_path)
 		except OSError as e:
 			if e.errno not in (errno.ENOENT, errno.ESTALE):
 				raise
@@ -46,14 +49,29 @@ class BinpkgVerifier(CompositeTask):
 			self._async_wait()
 			return
 		else:
-			if size != digests["size"]:
-				self._digest_exception("size", size, digests["size"])
+			if st.st_size != digests["size"]:
+				self._digest_exception("size", st.st_size, digests["size"])
 				self.returncode = 1
 				self._async_wait()
 				return
 
+		hash_names = [k for k in digests if k != "size"]
+		# Partially fetched files are renamed after verification, so
+		# there is no point in caching their digests.
+		if not self._pkg_path.endswith(".partial"):
+			self._digest_cache = get_digest_cache(bintree.settings)
+		if self._digest_cache is not None:
+			self._pkg_stat = st
+			cached_digests = self._digest_cache.get(
+				os.path.abspath(self._pkg_path), st, hash_names)
+			if cached_digests is not None:
+				self.returncode = self._check_digests(cached_digests)
+				self._async_wait()
+				return
+			self._start_time = time.time()
+
 		self._start_task(FileDigester(file_path=self._pkg_path,
-			hash_names=(k for k in digests if k != "size"),
+			hash_names=hash_names,
 			background=self.background, logfile=self.logfile,
 			scheduler=self.scheduler),
 			self._digester_exit)
@@ -64,19 +82,26 @@ class BinpkgVerifier(CompositeTask):
 			self.wait()
 			return
 
-		for hash_name in digester.hash_names:
-			if digester.digests[hash_name] != self._digests[hash_name]:
+		if self._digest_cache is not None:
+			self._digest_cache.set(os.path.abspath(self._pkg_path),
+				self._pkg_stat, dict(digester.digests), self._start_time)
+
+		self.returncode = self._check_digests(digester.digests)
+		self.wait()
+
+	def _check_digests(self, digests):
+		for hash_name in sorted(self._digests):
+			if hash_name == "size":
+				continue
+			if digests[hash_name] != self._digests[hash_name]:
 				self._digest_exception(hash_name,
-					digester.digests[hash_name], self._digests[hash_name])
-				self.returncode = 1
-				self.wait()
-				return
+					digests[hash_name], self._digests[hash_name])
+				return 1
 
 		if self.pkg.root_config.settings.get("PORTAGE_QUIET") != "1":
 			self._display_success()
 
-		self.returncode = os.EX_OK
-		self.wait()
+		return os.EX_OK
 
 	def _display_success(self):
 		stdout_orig = sys.stdout
@@ -0,0 +1,132 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import os as _os
+import resource
+import time
+
+from portage import os
+
+class BuildResourceMonitor(object):
+	"""
+	Measures the wall clock time of a build, and samples the process
+	tree of the build periodically, in order to find its peak resident
+	set size and the CPU time that it has used. The root of the process
+	tree is obtained from the get_pid function each time that a sample
+	is taken, since each phase of a build runs in a separate process.
+
+	The CPU time of a phase is taken from the cumulative times of its
+	root process, which include all descendants that have exited, so
+	CPU time that is used after the last sample of a phase is missed.
+	Descendants are found via /proc/<pid>/task/<tid>/children, which
+	is not available on all systems. Nothing is sampled if it is
+	unavailable.
+	"""
+
+	_sample_interval = 5 # seconds
+
+	_page_size_kb = resource.getpagesize() // 1024
+
+	_clock_ticks = _os.sysconf("SC_CLK_TCK") \
+		if hasattr(_os, "sysconf") else 100
+
+	_children_supported = None
+
+	def __init__(self, scheduler, get_pid):
+		self._scheduler = scheduler
+		self._get_pid = get_pid
+		self._start_time = None
+		self._handle = None
+		self._cpu_ticks = {}
+		self.peak_rss = 0
+
+	@classmethod
+	def supported(cls):
+		if cls._children_supported is None:
+			pid = os.getpid()
+			cls._children_supported = os.path.exists(
+				"/proc/%d/task/%d/children" % (pid, pid))
+		return cls._children_supported
+
+	def start(self):
+		self._start_time = time.time()
+		if self.supported():
+			self._schedule()
+
+	def stop(self):
+		"""
+		Stop sampling, and return the elapsed time in seconds.
+		"""
+		if self._handle is not None:
+			self._handle.cancel()
+			self._handle = None
+		return time.time() - self._start_time
+
+	@property
+	def cpu_time(self):
+		"""
+		The CPU time in seconds which has been used by the build.
+		"""
+		return sum(self._cpu_ticks.values()) / self._clock_ticks
+
+	def _schedule(self):
+		self._handle = self._scheduler.call_later(
+			self._sample_interval, self._sample)
+
+	def _sample(self):
+		self._handle = None
+		pid = self._get_pid()
+		if pid is not None:
+			ticks = self.cpu_ticks(pid)
+			if ticks > self._cpu_ticks.get(pid, 0):
+				self._cpu_ticks[pid] = ticks
+			rss = self.tree_rss(pid)
+			if rss > self.peak_rss:
+				self.peak_rss = rss
+		self._schedule()
+
+	@staticmethod
+	def cpu_ticks(pid):
+		"""
+		Return the user and system time of pid, including the times of
+		its descendants that have exited, in clock ticks.
+		"""
+		try:
+			with open("/proc/%d/stat" % pid, "rb") as f:
+				stat = f.read()
+		except EnvironmentError:
+			return 0
+		# The command name may contain spaces, so skip to the fields
+		# after it. Field 14 (utime) is the 12th field after it.
+		fields = stat[stat.rfind(b")") + 2:].split()
+		try:
+			return sum(int(x) for x in fields[11:15])
+		except ValueError:
+			return 0
+
+	@classmethod
+	def tree_rss(cls, pid):
+		"""
+		Return the total RSS of pid and its descendants in kilobytes.
+		"""
+		rss = 0
+		stack = [pid]
+		while stack:
+			pid = stack.pop()
+			try:
+				with open("/proc/%d/statm" % pid, "rb") as f:
+					rss += int(f.read().split()[1]) * cls._page_size_kb
+				tids = os.listdir("/proc/%d/task" % pid)
+			except EnvironmentError:
+				# The process has exited.
+				continue
+			for tid in tids:
+				try:
+					with open("/proc/%d/task/%s/children" % (pid, tid),
+						"rb") as f:
+						stack.extend(int(child) for child in f.read().split())
+				except EnvironmentError:
+					pass
+		return rss
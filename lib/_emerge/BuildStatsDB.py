@@ -0,0 +1,174 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import errno
+import json
+import sys
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.const import CACHE_PATH
+from portage.data import portage_gid, uid
+from portage.localization import _
+from portage.util import apply_secpass_permissions, atomic_ofstream, writemsg
+
+class BuildStatsDB(object):
+	"""
+	A persistent history of the resource usage of source builds, which
+	is keyed by cp. Each entry holds the wall clock time of the build
+	in seconds, the average number of CPUs that it kept busy, its peak
+	resident set size in kilobytes, and the number of make jobs (from
+	MAKEOPTS) that it was built with.
+
+	Build times and CPU usage are averaged with the previous values,
+	so that they adapt to changes in the package. The peak RSS
+	follows increases immediately and decreases slowly, since an
+	underestimate can cause the OOM killer to be invoked.
+	"""
+
+	_format_version = "1"
+
+	_json_write_opts = {
+		"ensure_ascii": False,
+		"indent": "\t",
+		"sort_keys": True
+	}
+	if sys.hexversion < 0x30200F0:
+		# indent only supports int number of spaces
+		_json_write_opts["indent"] = 4
+
+	def __init__(self, filename):
+		self.filename = filename
+		self._packages = self._load()
+		self._modified = set()
+
+	@classmethod
+	def from_settings(cls, settings):
+		return cls(os.path.join(settings["EROOT"], CACHE_PATH,
+			"build_stats.json"))
+
+	def _load(self):
+		try:
+			with open(_unicode_encode(self.filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				content = f.read()
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.EACCES):
+				writemsg(_("!!! Error loading '%s': %s\n") %
+					(self.filename, e), noiselevel=-1)
+			return {}
+
+		try:
+			d = json.loads(_unicode_decode(content,
+				encoding=_encodings['repo.content'], errors='strict'))
+		except (UnicodeDecodeError, ValueError) as e:
+			writemsg(_("!!! Error loading '%s': %s\n") %
+				(self.filename, e), noiselevel=-1)
+			return {}
+
+		if not isinstance(d, dict) or \
+			d.get("version") != self._format_version or \
+			not isinstance(d.get("packages"), dict):
+			return {}
+		return d["packages"]
+
+	def get(self, cp):
+		"""
+		@rtype: dict or None
+		@return: a dict with "time", "cpu", "rss" and "jobs" keys, or None if
+			there is no history for cp
+		"""
+		return self._packages.get(cp)
+
+	def record(self, cp, build_time, cpu_time, peak_rss, jobs):
+		"""
+		Update the history of cp with the result of a successful build.
+
+		@param build_time: wall clock time in seconds
+		@type build_time: float
+		@param cpu_time: user and system time in seconds
+		@type cpu_time: float
+		@param peak_rss: peak resident set size in kilobytes
+		@type peak_rss: int
+		@param jobs: number of make jobs
+		@type jobs: int
+		"""
+		build_time = float(build_time)
+		cpu = cpu_time / build_time if build_time > 0 else 0.0
+		peak_rss = int(peak_rss)
+		old = self._packages.get(cp)
+		if old is not None:
+			build_time = (old["time"] + build_time) / 2
+			cpu = (old["cpu"] + cpu) / 2
+			peak_rss = max(peak_rss, (old["rss"] + peak_rss) // 2)
+		self._packages[cp] = {
+			"count": (old["count"] + 1 if old is not None else 1),
+			"cpu": round(cpu, 2),
+			"jobs": int(jobs),
+			"rss": peak_rss,
+			"time": round(build_time, 1),
+		}
+		self._modified.add(cp)
+
+	def store(self):
+		"""
+		Write modified entries to the file. Entries that have been
+		written by other emerge processes in the meantime are preserved.
+		"""
+		if not self._modified:
+			return
+		packages = self._load()
+		for cp in self._modified:
+			packages[cp] = self._packages[cp]
+		try:
+			f = atomic_ofstream(self.filename, mode='wb')
+		except EnvironmentError:
+			# The current user doesn't have permission to write
+			# the history, but that's alright.
+			return
+		try:
+			f.write(_unicode_encode(json.dumps({
+				"packages": packages,
+				"version": self._format_version,
+				}, **self._json_write_opts),
+				encoding=_encodings['repo.content'], errors='strict'))
+		except EnvironmentError:
+			f.abort()
+			return
+		f.close()
+		apply_secpass_permissions(self.filename,
+			uid=uid, gid=portage_gid, mode=0o644)
+		self._packages = packages
+		self._modified.clear()
+
+def makeopts_jobs(makeopts, default=1):
+	"""
+	Return the number of jobs that is specified by the -j or --jobs
+	option in makeopts. If the option has no argument, which means
+	that the number of jobs is unlimited, then default is returned.
+
+	@param makeopts: the value of MAKEOPTS
+	@type makeopts: str
+	@rtype: int
+	"""
+	jobs = 1
+	args = makeopts.split()
+	for i, arg in enumerate(args):
+		if arg in ("-j", "--jobs"):
+			value = args[i + 1] if i + 1 < len(args) else ""
+		elif arg.startswith("--jobs="):
+			value = arg[len("--jobs="):]
+		elif arg.startswith("-j"):
+			value = arg[len("-j"):]
+		else:
+			continue
+		try:
+			jobs = int(value)
+		except ValueError:
+			jobs = default
+		else:
+			if jobs < 1:
+				jobs = 1
+	return jobs
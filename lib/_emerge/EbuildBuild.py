@@ -1,4 +1,4 @@
-# Copyright 1999-2018 Gentoo Foundation
+# Copyright 1999-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -8,6 +8,8 @@ import io
 
 import _emerge.emergelog
 from _emerge.AsynchronousTask import AsynchronousTask
+from _emerge.BuildResourceMonitor import BuildResourceMonitor
+from _emerge.BuildStatsDB import makeopts_jobs
 from _emerge.EbuildExecuter import EbuildExecuter
 from _emerge.EbuildPhase import EbuildPhase
 from _emerge.EbuildBinpkg import EbuildBinpkg
@@ -24,15 +26,17 @@ from portage import _encodings, _unicode_decode, _unicode_encode, os
 from portage.package.ebuild.digestcheck import digestcheck
 from portage.package.ebuild.doebuild import _check_temp_dir
 from portage.package.ebuild._spawn_nofetch import SpawnNofetchWithoutBuilddir
+from portage.util.cpuinfo import get_cpu_count
 from portage.util._async.AsyncTaskFuture import AsyncTaskFuture
 
 
 class EbuildBuild(CompositeTask):
 
-	__slots__ = ("args_set", "config_pool", "find_blockers",
+	__slots__ = ("args_set", "build_stats", "config_pool", "find_blockers",
 		"ldpath_mtimes", "logger", "opts", "pkg", "pkg_count",
 		"prefetcher", "settings", "world_atom") + \
-		("_build_dir", "_buildpkg", "_ebuild_path", "_issyspkg", "_tree")
+		("_build_dir", "_buildpkg", "_ebuild_path", "_issyspkg",
+		"_resource_monitor", "_tree")
 
 	def _start(self):
 		if not self.opts.fetchonly:
@@ -316,8 +320,36 @@ class EbuildBuild(CompositeTask):
 
 		build = EbuildExecuter(background=self.background, pkg=pkg,
 			scheduler=scheduler, settings=settings)
+		if self.build_stats is not None:
+			self._resource_monitor = BuildResourceMonitor(scheduler,
+				self._current_pid)
+			self._resource_monitor.start()
 		self._start_task(build, self._build_exit)
 
+	def _current_pid(self):
+		"""
+		Return the pid of the process which is currently running a
+		phase of the build, or None if there is no such process.
+		"""
+		task = self._current_task
+		while task is not None:
+			if getattr(task, "pid", None) is not None and \
+				task.returncode is None:
+				return task.pid
+			task = getattr(task, "_current_task", None)
+		return None
+
+	def _record_build_stats(self, build):
+		monitor = self._resource_monitor
+		self._resource_monitor = None
+		build_time = monitor.stop()
+		if build.returncode != os.EX_OK:
+			return
+		self.build_stats.record(self.pkg.cp, build_time,
+			monitor.cpu_time, monitor.peak_rss,
+			makeopts_jobs(self.settings.get("MAKEOPTS", ""),
+			default=get_cpu_count() or 1))
+
 	def _fetch_failed(self):
 		# We only call the pkg_nofetch phase if either RESTRICT=fetch
 		# is set or the package has explicitly overridden the default
@@ -365,6 +397,9 @@ class EbuildBuild(CompositeTask):
 			self._async_wait()
 
 	def _build_exit(self, build):
+		if self._resource_monitor is not None:
+			self._record_build_stats(build)
+
 		if self._default_exit(build) != os.EX_OK:
 			self._async_unlock_builddir(returncode=self.returncode)
 			return
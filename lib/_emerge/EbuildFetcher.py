@@ -15,6 +15,7 @@ from portage.elog.messages import eerror
 from portage.package.ebuild.fetch import _check_distfile, fetch
 from portage.util._async.AsyncTaskFuture import AsyncTaskFuture
 from portage.util._async.ForkProcess import ForkProcess
+from portage.util._DigestCache import get_digest_cache
 from portage.util._pty import _create_pty_or_pipe
 from _emerge.CompositeTask import CompositeTask
 
@@ -138,6 +139,7 @@ class _EbuildFetcherProcess(ForkProcess):
 		hash_filter = _hash_filter(settings.get("PORTAGE_CHECKSUM_FILTER", ""))
 		if hash_filter.transparent:
 			hash_filter = None
+		digest_cache = get_digest_cache(settings)
 		stdout_orig = sys.stdout
 		stderr_orig = sys.stderr
 		global_havecolor = portage.output.havecolor
@@ -159,7 +161,8 @@ class _EbuildFetcherProcess(ForkProcess):
 						break
 					continue
 				ok, st = _check_distfile(os.path.join(distdir, filename),
-					mydigests, eout, show_errors=False, hash_filter=hash_filter)
+					mydigests, eout, show_errors=False, hash_filter=hash_filter,
+					digest_cache=digest_cache)
 				if not ok:
 					success = False
 					break
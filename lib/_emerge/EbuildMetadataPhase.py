@@ -26,8 +26,9 @@ class EbuildMetadataPhase(SubProcess):
 	"""
 
 	__slots__ = ("cpv", "eapi_supported", "ebuild_hash", "fd_pipes",
-		"metadata", "portdb", "repo_path", "settings", "write_auxdb") + \
-		("_eapi", "_eapi_lineno", "_raw_metadata",)
+		"metadata", "portdb", "repo_path", "settings", "worker_pool",
+		"write_auxdb") + \
+		("_eapi", "_eapi_lineno", "_raw_metadata", "_worker")
 
 	_file_names = ("ebuild",)
 	_files_dict = slot_dict_class(_file_names, prefix="")
@@ -63,6 +64,10 @@ class EbuildMetadataPhase(SubProcess):
 		settings.setcpv(self.cpv)
 		settings.configdict['pkg']['EAPI'] = parsed_eapi
 
+		if self.worker_pool is not None:
+			self._start_worker(ebuild_path)
+			return
+
 		debug = settings.get("PORTAGE_DEBUG") == "1"
 		master_fd = None
 		slave_fd = None
@@ -128,6 +133,72 @@ class EbuildMetadataPhase(SubProcess):
 
 		self.pid = retval[0]
 
+	def _start_worker(self, ebuild_path):
+		"""
+		Send the depend phase to a worker from self.worker_pool,
+		instead of spawning a new process.
+		"""
+		self._raw_metadata = []
+		retval, self._worker = self.worker_pool.request(ebuild_path,
+			self.settings, self.portdb, fd_pipes=self.fd_pipes)
+		if retval != os.EX_OK:
+			self.returncode = retval
+			self._async_wait()
+			return
+
+		self.scheduler.add_reader(self._worker.pipe_fd,
+			self._worker_output_handler)
+		self._registered = True
+
+	def _worker_output_handler(self):
+		worker = self._worker
+		while True:
+			buf = self._read_buf(worker.pipe_fd)
+			if buf is None:
+				break # EAGAIN
+			elif buf:
+				self._raw_metadata.append(buf)
+				# The metadata is followed by a line which consists
+				# of a NUL byte and the exit status.
+				if not buf.endswith(b"\n"):
+					continue
+				raw_metadata = b"".join(self._raw_metadata)
+				status_start = raw_metadata.find(b"\0")
+				if status_start == -1:
+					continue
+				self._raw_metadata = [raw_metadata[:status_start]]
+				try:
+					returncode = int(raw_metadata[status_start + 1:])
+				except ValueError:
+					returncode = 1
+				self._worker_exit(returncode)
+				break
+			else: # EOF
+				# The worker has died unexpectedly.
+				self._worker_exit(1, reusable=False)
+				break
+
+	def _worker_exit(self, returncode, reusable=True):
+		worker = self._worker
+		self._worker = None
+		self.scheduler.remove_reader(worker.pipe_fd)
+		self._registered = False
+		if reusable:
+			self.worker_pool.release(worker)
+		else:
+			# The worker has died or the request has been
+			# interrupted, so its state is unknown.
+			self.worker_pool.discard(worker)
+		self.returncode = returncode
+		self._process_raw_metadata()
+		self._async_wait()
+
+	def _cancel(self):
+		if self._worker is not None:
+			self._worker_exit(self._cancelled_returncode, reusable=False)
+		else:
+			SubProcess._cancel(self)
+
 	def _output_handler(self):
 		while True:
 			buf = self._read_buf(self._files.ebuild)
@@ -144,7 +215,8 @@ class EbuildMetadataPhase(SubProcess):
 						break
 
 	def _unregister(self):
-		self.scheduler.remove_reader(self._files.ebuild)
+		if self._files is not None:
+			self.scheduler.remove_reader(self._files.ebuild)
 		SubProcess._unregister(self)
 
 	def _async_waitpid_cb(self, *args, **kwargs):
@@ -153,6 +225,9 @@ class EbuildMetadataPhase(SubProcess):
 		not necessarily idempotent.
 		"""
 		SubProcess._async_waitpid_cb(self, *args, **kwargs)
+		self._process_raw_metadata()
+
+	def _process_raw_metadata(self):
 		# self._raw_metadata is None when _start returns
 		# early due to an unsupported EAPI
 		if self.returncode == os.EX_OK and \
@@ -0,0 +1,221 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import fcntl
+import signal
+import sys
+
+import portage
+from portage import os
+from portage import _encodings
+from portage import _shell_quote
+from portage import _unicode_encode
+from portage.package.ebuild.doebuild import _check_ebuild_manifest, \
+	_doebuild_spawn, doebuild_environment
+
+class EbuildMetadataWorker(object):
+	"""
+	A long-lived bash process which runs the "depend" phase for a
+	sequence of ebuilds (see bin/ebuild-depend-worker.sh).
+	"""
+
+	__slots__ = ("env", "pid", "pipe_fd", "request_fd")
+
+	def __init__(self, pid, request_fd, pipe_fd, env):
+		self.pid = pid
+		self.request_fd = request_fd
+		self.pipe_fd = pipe_fd
+		self.env = env
+
+	def send(self, env):
+		"""
+		Send a request, in the form of the changes that need to be
+		applied to the initial environment of the worker.
+		"""
+		ops = []
+		for k in self.env:
+			if k not in env:
+				ops.append("-" + k)
+		for k, v in env.items():
+			if self.env.get(k) != v:
+				ops.append("+%s=%s" % (k, v))
+		ops.append("")
+		data = _unicode_encode("".join(op + "\0" for op in ops),
+			encoding=_encodings['content'], errors='backslashreplace')
+		while data:
+			data = data[os.write(self.request_fd, data):]
+
+	def close(self, kill=False):
+		"""
+		Close the pipes of the worker, which causes it to exit when it
+		is idle, and wait for it to exit.
+		"""
+		for fd in (self.request_fd, self.pipe_fd):
+			if fd is not None:
+				os.close(fd)
+		self.request_fd = None
+		self.pipe_fd = None
+		if self.pid is not None:
+			if kill:
+				try:
+					os.kill(self.pid, signal.SIGTERM)
+				except OSError as e:
+					if e.errno != errno.ESRCH:
+						raise
+			try:
+				os.waitpid(self.pid, 0)
+			except OSError as e:
+				if e.errno != errno.ECHILD:
+					raise
+			self.pid = None
+
+class EbuildMetadataWorkerPool(object):
+	"""
+	A pool of EbuildMetadataWorker instances, which is used by
+	EbuildMetadataPhase in order to avoid the cost of spawning a new
+	process for each ebuild during metadata regeneration. Workers are
+	spawned on demand, so the number of workers is bounded by the
+	number of concurrent EbuildMetadataPhase tasks.
+	"""
+
+	_worker_sh_binary = "ebuild-depend-worker.sh"
+
+	def __init__(self):
+		self._idle = []
+		self._workers = set()
+
+	@classmethod
+	def supported(cls, settings):
+		"""
+		Workers are not supported if PORTAGE_BIN_PATH refers to an
+		older version of portage, like when portage reinstalls itself.
+		"""
+		return os.access(os.path.join(settings["PORTAGE_BIN_PATH"],
+			cls._worker_sh_binary), os.X_OK)
+
+	def request(self, ebuild_path, settings, portdb, fd_pipes=None):
+		"""
+		Prepare the environment for the depend phase of the given
+		ebuild, and send a request to an idle worker.
+
+		@rtype: tuple
+		@return: (returncode, worker) where worker is None unless
+			returncode is os.EX_OK
+		"""
+		if not os.path.exists(ebuild_path):
+			portage.writemsg("!!! doebuild: %s not found for %s\n" %
+				(ebuild_path, "depend"), noiselevel=-1)
+			return 1, None
+
+		retval, _mf = _check_ebuild_manifest(ebuild_path, "depend",
+			settings, "porttree")
+		if retval != os.EX_OK:
+			return retval, None
+
+		doebuild_environment(ebuild_path, "depend",
+			settings=settings, db=portdb)
+
+		if self._idle:
+			worker = self._idle.pop()
+		else:
+			worker = self._spawn(settings, fd_pipes)
+			if isinstance(worker, int):
+				return worker, None
+
+		settings["EBUILD_PHASE"] = "depend"
+		settings["PORTAGE_PIPE_FD"] = worker.env["PORTAGE_PIPE_FD"]
+		try:
+			env = settings.environ()
+		finally:
+			settings.pop("EBUILD_PHASE", None)
+			settings.pop("PORTAGE_PIPE_FD", None)
+
+		try:
+			worker.send(env)
+		except EnvironmentError:
+			self.discard(worker)
+			return 1, None
+		return os.EX_OK, worker
+
+	def _spawn(self, settings, fd_pipes):
+		if fd_pipes is None:
+			fd_pipes = {}
+		else:
+			fd_pipes = fd_pipes.copy()
+
+		# The request pipe is the stdin of the worker, and the metadata
+		# pipe remains open for all requests.
+		slave_request_fd, request_fd = os.pipe()
+		master_fd, slave_fd = os.pipe()
+		fcntl.fcntl(master_fd, fcntl.F_SETFL,
+			fcntl.fcntl(master_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+		# FD_CLOEXEC is enabled by default in Python >=3.4.
+		if sys.hexversion < 0x3040000:
+			try:
+				fcntl.FD_CLOEXEC
+			except AttributeError:
+				pass
+			else:
+				for fd in (request_fd, master_fd):
+					fcntl.fcntl(fd, fcntl.F_SETFD,
+						fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+		fd_pipes[0] = slave_request_fd
+		fd_pipes.setdefault(1, sys.__stdout__.fileno())
+		fd_pipes.setdefault(2, sys.__stderr__.fileno())
+		fd_pipes[slave_fd] = slave_fd
+
+		# flush any pending output
+		sys.__stdout__.flush()
+		sys.__stderr__.flush()
+
+		worker_sh = _shell_quote(os.path.join(settings["PORTAGE_BIN_PATH"],
+			self._worker_sh_binary)).replace("%", "%%")
+		actionmap = {"depend": {"cmd": worker_sh + " %s", "args": {}}}
+
+		settings["EBUILD_PHASE"] = "depend"
+		settings["PORTAGE_PIPE_FD"] = str(slave_fd)
+		try:
+			env = settings.environ()
+			retval = _doebuild_spawn("depend", settings, actionmap=actionmap,
+				fd_pipes=fd_pipes, returnpid=True)
+		finally:
+			settings.pop("EBUILD_PHASE", None)
+			settings.pop("PORTAGE_PIPE_FD", None)
+			os.close(slave_request_fd)
+			os.close(slave_fd)
+
+		if isinstance(retval, int):
+			# spawn failed
+			os.close(request_fd)
+			os.close(master_fd)
+			return retval
+
+		worker = EbuildMetadataWorker(retval[0], request_fd, master_fd, env)
+		self._workers.add(worker)
+		return worker
+
+	def release(self, worker):
+		"""
+		Return a worker that has finished a request to the pool.
+		"""
+		self._idle.append(worker)
+
+	def discard(self, worker):
+		"""
+		Terminate a worker that is in an unknown state, which
+		happens if it dies or if a request is cancelled.
+		"""
+		self._workers.discard(worker)
+		worker.close(kill=True)
+
+	def close(self):
+		"""
+		Terminate all workers.
+		"""
+		for worker in list(self._workers):
+			self._workers.discard(worker)
+			worker.close(kill=worker not in self._idle)
+		del self._idle[:]
@@ -182,6 +182,13 @@ class FakeVartree(vartree):
 			perform_global_updates(
 				pkg.cpv, aux_dict, self.dbapi, self._global_updates)
 
+	def dynamic_deps_applied(self, pkg):
+		"""
+		Return True if dynamic deps have already been applied to the
+		given package, via either dynamic_deps_preload or aux_get.
+		"""
+		return pkg.cpv in self._aux_get_history
+
 	def dynamic_deps_preload(self, pkg, metadata):
 		if metadata is not None:
 			metadata = dict((k, metadata.get(k, ''))
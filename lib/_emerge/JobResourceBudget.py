@@ -0,0 +1,158 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import logging
+import math
+import re
+
+from _emerge.BuildStatsDB import makeopts_jobs
+from portage.util import writemsg_level
+from portage.util.cpuinfo import get_cpu_count
+
+class JobResourceBudget(object):
+	"""
+	Packs parallel jobs against a CPU budget and a memory budget, using
+	the costs of previous builds from a BuildStatsDB. The CPU cost of
+	a source build is the average number of CPUs that its previous
+	build kept busy, and its memory cost is the peak RSS of its previous
+	build. Both are scaled by the ratio of the current number of make
+	jobs to the number that was used for the previous build, and the
+	CPU cost is at most the current number of make jobs. Packages
+	without history, and binary packages, which are extracted by a
+	single process, have a CPU cost of 1 and no memory cost, so they
+	are only limited by --jobs and --load-average as before.
+
+	A job which exceeds the budget by itself is allowed to run when no
+	other jobs are running.
+	"""
+
+	_size_re = re.compile(r'^(\d+)([KMGT]?)$', re.IGNORECASE)
+	_size_units = {"": 1024, "K": 1, "M": 1024, "G": 1024 ** 2,
+		"T": 1024 ** 3}
+
+	def __init__(self, stats, cpus, memory, default_jobs):
+		"""
+		@param stats: build history
+		@type stats: BuildStatsDB
+		@param cpus: CPU budget
+		@type cpus: int
+		@param memory: memory budget in kilobytes, or None for unlimited
+		@type memory: int or None
+		@param default_jobs: the number of make jobs from MAKEOPTS
+		@type default_jobs: int
+		"""
+		self.stats = stats
+		self.cpus = cpus
+		self.memory = memory
+		self.default_jobs = default_jobs
+		self._running = {}
+		self._cpu_used = 0
+		self._memory_used = 0
+
+	@classmethod
+	def from_settings(cls, settings, stats):
+		"""
+		Create a budget from PORTAGE_SCHEDULER_CPU_BUDGET and
+		PORTAGE_SCHEDULER_MEMORY_BUDGET, which default to the number of
+		available CPUs and the total memory of the system.
+		"""
+		cpus = get_cpu_count() or 1
+		value = settings.get("PORTAGE_SCHEDULER_CPU_BUDGET")
+		if value:
+			try:
+				cpus = int(value)
+				if cpus < 1:
+					raise ValueError(value)
+			except ValueError:
+				writemsg_level("!!! Invalid PORTAGE_SCHEDULER_CPU_BUDGET: "
+					"'%s'\n" % (value,), level=logging.ERROR, noiselevel=-1)
+				cpus = get_cpu_count() or 1
+
+		memory = cls._total_memory()
+		value = settings.get("PORTAGE_SCHEDULER_MEMORY_BUDGET")
+		if value:
+			parsed = cls.parse_size(value)
+			if parsed is None:
+				writemsg_level("!!! Invalid PORTAGE_SCHEDULER_MEMORY_BUDGET: "
+					"'%s'\n" % (value,), level=logging.ERROR, noiselevel=-1)
+			else:
+				memory = parsed
+
+		default_jobs = makeopts_jobs(settings.get("MAKEOPTS", ""),
+			default=cpus)
+		return cls(stats, cpus, memory, default_jobs)
+
+	@classmethod
+	def parse_size(cls, value):
+		"""
+		Parse a size with an optional K, M, G or T suffix. A size
+		without a suffix is in megabytes.
+
+		@rtype: int or None
+		@return: the size in kilobytes, or None if value is invalid
+		"""
+		m = cls._size_re.match(value.strip())
+		if m is None:
+			return None
+		return int(m.group(1)) * cls._size_units[m.group(2).upper()]
+
+	@staticmethod
+	def _total_memory():
+		try:
+			with open("/proc/meminfo", "rb") as f:
+				for line in f:
+					if line.startswith(b"MemTotal:"):
+						return int(line.split()[1])
+		except (EnvironmentError, IndexError, ValueError):
+			pass
+		return None
+
+	def cost(self, pkg):
+		"""
+		@rtype: tuple
+		@return: (cpu, memory) cost of building or extracting pkg
+		"""
+		if pkg.built:
+			return (1, 0)
+		history = self.stats.get(pkg.cp)
+		if history is None:
+			return (1, 0)
+		jobs = min(self.default_jobs, self.cpus)
+		scale = jobs / (history["jobs"] or 1)
+		cpu = min(jobs, max(1, int(math.ceil(history["cpu"] * scale))))
+		return (cpu, int(history["rss"] * scale))
+
+	def fits(self, pkg):
+		"""
+		Return True if a job for pkg can be started without exceeding
+		the budget.
+		"""
+		if not self._running:
+			return True
+		cpu, memory = self.cost(pkg)
+		if self._cpu_used + cpu > self.cpus:
+			return False
+		if self.memory is not None and \
+			self._memory_used + memory > self.memory:
+			return False
+		return True
+
+	def acquire(self, key, pkg):
+		cost = self.cost(pkg)
+		self._running[key] = cost
+		self._cpu_used += cost[0]
+		self._memory_used += cost[1]
+
+	def release(self, key):
+		"""
+		@rtype: bool
+		@return: True if resources were released, False otherwise
+		"""
+		cost = self._running.pop(key, None)
+		if cost is None:
+			return False
+		self._cpu_used -= cost[0]
+		self._memory_used -= cost[1]
+		return True
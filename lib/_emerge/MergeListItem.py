@@ -1,4 +1,4 @@
-# Copyright 1999-2014 Gentoo Foundation
+# Copyright 1999-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 from portage import os
@@ -19,7 +19,7 @@ class MergeListItem(CompositeTask):
 	"""
 
 	__slots__ = ("args_set",
-		"binpkg_opts", "build_opts", "config_pool", "emerge_opts",
+		"binpkg_opts", "build_opts", "build_stats", "config_pool", "emerge_opts",
 		"find_blockers", "logger", "mtimedb", "pkg",
 		"pkg_count", "pkg_to_replace", "prefetcher",
 		"settings", "statusMessage", "world_atom") + \
@@ -74,6 +74,7 @@ class MergeListItem(CompositeTask):
 
 			build = EbuildBuild(args_set=args_set,
 				background=self.background,
+				build_stats=self.build_stats,
 				config_pool=self.config_pool,
 				find_blockers=find_blockers,
 				ldpath_mtimes=ldpath_mtimes, logger=logger,
@@ -5,16 +5,21 @@ import portage
 from portage import os
 from portage.dep import _repo_separator
 from _emerge.EbuildMetadataPhase import EbuildMetadataPhase
+from _emerge.EbuildMetadataWorkerPool import EbuildMetadataWorkerPool
 from portage.cache.cache_errors import CacheError
 from portage.util._async.AsyncScheduler import AsyncScheduler
 
 class MetadataRegen(AsyncScheduler):
 
 	def __init__(self, portdb, cp_iter=None, consumer=None,
-		write_auxdb=True, **kwargs):
+		write_auxdb=True, persistent_workers=True, **kwargs):
 		AsyncScheduler.__init__(self, **kwargs)
 		self._portdb = portdb
 		self._write_auxdb = write_auxdb
+		self._worker_pool = None
+		if persistent_workers and \
+			EbuildMetadataWorkerPool.supported(portdb.doebuild_settings):
+			self._worker_pool = EbuildMetadataWorkerPool()
 		self._global_cleanse = False
 		if cp_iter is None:
 			cp_iter = self._iter_every_cp()
@@ -75,11 +80,15 @@ class MetadataRegen(AsyncScheduler):
 						ebuild_hash=ebuild_hash,
 						portdb=portdb, repo_path=repo_path,
 						settings=portdb.doebuild_settings,
+						worker_pool=self._worker_pool,
 						write_auxdb=self._write_auxdb)
 
 	def _cleanup(self):
 		super(MetadataRegen, self)._cleanup()
 
+		if self._worker_pool is not None:
+			self._worker_pool.close()
+
 		portdb = self._portdb
 		dead_nodes = {}
 
@@ -0,0 +1,318 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import hashlib
+import sys
+import time
+
+import portage
+from portage import os
+from portage import _encodings, _unicode_encode
+from portage.const import USER_CONFIG_PATH, VCS_DIRS, WORLD_FILE, \
+	WORLD_SETS_FILE
+from portage.data import secpass
+from portage.util import writemsg
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+	_unicode = str
+else:
+	_unicode = unicode
+
+class ResolverCache(object):
+	"""
+	This caches the merge lists calculated by backtrack_depgraph, so that
+	a repeated invocation of emerge with identical inputs does not have
+	to resolve the whole dependency graph again. Each entry is keyed on a
+	fingerprint of everything that might alter the result of dependency
+	resolution:
+		1) the command line action, arguments and options
+		2) the installed package database (vdb mtime and COUNTER)
+		3) repository timestamps, metadata caches and category
+		   directory mtimes, or the mtimes of all package directories,
+		   ebuilds and eclasses for repositories without a metadata
+		   cache
+		4) the user configuration, profiles and world files
+		5) the binary package index
+
+	The cache is enabled by FEATURES=resolver-cache, and it is only used
+	for --pretend runs (see backtrack_depgraph). A cached merge list is
+	loaded in the same way as a --resume list, so it is still validated
+	against the current package databases.
+	"""
+
+	# Maximum number of merge lists to keep, so that different
+	# command lines do not keep invalidating each other's entries.
+	_cache_max_entries = 8
+
+	# Options which only affect display, and therefore are
+	# irrelevant to dependency resolution.
+	_display_opts = frozenset([
+		"--alphabetical", "--ask", "--ask-enter-invalid", "--color",
+		"--columns", "--debug", "--quiet", "--quiet-build",
+		"--quiet-repo-display", "--tree", "--unordered-display",
+		"--verbose", "--verbose-conflicts", "--verbose-slot-rebuilds",
+	])
+
+	# Variables that are used as-is by the resolver, regardless of
+	# whether they come from the environment, make.conf or the profile.
+	_settings_keys = ("ACCEPT_KEYWORDS", "ACCEPT_LICENSE",
+		"ACCEPT_PROPERTIES", "ACCEPT_RESTRICT", "ARCH", "CHOST",
+		"EMERGE_DEFAULT_OPTS", "FEATURES", "PKGDIR", "PORTAGE_BINHOST",
+		"USE", "USE_EXPAND", "USE_ORDER")
+
+	def __init__(self, settings, trees, myopts, myaction, myfiles):
+		self._settings = settings
+		self._trees = trees
+		self._cache_filename = os.path.join(settings['EROOT'],
+			portage.CACHE_PATH, "depgraph_resolver.pickle")
+		self._cache_version = "1"
+		self._cache_data = None
+		self._modified = False
+		self.fingerprint = self._fingerprint(myopts, myaction, myfiles)
+		self._load()
+
+	def _load(self):
+		try:
+			with open(_unicode_encode(self._cache_filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				mypickle = pickle.Unpickler(f)
+				try:
+					mypickle.find_global = None
+				except AttributeError:
+					# TODO: If py3k, override Unpickler.find_class().
+					pass
+				self._cache_data = mypickle.load()
+		except (SystemExit, KeyboardInterrupt):
+			raise
+		except Exception as e:
+			if isinstance(e, EnvironmentError) and \
+				getattr(e, 'errno', None) in (errno.ENOENT, errno.EACCES):
+				pass
+			else:
+				writemsg("!!! Error loading '%s': %s\n" % \
+					(self._cache_filename, e), noiselevel=-1)
+			del e
+
+		cache_valid = self._cache_data and \
+			isinstance(self._cache_data, dict) and \
+			self._cache_data.get("version") == self._cache_version and \
+			isinstance(self._cache_data.get("entries"), dict)
+
+		if not cache_valid:
+			self._cache_data = {"version": self._cache_version,
+				"entries": {}}
+		self._modified = False
+
+	def get(self):
+		"""
+		Return the resume data (a dict with "mergelist" and "favorites"
+		keys, compatible with depgraph._loadResumeCommand) that was
+		stored for the current fingerprint, or None if there is no
+		valid entry.
+		"""
+		entry = self._cache_data["entries"].get(self.fingerprint)
+		if not isinstance(entry, dict):
+			return None
+		mergelist = entry.get("mergelist")
+		favorites = entry.get("favorites")
+		if not (isinstance(mergelist, list) and
+			isinstance(favorites, list)):
+			return None
+		for x in mergelist:
+			if not (isinstance(x, list) and len(x) == 4 and
+				all(isinstance(y, basestring) for y in x)):
+				return None
+			if x[1] not in self._trees:
+				return None
+		return {
+			"mergelist": [list(x) for x in mergelist],
+			"favorites": list(favorites),
+		}
+
+	def store(self, mergelist, favorites):
+		"""
+		Record the merge list and favorites for the current fingerprint,
+		evicting the oldest entries if necessary.
+
+		@param mergelist: Package instances as returned by depgraph.altlist()
+		@type mergelist: list
+		@param favorites: favorites as returned by depgraph.select_files()
+		@type favorites: list
+		"""
+		entries = self._cache_data["entries"]
+		entries[self.fingerprint] = {
+			"mergelist": [[_unicode(y) for y in x] for x in mergelist
+				if getattr(x, "operation", None) == "merge"],
+			"favorites": [_unicode(x) for x in favorites],
+			"timestamp": time.time(),
+		}
+		if len(entries) > self._cache_max_entries:
+			for k in sorted(entries,
+				key=lambda k: entries[k].get("timestamp", 0))[
+				:len(entries) - self._cache_max_entries]:
+				del entries[k]
+		self._modified = True
+
+	def discard(self):
+		"""
+		Remove the entry for the current fingerprint, if any. This is
+		called when a cached merge list turns out to be unusable.
+		"""
+		if self._cache_data["entries"].pop(self.fingerprint, None) is not None:
+			self._modified = True
+
+	def flush(self):
+		"""
+		If the current user has permission and the cache has been
+		modified, save it to disk. The cache is stored as a pickled
+		dict object with the following format:
+
+		{
+			version : "1",
+			"entries" : {fingerprint : {"mergelist" : [...],
+				"favorites" : [...], "timestamp" : float}, ...},
+		}
+		"""
+		if self._modified and secpass >= 2:
+			try:
+				f = portage.util.atomic_ofstream(self._cache_filename,
+					mode='wb')
+				pickle.dump(self._cache_data, f, protocol=2)
+				f.close()
+				portage.util.apply_secpass_permissions(
+					self._cache_filename, gid=portage.portage_gid,
+					mode=0o644)
+			except (IOError, OSError):
+				pass
+			self._modified = False
+
+	@staticmethod
+	def _stat_key(path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		return (st.st_mtime, st.st_size, st.st_ino)
+
+	def _walk_stat_keys(self, top):
+		"""
+		Yield (path, stat key) pairs for top and everything below it,
+		in a stable order.
+		"""
+		yield (top, self._stat_key(top))
+		for parent, dirs, files in os.walk(top):
+			dirs[:] = sorted(d for d in dirs if d not in VCS_DIRS)
+			for name in sorted(files):
+				path = os.path.join(parent, name)
+				yield (path, self._stat_key(path))
+			for name in dirs:
+				path = os.path.join(parent, name)
+				yield (path, self._stat_key(path))
+
+	def _repo_stat_keys(self, location, categories):
+		"""
+		Yield stat keys which change when an ebuild or eclass in the
+		repository at location is added, removed or modified. If the
+		repository has metadata/timestamp.chk and a metadata cache,
+		which are updated together whenever it is synced, then these
+		and the category directories suffice. Otherwise, for example
+		for overlays and git repositories, the package directories,
+		ebuilds and eclasses are stat'ed individually.
+		"""
+		keys = {}
+		for path in ("metadata/timestamp.chk", "metadata/md5-cache",
+			"metadata/cache", "profiles"):
+			keys[path] = self._stat_key(os.path.join(location, path))
+			yield keys[path]
+
+		authoritative = keys["metadata/timestamp.chk"] is not None and \
+			(keys["metadata/md5-cache"] is not None or
+			keys["metadata/cache"] is not None)
+
+		for cat in categories:
+			cat_dir = os.path.join(location, cat)
+			yield self._stat_key(cat_dir)
+			if authoritative:
+				continue
+			try:
+				pkg_names = sorted(os.listdir(cat_dir))
+			except OSError:
+				continue
+			for pn in pkg_names:
+				pkg_dir = os.path.join(cat_dir, pn)
+				yield (pn, self._stat_key(pkg_dir))
+				try:
+					names = sorted(os.listdir(pkg_dir))
+				except OSError:
+					continue
+				for name in names:
+					if name.endswith(".ebuild"):
+						yield (name, self._stat_key(
+							os.path.join(pkg_dir, name)))
+
+		if not authoritative:
+			eclass_dir = os.path.join(location, "eclass")
+			yield self._stat_key(eclass_dir)
+			try:
+				names = sorted(os.listdir(eclass_dir))
+			except OSError:
+				names = []
+			for name in names:
+				if name.endswith(".eclass"):
+					yield (name, self._stat_key(
+						os.path.join(eclass_dir, name)))
+
+	def _fingerprint(self, myopts, myaction, myfiles):
+		h = hashlib.sha1()
+
+		def update(*args):
+			h.update(_unicode_encode(repr(args),
+				encoding=_encodings['content'], errors='backslashreplace'))
+
+		update(self._cache_version, myaction, sorted(myfiles))
+		update(sorted((k, repr(v)) for k, v in myopts.items()
+			if k not in self._display_opts))
+
+		for eroot in sorted(self._trees):
+			root_trees = self._trees[eroot]
+			settings = root_trees["vartree"].settings
+			update(eroot, [(k, settings.get(k)) for k in self._settings_keys])
+
+			vardb = root_trees["vartree"].dbapi
+			update(self._stat_key(vardb._dbroot),
+				self._stat_key(vardb._counter_path))
+
+			for path in (WORLD_FILE, WORLD_SETS_FILE):
+				update(self._stat_key(os.path.join(eroot, path)))
+
+			update(list(self._walk_stat_keys(os.path.join(
+				settings["PORTAGE_CONFIGROOT"], USER_CONFIG_PATH))))
+
+			for profile in settings.profiles:
+				update(profile, self._stat_key(profile))
+				try:
+					names = sorted(os.listdir(profile))
+				except OSError:
+					continue
+				for name in names:
+					update(name, self._stat_key(os.path.join(profile, name)))
+
+			portdb = root_trees["porttree"].dbapi
+			update(self._stat_key(portdb.depcachedir))
+			for repo in portdb.repositories:
+				update(repo.name, repo.location)
+				update(list(self._repo_stat_keys(repo.location,
+					sorted(settings.categories))))
+
+			bintree = root_trees.get("bintree")
+			if bintree is not None:
+				update(self._stat_key(bintree._pkgindex_file))
+
+		return h.hexdigest()
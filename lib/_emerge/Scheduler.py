@@ -1,4 +1,4 @@
-# Copyright 1999-2014 Gentoo Foundation
+# Copyright 1999-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, print_function, unicode_literals
@@ -42,6 +42,7 @@ from _emerge.BinpkgPrefetcher import BinpkgPrefetcher
 from _emerge.BinpkgVerifier import BinpkgVerifier
 from _emerge.Blocker import Blocker
 from _emerge.BlockerDB import BlockerDB
+from _emerge.BuildStatsDB import BuildStatsDB
 from _emerge.clear_caches import clear_caches
 from _emerge.create_depgraph_params import create_depgraph_params
 from _emerge.create_world_atom import create_world_atom
@@ -53,8 +54,10 @@ from _emerge.EbuildPhase import EbuildPhase
 from _emerge.emergelog import emergelog
 from _emerge.FakeVartree import FakeVartree
 from _emerge.getloadavg import getloadavg
+from _emerge._critical_path_lengths import _critical_path_lengths
 from _emerge._find_deep_system_runtime_deps import _find_deep_system_runtime_deps
 from _emerge._flush_elog_mod_echo import _flush_elog_mod_echo
+from _emerge.JobResourceBudget import JobResourceBudget
 from _emerge.JobStatusDisplay import JobStatusDisplay
 from _emerge.MergeListItem import MergeListItem
 from _emerge.Package import Package
@@ -109,6 +112,16 @@ class Scheduler(PollScheduler):
 	class _pkg_count_class(SlotObject):
 		__slots__ = ("curval", "maxval")
 
+	class _later_nodes_class(SlotObject):
+		"""
+		Contains the packages which follow the package at the given
+		index in the merge list, for _dependent_on_scheduled_merges.
+		"""
+		__slots__ = ("index", "positions")
+
+		def __contains__(self, node):
+			return self.positions.get(node, -1) > self.index
+
 	class _emerge_log_class(SlotObject):
 		__slots__ = ("xterm_titles",)
 
@@ -214,6 +227,22 @@ class Scheduler(PollScheduler):
 		if max_jobs is None:
 			max_jobs = 1
 		self._set_max_jobs(max_jobs)
+
+		# With FEATURES=resource-scheduler, source builds record their
+		# resource usage, and parallel jobs are packed against CPU and
+		# memory budgets based on that history. With
+		# FEATURES=critical-path-scheduler, packages on the longest
+		# remaining path of build times are started first.
+		self._build_stats = None
+		self._job_budget = None
+		self._critical_path = None
+		if "resource-scheduler" in settings.features or \
+			"critical-path-scheduler" in settings.features:
+			self._build_stats = BuildStatsDB.from_settings(settings)
+		if "resource-scheduler" in settings.features:
+			self._job_budget = JobResourceBudget.from_settings(settings,
+				self._build_stats)
+
 		self._running_root = trees[trees._running_eroot]["root_config"]
 		self.edebug = 0
 		if settings.get("PORTAGE_DEBUG", "") == "1":
@@ -445,6 +474,7 @@ class Scheduler(PollScheduler):
 
 	def _set_graph_config(self, graph_config):
 
+		self._critical_path = None
 		if graph_config is None:
 			self._graph_config = None
 			self._pkg_cache = {}
@@ -485,6 +515,8 @@ class Scheduler(PollScheduler):
 		self._find_system_deps()
 		self._prune_digraph()
 		self._prevent_builddir_collisions()
+		if "critical-path-scheduler" in self.settings.features:
+			self._critical_path = self._find_critical_path()
 		if '--debug' in self.myopts:
 			writemsg("\nscheduler digraph:\n\n", noiselevel=-1)
 			self._digraph.debug_print()
@@ -506,6 +538,34 @@ class Scheduler(PollScheduler):
 		deep_system_deps.difference_update([pkg for pkg in \
 			deep_system_deps if pkg.operation != "merge"])
 
+	def _find_critical_path(self):
+		"""
+		Return a dict which maps each package in the graph to the
+		expected build time of the longest path from the package through
+		the packages which depend on it. Source builds without history
+		are assumed to take the median build time of the packages with
+		history, and other operations are assumed to take no time.
+		"""
+		build_stats = self._build_stats
+		build_times = {}
+		for node in self._digraph:
+			if isinstance(node, Package) and node.operation == "merge" \
+				and not node.built:
+				history = build_stats.get(node.cp)
+				build_times[node] = None if history is None \
+					else history["time"]
+
+		known = sorted(t for t in build_times.values() if t is not None)
+		default = known[len(known) // 2] if known else 0
+
+		def weight(node):
+			if node not in build_times:
+				return 0
+			t = build_times[node]
+			return default if t is None else t
+
+		return _critical_path_lengths(self._digraph, weight)
+
 	def _prune_digraph(self):
 		"""
 		Prune any root nodes that are irrelevant.
@@ -1360,6 +1420,10 @@ class Scheduler(PollScheduler):
 				self._failed_pkg_msg(self._failed_pkgs[-1], "emerge", "for")
 				self._status_display.failed = len(self._failed_pkgs)
 			self._deallocate_config(build.settings)
+		if self._job_budget is not None and \
+			self._job_budget.release(id(build)):
+			# Packages which did not fit into the budget may fit now.
+			self._choose_pkg_return_early = False
 		self._jobs -= 1
 		self._status_display.running = self._jobs
 		self._schedule()
@@ -1419,6 +1483,8 @@ class Scheduler(PollScheduler):
 				display_callback.handle.cancel()
 			if failed_pkgs:
 				rval = failed_pkgs[-1].returncode
+			if self._build_stats is not None:
+				self._build_stats.store()
 
 		return rval
 
@@ -1456,9 +1522,14 @@ class Scheduler(PollScheduler):
 				(self._max_jobs is True or self._max_jobs > 1)):
 				self._choose_pkg_return_early = True
 				return None
-			return self._pkg_queue.pop(0)
+			for pkg in self._pkg_queue:
+				if self._job_fits(pkg):
+					self._pkg_queue.remove(pkg)
+					return pkg
+			self._choose_pkg_return_early = True
+			return None
 
-		if not self._is_work_scheduled():
+		if not self._is_work_scheduled() and self._critical_path is None:
 			return self._pkg_queue.pop(0)
 
 		self._prune_digraph()
@@ -1473,11 +1544,17 @@ class Scheduler(PollScheduler):
 				chosen_pkg = pkg
 				break
 
-		if chosen_pkg is None:
+		if chosen_pkg is None and self._critical_path is not None:
+			chosen_pkg = self._choose_critical_pkg()
+			if chosen_pkg is None and not self._is_work_scheduled():
+				chosen_pkg = self._pkg_queue[0]
+
+		elif chosen_pkg is None:
 			later = set(self._pkg_queue)
 			for pkg in self._pkg_queue:
 				later.remove(pkg)
-				if not self._dependent_on_scheduled_merges(pkg, later):
+				if self._job_fits(pkg) and \
+					not self._dependent_on_scheduled_merges(pkg, later):
 					chosen_pkg = pkg
 					break
 
@@ -1492,6 +1569,33 @@ class Scheduler(PollScheduler):
 
 		return chosen_pkg
 
+	def _choose_critical_pkg(self):
+		"""
+		Return the package with the longest critical path among the
+		packages that can be started now, preferring earlier packages in
+		the merge list when critical paths have the same length.
+		"""
+		queue = self._pkg_queue
+		critical_path = self._critical_path
+		positions = dict((pkg, i) for i, pkg in enumerate(queue))
+		order = sorted(range(len(queue)),
+			key=lambda i: -critical_path.get(queue[i], 0))
+		for i in order:
+			pkg = queue[i]
+			if self._job_fits(pkg) and \
+				not self._dependent_on_scheduled_merges(pkg,
+				self._later_nodes_class(index=i, positions=positions)):
+				return pkg
+		return None
+
+	def _job_fits(self, pkg):
+		"""
+		Return True if a job for pkg fits into the resource budget, or
+		if pkg does not need a job.
+		"""
+		return self._job_budget is None or pkg.installed or \
+			self._job_budget.fits(pkg)
+
 	def _dependent_on_scheduled_merges(self, pkg, later):
 		"""
 		Traverse the subgraph of the given packages deep dependencies
@@ -1704,6 +1808,8 @@ class Scheduler(PollScheduler):
 				self._task_queues.merge.addFront(merge)
 
 			elif pkg.built:
+				if self._job_budget is not None:
+					self._job_budget.acquire(id(task), pkg)
 				self._jobs += 1
 				self._previous_job_start_time = time.time()
 				self._status_display.running = self._jobs
@@ -1712,6 +1818,8 @@ class Scheduler(PollScheduler):
 				self._task_queues.jobs.add(task)
 
 			else:
+				if self._job_budget is not None:
+					self._job_budget.acquire(id(task), pkg)
 				self._jobs += 1
 				self._previous_job_start_time = time.time()
 				self._status_display.running = self._jobs
@@ -1754,7 +1862,7 @@ class Scheduler(PollScheduler):
 
 		task = MergeListItem(args_set=self._args_set,
 			background=self._background, binpkg_opts=self._binpkg_opts,
-			build_opts=self._build_opts,
+			build_opts=self._build_opts, build_stats=self._build_stats,
 			config_pool=self._ConfigPool(pkg.root,
 			self._allocate_config, self._deallocate_config),
 			emerge_opts=self.myopts,
@@ -41,6 +41,10 @@ class SpawnProcess(SubProcess):
 	# given that processes may fork before they can be killed.
 	_CGROUP_CLEANUP_RETRY_MAX = 8
 
+	# Set to True if nothing else appends to the log file while the
+	# process runs (see PipeLogger).
+	_log_file_exclusive = False
+
 	def _start(self):
 
 		if self.fd_pipes is None:
@@ -139,6 +143,7 @@ class SpawnProcess(SubProcess):
 
 		self._pipe_logger = PipeLogger(background=self.background,
 			scheduler=self.scheduler, input_fd=master_fd,
+			log_file_exclusive=self._log_file_exclusive,
 			log_file_path=log_file_path,
 			stdout_fd=stdout_fd)
 		self._pipe_logger.addExitListener(self._pipe_logger_exit)
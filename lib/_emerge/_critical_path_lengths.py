@@ -0,0 +1,38 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+def _critical_path_lengths(graph, weight):
+	"""
+	Return a dict which maps each node of graph to the length of the
+	longest path from the node through the nodes which depend on it
+	(its parents), where the length of a path is the sum of the weights
+	of its nodes. Edges which close a cycle are ignored.
+
+	@param graph: dependency graph, where children are dependencies
+	@type graph: digraph
+	@param weight: function which returns the weight of a node
+	@type weight: callable
+	@rtype: dict
+	"""
+	lengths = {}
+	visiting = set()
+	for start in graph:
+		if start in lengths:
+			continue
+		stack = [(start, False)]
+		while stack:
+			node, expanded = stack.pop()
+			if expanded:
+				visiting.discard(node)
+				parent_lengths = [lengths.get(parent, 0)
+					for parent in graph.parent_nodes(node)]
+				lengths[node] = weight(node) + max(parent_lengths or [0])
+				continue
+			if node in lengths or node in visiting:
+				continue
+			visiting.add(node)
+			stack.append((node, True))
+			for parent in graph.parent_nodes(node):
+				if parent not in lengths and parent not in visiting:
+					stack.append((parent, False))
+	return lengths
@@ -27,6 +27,7 @@ from portage.dbapi._similar_name_search import similar_name_search
 from portage.dep import Atom, best_match_to_list, extract_affecting_use, \
 	check_required_use, human_readable_required_use, match_from_list, \
 	_repo_separator
+from portage.dep._compiled_deps import CompiledDepString
 from portage.dep._slot_operator import (ignore_built_slot_operator_deps,
 	strip_slots)
 from portage.eapi import eapi_has_strong_blocks, eapi_has_required_use, \
@@ -46,7 +47,9 @@ from portage.util import ConfigProtect, shlex_split, new_protect_filename
 from portage.util import cmp_sort_key, writemsg, writemsg_stdout
 from portage.util import ensure_dirs
 from portage.util import writemsg_level, write_atomic
+from portage.util.cpuinfo import get_cpu_count
 from portage.util.digraph import digraph
+from portage.util._async.AsyncTaskFuture import AsyncTaskFuture
 from portage.util._async.TaskScheduler import TaskScheduler
 from portage.util._eventloop.EventLoop import EventLoop
 from portage.util._eventloop.global_event_loop import global_event_loop
@@ -72,6 +75,7 @@ from _emerge.is_valid_package_atom import insert_category_into_atom, \
 from _emerge.Package import Package
 from _emerge.PackageArg import PackageArg
 from _emerge.PackageVirtualDbapi import PackageVirtualDbapi
+from _emerge.ResolverCache import ResolverCache
 from _emerge.RootConfig import RootConfig
 from _emerge.search import search
 from _emerge.SetArg import SetArg
@@ -129,6 +133,16 @@ class _frozen_depgraph_config(object):
 		self.roots = {}
 		# All Package instances
 		self._pkg_cache = {}
+		# Maps (pkg, dep_string, validate_iuse) to CompiledDepString
+		# instances, which are reused when backtracking.
+		self._compiled_deps = {}
+		# Maps (root, pkg_type, atom, unevaluated_atom) to the expanded
+		# atom and the cpvs of its cp, in descending order, which are
+		# reused when backtracking.
+		self._atom_cp_list_cache = {}
+		# Contains (root, cpv, repo) tuples for ebuilds that have been
+		# passed to portdbapi.async_aux_get by _prefetch_pkg_deps.
+		self._prefetched_cpvs = set()
 		self._highest_license_masked = {}
 		# We can't know that an soname dep is unsatisfied if there are
 		# any unbuilt ebuilds in the graph, since unbuilt ebuilds have
@@ -646,6 +660,7 @@ class depgraph(object):
 				# This needs to be called for the first depgraph, but not for
 				# backtracking depgraphs that share the same frozen_config.
 				fake_vartree.sync()
+				self._frozen_config._atom_cp_list_cache.clear()
 
 				# FakeVartree.sync() populates virtuals, and we want
 				# self.pkgsettings to have them populated too.
@@ -678,6 +693,10 @@ class depgraph(object):
 			self._spinner_update()
 			self._dynamic_config._package_tracker.add_installed_pkg(pkg)
 			self._add_installed_sonames(pkg)
+			if fake_vartree.dynamic_deps_applied(pkg):
+				# This happens for backtracking depgraphs that share
+				# the same frozen_config.
+				continue
 			ebuild_path, repo_path = \
 				portdb.findname2(pkg.cpv, myrepo=pkg.repo)
 			if ebuild_path is None:
@@ -3375,9 +3394,24 @@ class depgraph(object):
 
 		debug = "--debug" in self._frozen_config.myopts
 
+		# Evaluate the dependency strings before they are prefetched,
+		# so that each is only evaluated once. Errors are handled when
+		# the deps are added to the graph below.
+		evaluated_deps = []
 		for dep_root, dep_string, dep_priority in deps:
-				if not dep_string:
-					continue
+			if not dep_string:
+				continue
+			try:
+				dep_struct = self._compile_dep_string(pkg, dep_string,
+					True).evaluate(uselist=use_enabled)
+			except portage.exception.InvalidDependString as e:
+				dep_struct = e
+			evaluated_deps.append(
+				(dep_root, dep_string, dep_priority, dep_struct))
+
+		self._prefetch_pkg_deps(evaluated_deps)
+
+		for dep_root, dep_string, dep_priority, dep_struct in evaluated_deps:
 				if debug:
 					writemsg_level("\nParent:    %s\n" % (pkg,),
 						noiselevel=-1, level=logging.DEBUG)
@@ -3386,26 +3420,19 @@ class depgraph(object):
 					writemsg_level("Priority:  %s\n" % (dep_priority,),
 						noiselevel=-1, level=logging.DEBUG)
 
-				try:
-					dep_string = portage.dep.use_reduce(dep_string,
-						uselist=use_enabled,
-						is_valid_flag=pkg.iuse.is_valid_flag,
-						opconvert=True, token_class=Atom,
-						eapi=pkg.eapi)
-				except portage.exception.InvalidDependString as e:
-					if not pkg.installed:
-						# should have been masked before it was selected
-						raise
-					del e
-
+				if not isinstance(dep_struct,
+					portage.exception.InvalidDependString):
+					dep_string = dep_struct
+				elif not pkg.installed:
+					# should have been masked before it was selected
+					raise dep_struct
+				else:
 					# Try again, but omit the is_valid_flag argument, since
 					# invalid USE conditionals are a common problem and it's
 					# practical to ignore this issue for installed packages.
 					try:
-						dep_string = portage.dep.use_reduce(dep_string,
-							uselist=use_enabled,
-							opconvert=True, token_class=Atom,
-							eapi=pkg.eapi)
+						dep_string = self._compile_dep_string(pkg, dep_string,
+							False).evaluate(uselist=use_enabled)
 					except portage.exception.InvalidDependString as e:
 						self._dynamic_config._masked_installed.add(pkg)
 						del e
@@ -3434,6 +3461,90 @@ class depgraph(object):
 		self._dynamic_config._traversed_pkg_deps.add(pkg)
 		return 1
 
+	def _prefetch_pkg_deps(self, evaluated_deps):
+		"""
+		Pull metadata for the ebuilds that may be selected in order to
+		satisfy the evaluated dependencies of a package (as generated
+		by _add_pkg_deps), before the dependencies are added to the
+		graph. Ebuilds which do not have valid metadata
+		cache entries run their depend phase concurrently here, instead
+		of one at a time as packages are selected.
+
+		This only has an effect for frozen portdbapi instances, since
+		otherwise the results of aux_get are not memoized.
+		"""
+		if "--usepkgonly" in self._frozen_config.myopts:
+			return
+
+		max_jobs = self._frozen_config.myopts.get("--jobs")
+		if max_jobs is None or max_jobs is True:
+			max_jobs = get_cpu_count()
+		max_load = self._frozen_config.myopts.get("--load-average")
+
+		scheduler = TaskScheduler(
+			self._prefetch_pkg_deps_tasks(evaluated_deps),
+			max_jobs=max_jobs,
+			max_load=max_load,
+			event_loop=self._event_loop)
+		scheduler.start()
+		scheduler.wait()
+
+	def _prefetch_pkg_deps_tasks(self, evaluated_deps):
+		prefetched = self._frozen_config._prefetched_cpvs
+		for dep_root, dep_string, dep_priority, dep_struct in evaluated_deps:
+			if dep_priority.ignored or \
+				isinstance(dep_struct, InvalidDependString):
+				# Errors are reported when the deps are added to the graph.
+				continue
+			root_config = self._frozen_config.roots[dep_root]
+			portdb = root_config.trees["porttree"].dbapi
+			if not portdb.frozen:
+				continue
+
+			stack = [dep_struct]
+			while stack:
+				for atom in stack.pop():
+					if isinstance(atom, list):
+						stack.append(atom)
+						continue
+					if not isinstance(atom, Atom) or atom.blocker or \
+						atom.soname:
+						continue
+					for cpv in match_from_list(atom,
+						portdb.cp_list(atom.cp)):
+						key = (dep_root, cpv, cpv.repo)
+						if key in prefetched:
+							continue
+						prefetched.add(key)
+						future = portdb.async_aux_get(cpv,
+							list(portdb._aux_cache_keys), myrepo=cpv.repo,
+							loop=self._event_loop)
+						if future.done():
+							# Valid metadata cache entry, or error, which
+							# is reported again by aux_get if needed.
+							if not future.cancelled():
+								future.exception()
+							continue
+						yield AsyncTaskFuture(future=future)
+
+	def _compile_dep_string(self, pkg, dep_string, validate_iuse):
+		"""
+		Return a CompiledDepString for the given dependency string of
+		pkg, so that repeated evaluations (for example, when the same
+		package is added to the graph again after backtracking) do not
+		need to parse the dependency string again. An invalid
+		dep_string is reported when the result is evaluated.
+		"""
+		cache_key = (pkg, dep_string, validate_iuse)
+		compiled = self._frozen_config._compiled_deps.get(cache_key)
+		if compiled is None:
+			compiled = CompiledDepString(dep_string,
+				eapi=pkg.eapi, opconvert=True, token_class=Atom,
+				is_valid_flag=(pkg.iuse.is_valid_flag
+				if validate_iuse else None))
+			self._frozen_config._compiled_deps[cache_key] = compiled
+		return compiled
+
 	def _add_pkg_dep_string(self, pkg, dep_root, dep_priority, dep_string,
 		allow_unsatisfied):
 		_autounmask_backup = self._dynamic_config._autounmask
@@ -5605,8 +5716,16 @@ class depgraph(object):
 		"""
 
 		db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
-		atom_exp = dep_expand(atom, mydb=db, settings=root_config.settings)
-		cp_list = db.cp_list(atom_exp.cp)
+		cache_key = (root_config.root, pkg_type, atom, atom.unevaluated_atom)
+		cached = self._frozen_config._atom_cp_list_cache.get(cache_key)
+		if cached is None:
+			atom_exp = dep_expand(atom, mydb=db, settings=root_config.settings)
+			# descending order
+			cp_list = db.cp_list(atom_exp.cp)
+			cp_list.reverse()
+			cached = (atom_exp, cp_list)
+			self._frozen_config._atom_cp_list_cache[cache_key] = cached
+		atom_exp, cp_list = cached
 		matched_something = False
 		installed = pkg_type == 'installed'
 
@@ -5614,36 +5733,35 @@ class depgraph(object):
 			atom_set = InternalPackageSet(initial_atoms=(atom,),
 				allow_repo=True)
 
-			# descending order
-			cp_list.reverse()
 			for cpv in cp_list:
 				# Call match_from_list on one cpv at a time, in order
 				# to avoid unnecessary match_from_list comparisons on
 				# versions that are never yielded from this method.
-				if match_from_list(atom_exp, [cpv]):
-					try:
-						pkg = self._pkg(cpv, pkg_type, root_config,
-							installed=installed, onlydeps=onlydeps,
-							myrepo=getattr(cpv, 'repo', None))
-					except portage.exception.PackageNotFound:
-						pass
-					else:
-						# A cpv can be returned from dbapi.match() as an
-						# old-style virtual match even in cases when the
-						# package does not actually PROVIDE the virtual.
-						# Filter out any such false matches here.
-
-						# Make sure that cpv from the current repo satisfies the atom.
-						# This might not be the case if there are several repos with
-						# the same cpv, but different metadata keys, like SLOT.
-						# Also, parts of the match that require metadata access
-						# are deferred until we have cached the metadata in a
-						# Package instance.
-						if not atom_set.findAtomForPackage(pkg,
-							modified_use=self._pkg_use_enabled(pkg)):
-							continue
-						matched_something = True
-						yield pkg
+				if not match_from_list(atom_exp, [cpv]):
+					continue
+				try:
+					pkg = self._pkg(cpv, pkg_type, root_config,
+						installed=installed, onlydeps=onlydeps,
+						myrepo=getattr(cpv, 'repo', None))
+				except portage.exception.PackageNotFound:
+					pass
+				else:
+					# A cpv can be returned from dbapi.match() as an
+					# old-style virtual match even in cases when the
+					# package does not actually PROVIDE the virtual.
+					# Filter out any such false matches here.
+
+					# Make sure that cpv from the current repo satisfies the atom.
+					# This might not be the case if there are several repos with
+					# the same cpv, but different metadata keys, like SLOT.
+					# Also, parts of the match that require metadata access
+					# are deferred until we have cached the metadata in a
+					# Package instance.
+					if not atom_set.findAtomForPackage(pkg,
+						modified_use=self._pkg_use_enabled(pkg)):
+						continue
+					matched_something = True
+					yield pkg
 
 		# USE=multislot can make an installed package appear as if
 		# it doesn't satisfy a slot dependency. Rebuilding the ebuild
@@ -9753,6 +9871,64 @@ def backtrack_depgraph(settings, trees, myopts, myparams,
 
 def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, spinner):
 
+	resolver_cache = None
+	if "resolver-cache" in settings.features and \
+		"--pretend" in myopts and \
+		not ("--fetchonly" in myopts or "--fetch-all-uri" in myopts):
+		resolver_cache = ResolverCache(settings, trees, myopts,
+			myaction, myfiles)
+		result = _cached_depgraph(settings, trees, myopts, myparams,
+			spinner, resolver_cache)
+		if result is not None:
+			return result
+
+	success, mydepgraph, favorites = _backtrack_depgraph_resolve(settings,
+		trees, myopts, myparams, myaction, myfiles, spinner)
+
+	if resolver_cache is not None and success and \
+		not mydepgraph.need_config_change():
+		resolver_cache.store(mydepgraph.altlist(), favorites)
+		resolver_cache.flush()
+
+	return (success, mydepgraph, favorites)
+
+
+def _cached_depgraph(settings, trees, myopts, myparams, spinner,
+	resolver_cache):
+	"""
+	Construct a depgraph from a merge list that has been stored in the
+	resolver cache, in the same way as for a resume list.
+	@rtype: tuple or None
+	@return: (success, depgraph, favorites), or None if there is no
+		usable cache entry
+	"""
+	resume_data = resolver_cache.get()
+	if resume_data is None:
+		return None
+
+	mydepgraph = depgraph(settings, trees, myopts, myparams, spinner)
+	try:
+		success = mydepgraph._loadResumeCommand(resume_data,
+			skip_masked=False, skip_missing=False)
+	except (portage.exception.PackageNotFound,
+		depgraph.UnsatisfiedResumeDep):
+		success = False
+
+	if not success:
+		resolver_cache.discard()
+		resolver_cache.flush()
+		return None
+
+	if "--debug" in myopts:
+		writemsg_level("\n\nusing cached merge list %s\n\n" %
+			resolver_cache.fingerprint, noiselevel=-1, level=logging.DEBUG)
+
+	return (True, mydepgraph, resume_data["favorites"])
+
+
+def _backtrack_depgraph_resolve(settings, trees, myopts, myparams,
+	myaction, myfiles, spinner):
+
 	debug = "--debug" in myopts
 	mydepgraph = None
 	max_retries = myopts.get('--backtrack', 10)
@@ -9,8 +9,6 @@ import collections
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.dep:Atom,match_from_list',
-	'portage.util:cmp_sort_key',
-	'portage.versions:vercmp',
 )
 
 _PackageConflict = collections.namedtuple("_PackageConflict", ["root", "pkgs", "atom", "description"])
@@ -253,7 +251,7 @@ class PackageTracker(object):
 					candidates.append(installed)
 
 		ret = match_from_list(atom, candidates)
-		ret.sort(key=cmp_sort_key(lambda x, y: vercmp(x.version, y.version)))
+		ret.sort(key=lambda x: x.cpv.version_key)
 		self._match_cache[cp_key][cache_key] = ret
 
 		return iter(ret)
@@ -373,7 +371,7 @@ class PackageTrackerDbapiWrapper(object):
 
 	def match_pkgs(self, atom):
 		ret = sorted(self._package_tracker.match(self._root, atom),
-			key=cmp_sort_key(lambda x, y: vercmp(x.version, y.version)))
+			key=lambda x: x.cpv.version_key)
 		return ret
 
 	def __iter__(self):
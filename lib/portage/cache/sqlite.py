@@ -22,11 +22,20 @@ class database(fs_template.FsBased):
 	chf_types = ('md5', 'mtime')
 
 	autocommits = False
+	bulk_writes = True
 	synchronous = False
 	# cache_bytes is used together with page_size (set at sqlite build time)
 	# to calculate the number of pages requested, according to the following
 	# equation: cache_bytes = page_bytes * page_count
 	cache_bytes = 1024 * 1024 * 10
+	# With write-ahead logging, readers (such as emerge) are not blocked
+	# by a writer (such as egencache), and each commit is cheaper than
+	# with a rollback journal. The journal mode is persistent, so it is
+	# only set by writers.
+	journal_mode = "WAL"
+	# Maximum number of bytes of the database file that are accessed
+	# via memory-mapped I/O (0 disables memory-mapped I/O).
+	mmap_bytes = 1024 * 1024 * 256
 
 	def __init__(self, *args, **config):
 		super(database, self).__init__(*args, **config)
@@ -46,6 +55,8 @@ class database(fs_template.FsBased):
 		config.setdefault("autocommit", self.autocommits)
 		config.setdefault("cache_bytes", self.cache_bytes)
 		config.setdefault("synchronous", self.synchronous)
+		config.setdefault("journal_mode", self.journal_mode)
+		config.setdefault("mmap_bytes", self.mmap_bytes)
 		# Set longer timeout for throwing a "database is locked" exception.
 		# Default timeout in sqlite3 module is 5.0 seconds.
 		config.setdefault("timeout", 15)
@@ -87,6 +98,9 @@ class database(fs_template.FsBased):
 				raise cache_errors.InitializationError(self.__class__, "can't ensure perms on %s" % self._dbpath)
 			self._db_init_cache_size(config["cache_bytes"])
 			self._db_init_synchronous(config["synchronous"])
+			self._db_init_mmap_size(config["mmap_bytes"])
+			if not self.readonly:
+				self._db_init_journal_mode(config["journal_mode"])
 		except self._db_error as e:
 			raise cache_errors.InitializationError(self.__class__, e)
 
@@ -196,12 +210,63 @@ class database(fs_template.FsBased):
 		if actual_synchronous!=synchronous:
 			raise cache_errors.InitializationError(self.__class__,"actual synchronous = "+actual_synchronous+" does does not match requested value of "+synchronous)
 
+	def _db_init_mmap_size(self, mmap_bytes):
+		# Older versions of sqlite silently ignore this pragma, and
+		# the value may be limited at compile time, so the actual
+		# value is not checked.
+		self._db_cursor.execute("PRAGMA mmap_size = %d" % mmap_bytes)
+
+	def _db_init_journal_mode(self, journal_mode):
+		cursor = self._db_cursor
+		cursor.execute("PRAGMA journal_mode = %s" % journal_mode)
+		actual_journal_mode = cursor.fetchone()
+		if actual_journal_mode is None or \
+			actual_journal_mode[0].lower() != journal_mode.lower():
+			# WAL mode is not supported for some filesystems,
+			# such as NFS, so fall back to the current mode.
+			writemsg(_("sqlite: unable to set journal_mode = %s for %s\n") %
+				(journal_mode, self._dbpath), noiselevel=1)
+
+	def _db_statement(self, name):
+		"""return a cached parameterized statement, so that the sqlite
+		module is able to reuse prepared statements"""
+		table = self._db_table["packages"]
+		statement = table.get(name)
+		if statement is None:
+			if name == "select":
+				statement = "SELECT * FROM %s WHERE %s=?" % \
+					(table["table_name"], table["package_key"])
+			elif name == "replace":
+				statement = "REPLACE INTO %s (%s) VALUES (%s)" % \
+					(table["table_name"],
+					",".join([table["package_key"]] + self._allowed_keys),
+					",".join("?" * (len(self._allowed_keys) + 1)))
+			elif name == "delete":
+				statement = "DELETE FROM %s WHERE %s=?" % \
+					(table["table_name"], table["package_key"])
+			elif name == "contains":
+				statement = "SELECT %s FROM %s WHERE %s=?" % \
+					(table["package_id"], table["table_name"],
+					table["package_key"])
+			else:
+				raise KeyError(name)
+			table[name] = statement
+		return statement
+
+	def _db_row(self, cpv, values):
+		row = [cpv]
+		for k in self._allowed_keys:
+			v = values.get(k, '')
+			if not isinstance(v, basestring):
+				# Avoid potential UnicodeEncodeError in python-2.x by
+				# only calling str() when it's absolutely necessary.
+				v = str(v)
+			row.append(v)
+		return row
+
 	def _getitem(self, cpv):
 		cursor = self._db_cursor
-		cursor.execute("select * from %s where %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
+		cursor.execute(self._db_statement("select"), (cpv,))
 		result = cursor.fetchall()
 		if len(result) == 1:
 			pass
@@ -224,46 +289,33 @@ class database(fs_template.FsBased):
 		return d
 
 	def _setitem(self, cpv, values):
-		update_statement = []
-		update_statement.append("REPLACE INTO %s" % self._db_table["packages"]["table_name"])
-		update_statement.append("(")
-		update_statement.append(','.join([self._db_table["packages"]["package_key"]] + self._allowed_keys))
-		update_statement.append(")")
-		update_statement.append("VALUES")
-		update_statement.append("(")
-		values_parameters = []
-		values_parameters.append(self._db_escape_string(cpv))
-		for k in self._allowed_keys:
-			values_parameters.append(self._db_escape_string(values.get(k, '')))
-		update_statement.append(",".join(values_parameters))
-		update_statement.append(")")
 		cursor = self._db_cursor
 		try:
-			s = " ".join(update_statement)
-			cursor.execute(s)
+			cursor.execute(self._db_statement("replace"),
+				self._db_row(cpv, values))
 		except self._db_error as e:
 			writemsg("%s: %s\n" % (cpv, str(e)))
 			raise
 
+	def _setitems(self, items):
+		cursor = self._db_cursor
+		try:
+			cursor.executemany(self._db_statement("replace"),
+				(self._db_row(cpv, values) for cpv, values in items))
+		except self._db_error as e:
+			writemsg("sqlite: %s\n" % (str(e),))
+			raise
+
 	def commit(self):
 		self._db_connection.commit()
 
 	def _delitem(self, cpv):
 		cursor = self._db_cursor
-		cursor.execute("DELETE FROM %s WHERE %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
+		cursor.execute(self._db_statement("delete"), (cpv,))
 
 	def __contains__(self, cpv):
 		cursor = self._db_cursor
-		cursor.execute(" ".join(
-			["SELECT %s FROM %s" %
-			(self._db_table["packages"]["package_id"],
-			self._db_table["packages"]["table_name"]),
-			"WHERE %s=%s" % (
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv))]))
+		cursor.execute(self._db_statement("contains"), (cpv,))
 		result = cursor.fetchall()
 		if len(result) == 0:
 			return False
@@ -28,6 +28,9 @@ class database(object):
 	serialize_eclasses = True
 	validation_chf = 'mtime'
 	store_eclass_paths = True
+	# Derived classes that override _setitems in order to write
+	# multiple entries efficiently set this to True.
+	bulk_writes = False
 
 	def __init__(self, location, label, auxdbkeys, readonly=False):
 		""" initialize the derived class; specifically, store label/keys"""
@@ -130,6 +133,28 @@ class database(object):
 		This shouldn't be overriden in derived classes since it handles the readonly checks"""
 		if self.readonly:
 			raise cache_errors.ReadOnlyRestriction()
+		self._setitem(cpv, self._prepare_values(values))
+		if not self.autocommits:
+			self.updates += 1
+			if self.updates > self.sync_rate:
+				self.commit()
+				self.updates = 0
+
+	def update_many(self, items):
+		"""set multiple cpvs to values, from an iterable of (cpv, values)
+		pairs. Entries are written by a single call to _setitems, which
+		derived classes may override in order to write in bulk, and then
+		committed together."""
+		if self.readonly:
+			raise cache_errors.ReadOnlyRestriction()
+		self._setitems((cpv, self._prepare_values(values))
+			for cpv, values in items)
+		if not self.autocommits:
+			self.commit()
+			self.updates = 0
+
+	def _prepare_values(self, values):
+		"""handle cleanse_keys and _eclasses_ serialization for __setitem__"""
 		d = None
 		if self.cleanse_keys:
 			d=ProtectedDict(values)
@@ -147,18 +172,19 @@ class database(object):
 					self.validation_chf, self.store_eclass_paths)
 		elif d is None:
 			d = values
-		self._setitem(cpv, d)
-		if not self.autocommits:
-			self.updates += 1
-			if self.updates > self.sync_rate:
-				self.commit()
-				self.updates = 0
+		return d
 
 	def _setitem(self, name, values):
 		"""__setitem__ calls this after readonly checks.  override it in derived classes
 		note _eclassees_ key *must* be handled"""
 		raise NotImplementedError
 
+	def _setitems(self, items):
+		"""update_many calls this after readonly checks.  override it in derived
+		classes that support bulk writes"""
+		for cpv, values in items:
+			self._setitem(cpv, values)
+
 	def __delitem__(self, cpv):
 		"""delete a key from the cache.
 		This shouldn't be overriden in derived classes since it handles the readonly checks"""
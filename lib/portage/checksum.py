@@ -93,6 +93,13 @@ class _generate_hash_function(object):
 
 		return (checksum.hexdigest(), size)
 
+	def new(self):
+		"""
+		Return a new hash object, which supports update and hexdigest
+		methods.
+		"""
+		return self._hashobject()
+
 
 # Define hash functions, try to use the best module available. Preferred
 # modules should go first, latter ones should check if the hashes aren't
@@ -294,6 +301,47 @@ class SizeHash(object):
 
 hashfunc_map["size"] = SizeHash()
 
+# The size of the blocks that are read by _checksum_file, which is larger
+# than HASHING_BLOCKSIZE, since each block is fed to multiple hash objects.
+# Since hashlib releases the GIL while it hashes large blocks, this also
+# allows other threads to run while a file is being hashed.
+_multiple_hashing_blocksize = 0x100000
+
+def _checksum_file(filename, hashnames):
+	"""
+	Run a group of checksums against a file, reading the file only
+	once and feeding each block to all of the hash objects.
+
+	@param filename: File to run the checksums against
+	@type filename: String
+	@param hashnames: The types of hash functions to run, which may
+		include "size"
+	@type hashnames: Iterable
+	@rtype: Tuple
+	@return: A dict which maps each hash name to its hash, and the
+		size of the data
+	"""
+	hashobjects = []
+	for hashname in hashnames:
+		if hashname != "size":
+			hashobjects.append((hashname, hashfunc_map[hashname].new()))
+
+	with _open_file(filename) as f:
+		blocksize = _multiple_hashing_blocksize
+		size = 0
+		data = f.read(blocksize)
+		while data:
+			for hashname, hashobject in hashobjects:
+				hashobject.update(data)
+			size += len(data)
+			data = f.read(blocksize)
+
+	digests = dict((hashname, hashobject.hexdigest())
+		for hashname, hashobject in hashobjects)
+	if "size" in hashnames:
+		digests["size"] = size
+	return digests, size
+
 # cache all supported hash methods in a frozenset
 hashfunc_keys = frozenset(hashfunc_map)
 
@@ -330,10 +378,7 @@ def _perform_md5_merge(x, **kwargs):
 		encoding=_encodings['merge'], errors='strict'), **kwargs)
 
 def perform_all(x, calc_prelink=0):
-	mydict = {}
-	for k in hashfunc_keys:
-		mydict[k] = perform_checksum(x, k, calc_prelink)[0]
-	return mydict
+	return _perform_checksums(x, hashfunc_keys, calc_prelink)[0]
 
 def get_valid_checksum_keys():
 	return hashfunc_keys
@@ -343,6 +388,15 @@ def get_hash_origin(hashtype):
 		raise KeyError(hashtype)
 	return hashorigin_map.get(hashtype, "unknown")
 
+def _hashes_hold_gil(hashnames):
+	"""
+	Return True if any of the given hashes is implemented in pure
+	Python, which means that it holds the GIL while it hashes data,
+	so that multiple threads cannot hash files concurrently.
+	"""
+	return any(hashorigin_map.get(hashname) in ("bundled", "pygost")
+		for hashname in hashnames)
+
 def _filter_unaccelarated_hashes(digests):
 	"""
 	If multiple digests are available and some are unaccelerated,
@@ -464,21 +518,20 @@ def verify_all(filename, mydict, calc_prelink=0, strict=0):
 		got = " ".join(got)
 		return False, (_("Insufficient data for checksum verification"), got, expected)
 
-	for x in sorted(mydict):
-		if   x == "size":
-			continue
-		elif x in hashfunc_keys:
-			myhash = perform_checksum(filename, x, calc_prelink=calc_prelink)[0]
-			if mydict[x] != myhash:
-				if strict:
-					raise portage.exception.DigestException(
-						("Failed to verify '$(file)s' on " + \
-						"checksum type '%(type)s'") % \
-						{"file" : filename, "type" : x})
-				else:
-					file_is_ok = False
-					reason = (("Failed on %s verification" % x), myhash, mydict[x])
-					break
+	myhashes = _perform_checksums(filename, verifiable_hash_types,
+		calc_prelink=calc_prelink)[0]
+	for x in sorted(verifiable_hash_types):
+		myhash = myhashes[x]
+		if mydict[x] != myhash:
+			if strict:
+				raise portage.exception.DigestException(
+					("Failed to verify '$(file)s' on " + \
+					"checksum type '%(type)s'") % \
+					{"file" : filename, "type" : x})
+			else:
+				file_is_ok = False
+				reason = (("Failed on %s verification" % x), myhash, mydict[x])
+				break
 
 	return file_is_ok, reason
 
@@ -498,7 +551,33 @@ def perform_checksum(filename, hashname="MD5", calc_prelink=0):
 	@rtype: Tuple
 	@return: The hash and size of the data
 	"""
+	if hashname not in hashfunc_keys:
+		raise portage.exception.DigestException(hashname + \
+			" hash function not available (needs dev-python/pycrypto)")
+	myhashes, mysize = _perform_checksums(filename, (hashname,),
+		calc_prelink=calc_prelink)
+	return myhashes[hashname], mysize
+
+def _perform_checksums(filename, hashnames, calc_prelink=0):
+	"""
+	Run a group of checksums against a file, which is read only once.
+	The filename can be either unicode or an encoded byte string. If
+	filename is unicode then a UnicodeDecodeError will be raised if
+	necessary.
+
+	@param filename: File to run the checksums against
+	@type filename: String
+	@param hashnames: The types of hash functions to run, which must
+		all be in hashfunc_keys
+	@type hashnames: Iterable
+	@param calc_prelink: Whether or not to reverse prelink before running the checksum
+	@type calc_prelink: Integer
+	@rtype: Tuple
+	@return: A dict which maps each hash name to its hash, and the
+		size of the data
+	"""
 	global prelink_capable
+	hashnames = frozenset(hashnames)
 	# Make sure filename is encoded with the correct encoding before
 	# it is passed to spawn (for prelink) and/or the hash function.
 	filename = _unicode_encode(filename,
@@ -523,17 +602,17 @@ def perform_checksum(filename, hashname="MD5", calc_prelink=0):
 				# This happens during uninstallation of prelink.
 				prelink_capable = False
 		try:
-			if hashname not in hashfunc_keys:
-				raise portage.exception.DigestException(hashname + \
-					" hash function not available (needs dev-python/pycrypto)")
-			myhash, mysize = hashfunc_map[hashname].checksum_file(myfilename)
+			if tuple(hashnames) == ("size",):
+				# Avoid reading the file.
+				myhash, mysize = hashfunc_map["size"].checksum_file(myfilename)
+				return {"size": myhash}, mysize
+			return _checksum_file(myfilename, hashnames)
 		except (OSError, IOError) as e:
 			if e.errno in (errno.ENOENT, errno.ESTALE):
 				raise portage.exception.FileNotFound(myfilename)
 			elif e.errno == portage.exception.PermissionDenied.errno:
 				raise portage.exception.PermissionDenied(myfilename)
 			raise
-		return myhash, mysize
 	finally:
 		if prelink_tmpfile:
 			try:
@@ -558,12 +637,11 @@ def perform_multiple_checksums(filename, hashes=["MD5"], calc_prelink=0):
 		return_value[hash_name] = (hash_result,size)
 		for each given checksum
 	"""
-	rVal = {}
+	hashes = frozenset(hashes)
 	for x in hashes:
 		if x not in hashfunc_keys:
 			raise portage.exception.DigestException(x+" hash function not available (needs dev-python/pycrypto or >=dev-lang/python-2.5)")
-		rVal[x] = perform_checksum(filename, x, calc_prelink)[0]
-	return rVal
+	return _perform_checksums(filename, hashes, calc_prelink)[0]
 
 
 def checksum_str(data, hashname="MD5"):
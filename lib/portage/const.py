@@ -125,6 +125,7 @@ SUPPORTED_FEATURES       = frozenset([
 	"assume-digests",
 	"binpkg-docompress",
 	"binpkg-dostrip",
+	"binpkg-index-journal",
 	"binpkg-logs",
 	"binpkg-multi-instance",
 	"buildpkg",
@@ -140,7 +141,9 @@ SUPPORTED_FEATURES       = frozenset([
 	"compressdebug",
 	"compress-index",
 	"config-protect-if-modified",
+	"critical-path-scheduler",
 	"digest",
+	"digest-cache",
 	"distcc",
 	"distcc-pump",
 	"distlocks",
@@ -180,6 +183,8 @@ SUPPORTED_FEATURES       = frozenset([
 	"preserve-libs",
 	"protect-owned",
 	"python-trace",
+	"resolver-cache",
+	"resource-scheduler",
 	"sandbox",
 	"selinux",
 	"sesandbox",
@@ -0,0 +1,113 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import collections
+
+try:
+	from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+	ThreadPoolExecutor = None
+
+class MergePool(object):
+	"""
+	Runs file operations for dblink.mergeme in a bounded thread pool,
+	while output is emitted in the original order. Output functions are
+	wrapped with wrap(), so that their calls are queued behind any
+	operation which has been submitted earlier and is still running.
+	When an operation completes, its callback is called with the result
+	in the main thread, once all earlier output has been emitted.
+	"""
+
+	def __init__(self, max_jobs):
+		self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+		# Limit the number of operations that are submitted before
+		# their output has been emitted.
+		self._max_pending = 4 * max_jobs
+		self._queue = collections.deque()
+		self._pending = 0
+		self.pending_dests = set()
+
+	@classmethod
+	def create(cls, max_jobs):
+		"""
+		Return a new MergePool, or None if files should be merged
+		serially.
+		"""
+		if max_jobs <= 1 or ThreadPoolExecutor is None:
+			return None
+		return cls(max_jobs)
+
+	def wrap(self, func):
+		"""
+		Return a function which calls func immediately if no output is
+		queued, and queues the call otherwise.
+		"""
+		def wrapper(*args, **kwargs):
+			if self._queue:
+				self._queue.append((None, None,
+					lambda: func(*args, **kwargs)))
+			else:
+				func(*args, **kwargs)
+		return wrapper
+
+	def submit(self, dest, func, callback):
+		"""
+		Call func in the thread pool, and queue callback, which is
+		called with the result of func. The callback returns a true
+		value if the operation failed.
+
+		@param dest: path that is created by func, which is tracked in
+			pending_dests until the callback has been called
+		@type dest: str
+		@rtype: int or None
+		@return: 1 if an earlier operation failed, None otherwise
+		"""
+		self._queue.append((self._executor.submit(func), dest, callback))
+		self._pending += 1
+		self.pending_dests.add(dest)
+		while self._pending > self._max_pending:
+			if self._drain_one(True):
+				return 1
+		return self.drain(wait=False)
+
+	def drain(self, wait=True):
+		"""
+		Emit queued output in order, up to the first operation which is
+		still running, or all of it if wait is True.
+
+		@rtype: int or None
+		@return: 1 if an operation failed, None otherwise
+		"""
+		while self._queue:
+			future = self._queue[0][0]
+			if future is not None and not (wait or future.done()):
+				break
+			if self._drain_one(wait):
+				return 1
+		return None
+
+	def _drain_one(self, wait):
+		future, dest, callback = self._queue.popleft()
+		if future is None:
+			callback()
+			return None
+		self._pending -= 1
+		self.pending_dests.discard(dest)
+		if callback(future.result()):
+			self._queue.clear()
+			return 1
+		return None
+
+	def shutdown(self):
+		"""
+		Cancel operations that have not started yet, and wait for the
+		others to complete. Queued output is discarded, so drain() has
+		to be called first unless the merge has failed.
+		"""
+		for future, dest, callback in self._queue:
+			if future is not None:
+				future.cancel()
+		self._queue.clear()
+		self._pending = 0
+		self.pending_dests.clear()
+		self._executor.shutdown(wait=True)
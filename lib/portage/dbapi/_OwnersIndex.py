@@ -0,0 +1,387 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import heapq
+import mmap
+import stat
+import sys
+import tempfile
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.const import CACHE_PATH
+from portage.exception import InvalidData
+from portage.util import apply_secpass_permissions, atomic_ofstream, \
+	ensure_dirs, writemsg
+from portage.versions import _pkg_str, catsplit, pkgsplit
+
+if sys.hexversion >= 0x3000000:
+	# pylint: disable=W0622
+	long = int
+
+class OwnersIndex(object):
+	"""
+	A persistent inverted index which maps installed files to the
+	packages that own them. The index is a sorted file that is memory
+	mapped and searched with a binary search, so that a lookup costs
+	O(log n) and memory usage is bounded, regardless of the number of
+	installed files.
+
+	The file consists of a header, which records the COUNTER and
+	directory mtime of each indexed package (and the mtime of each
+	category directory), followed by a blank line and sorted entries of
+	the form "p<path>\\0<cpv>" and "b<basename>\\0<cpv>". Paths are
+	relative to ROOT (with a leading slash), like the paths that are
+	passed to vardbapi._owners.iter_owners().
+
+	When packages are merged or unmerged, the index is updated by a
+	streaming merge of the existing entries with the entries of the
+	changed packages, so that only the CONTENTS of changed packages
+	have to be read, and the index is written once per update.
+	"""
+
+	_magic = b"PORTAGE_OWNERS_INDEX 1"
+
+	# Maximum number of packages to read into memory at once. The
+	# sorted entries of each batch are stored in a temporary file if
+	# there are more batches, in order to bound memory usage.
+	_update_batch_size = 100
+
+	def __init__(self, vardb):
+		self._vardb = vardb
+		self._filename = os.path.join(vardb._eroot,
+			CACHE_PATH, "vdb_owners_index")
+		self._data = None
+		self._entries_start = None
+		self._categories = None
+		self._packages = None
+
+	@property
+	def filename(self):
+		return self._filename
+
+	def clear(self):
+		"""
+		Close the index, so that it will be loaded again the next time
+		that it is accessed.
+		"""
+		if self._data is not None:
+			self._data.close()
+		self._data = None
+		self._entries_start = None
+		self._categories = None
+		self._packages = None
+
+	@staticmethod
+	def _stat_mtime(st):
+		try:
+			return st.st_mtime_ns
+		except AttributeError:
+			return long(st.st_mtime * 1000000000)
+
+	@staticmethod
+	def _encode(s):
+		return _unicode_encode(s,
+			encoding=_encodings['repo.content'], errors='backslashreplace')
+
+	def _load(self):
+		self.clear()
+		self._categories = {}
+		self._packages = {}
+		try:
+			f = open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE, errno.EACCES):
+				writemsg("!!! Error loading '%s': %s\n" %
+					(self._filename, e), noiselevel=-1)
+			return False
+		try:
+			try:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (EnvironmentError, ValueError):
+				return False
+		finally:
+			f.close()
+
+		try:
+			self._entries_start = self._parse_header(data)
+		except (InvalidData, ValueError, UnicodeDecodeError) as e:
+			data.close()
+			self._categories = {}
+			self._packages = {}
+			writemsg("!!! Error loading '%s': %s\n" %
+				(self._filename, e), noiselevel=-1)
+			return False
+
+		self._data = data
+		return True
+
+	def _parse_header(self, data):
+		end = data.find(b"\n")
+		if end == -1 or data[:end] != self._magic:
+			raise InvalidData("unrecognized format")
+		offset = end + 1
+		while True:
+			end = data.find(b"\n", offset)
+			if end == -1:
+				raise InvalidData("truncated")
+			line = data[offset:end]
+			offset = end + 1
+			if not line:
+				break
+			fields = _unicode_decode(line,
+				encoding=_encodings['repo.content'], errors='strict').split()
+			if fields[0] == "c" and len(fields) == 3:
+				self._categories[fields[1]] = long(fields[2])
+			elif fields[0] == "k" and len(fields) == 4:
+				self._packages[fields[1]] = (long(fields[2]), long(fields[3]))
+			else:
+				raise InvalidData("invalid header line")
+		return offset
+
+	def _pkg_state(self, cpv, pkg_dir=None):
+		vardb = self._vardb
+		if pkg_dir is None:
+			pkg_dir = vardb.getpath(cpv)
+		try:
+			st = os.stat(pkg_dir)
+			counter = long(vardb.aux_get(cpv, ["COUNTER"])[0])
+		except (KeyError, OSError, ValueError):
+			return None
+		if not stat.S_ISDIR(st.st_mode):
+			return None
+		return (counter, self._stat_mtime(st))
+
+	def _scan(self):
+		"""
+		Compare the index header with the vdb. Packages are only
+		checked individually if the mtime of their category directory
+		has changed since the index was written.
+
+		@rtype: tuple
+		@return: (categories, packages, stale) where categories and
+			packages describe the current vdb state, and stale is a set
+			of cpvs that need to be removed from or added to the index
+		"""
+		vardb = self._vardb
+		categories = {}
+		packages = {}
+		stale = set()
+
+		indexed_by_cat = {}
+		for cpv in self._packages:
+			indexed_by_cat.setdefault(catsplit(cpv)[0], []).append(cpv)
+
+		try:
+			cat_list = os.listdir(vardb._dbroot)
+		except OSError:
+			cat_list = []
+
+		for category in cat_list:
+			if vardb._excluded_dirs.match(category) is not None or \
+				vardb._category_re.match(category) is None:
+				continue
+			cat_dir = vardb.getpath(category)
+			try:
+				st = os.stat(cat_dir)
+			except OSError:
+				continue
+			if not stat.S_ISDIR(st.st_mode):
+				continue
+			mtime = self._stat_mtime(st)
+			categories[category] = mtime
+			indexed = indexed_by_cat.pop(category, [])
+			if self._categories.get(category) == mtime:
+				for cpv in indexed:
+					packages[cpv] = self._packages[cpv]
+				continue
+
+			current = set()
+			try:
+				pf_list = os.listdir(cat_dir)
+			except OSError:
+				pf_list = []
+			for pf in pf_list:
+				if vardb._excluded_dirs.match(pf) is not None or \
+					not pkgsplit(pf):
+					continue
+				try:
+					cpv = _pkg_str(category + "/" + pf, db=vardb)
+				except InvalidData:
+					continue
+				state = self._pkg_state(cpv, os.path.join(cat_dir, pf))
+				if state is None:
+					continue
+				current.add(cpv)
+				packages[cpv] = state
+				if self._packages.get(cpv) != state:
+					stale.add(cpv)
+			stale.update(cpv for cpv in indexed if cpv not in current)
+
+		for indexed in indexed_by_cat.values():
+			stale.update(indexed)
+
+		return categories, packages, stale
+
+	def valid(self):
+		"""
+		Load the index and check whether it is consistent with the vdb.
+		"""
+		if not self._load():
+			return False
+		return not self._scan()[2]
+
+	def update(self):
+		"""
+		Bring the index up to date with the vdb, reading only the
+		CONTENTS of packages that have changed since the index was
+		written. The new index is written atomically, and a concurrent
+		modification of the vdb only causes it to become stale again, so
+		the vdb lock is not required.
+
+		@rtype: bool
+		@return: True if the index is up to date, False otherwise
+		"""
+		self._load()
+		categories, packages, stale = self._scan()
+		if not stale and self._data is not None:
+			return True
+
+		# Packages which remain unchanged in the index.
+		indexed = dict((cpv, state) for cpv, state in self._packages.items()
+			if cpv not in stale)
+		indexed.update((cpv, packages[cpv]) for cpv in stale
+			if cpv in packages)
+		stale = sorted(stale)
+		batch_size = self._update_batch_size
+		runs = []
+		try:
+			try:
+				for i in range(0, len(stale), batch_size):
+					entries = set()
+					for cpv in stale[i:i + batch_size]:
+						if cpv in packages:
+							entries.update(self._iter_pkg_entries(cpv))
+					entries = sorted(entries)
+					if len(stale) > batch_size:
+						run = tempfile.TemporaryFile()
+						run.writelines(entries)
+						run.seek(0)
+						entries = run
+					runs.append(entries)
+
+				exclude = frozenset(self._encode(cpv) for cpv in stale)
+				self._write(categories, indexed, heapq.merge(
+					self._iter_entries(exclude), *runs))
+			finally:
+				for run in runs:
+					if not isinstance(run, list):
+						run.close()
+		except EnvironmentError:
+			# The index remains stale, and it will not be used.
+			self.clear()
+			return False
+		return self._load()
+
+	def _iter_pkg_entries(self, cpv):
+		root = self._vardb.settings["ROOT"]
+		root_len = len(root) - 1
+		contents = self._vardb._dblink(cpv).getcontents()
+		cpv = self._encode(cpv)
+		for path in contents:
+			path = path[root_len:]
+			name = os.path.basename(path.rstrip(os.sep))
+			yield b"p" + self._encode(path) + b"\0" + cpv + b"\n"
+			if name:
+				yield b"b" + self._encode(name) + b"\0" + cpv + b"\n"
+
+	def _iter_entries(self, exclude):
+		"""
+		Generate the existing entries, except for those of packages
+		with an encoded cpv in exclude.
+		"""
+		data = self._data
+		if data is None:
+			return
+		offset = self._entries_start
+		end = len(data)
+		while offset < end:
+			line_end = data.find(b"\n", offset)
+			if line_end == -1:
+				break
+			line = data[offset:line_end + 1]
+			offset = line_end + 1
+			if line[line.index(b"\0") + 1:-1] not in exclude:
+				yield line
+
+	def _write(self, categories, packages, entries):
+		ensure_dirs(os.path.dirname(self._filename))
+		f = atomic_ofstream(self._filename, mode='wb')
+		try:
+			f.write(self._magic + b"\n")
+			for category, mtime in sorted(categories.items()):
+				f.write(self._encode("c %s %s\n" % (category, mtime)))
+			for cpv, (counter, mtime) in sorted(packages.items()):
+				f.write(self._encode("k %s %s %s\n" % (cpv, counter, mtime)))
+			f.write(b"\n")
+			previous = None
+			for line in entries:
+				if line != previous:
+					f.write(line)
+				previous = line
+		except EnvironmentError:
+			f.abort()
+			raise
+		f.close()
+		apply_secpass_permissions(self._filename, mode=0o644)
+
+	def _search(self, prefix):
+		"""
+		Return the cpvs of all entries that start with the given prefix,
+		using a binary search.
+		"""
+		data = self._data
+		lo = self._entries_start
+		hi = len(data)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			line_start = data.rfind(b"\n", lo, mid) + 1 or lo
+			line_end = data.find(b"\n", line_start, hi)
+			if line_end == -1:
+				line_end = hi
+			if data[line_start:line_end + 1] < prefix:
+				lo = line_end + 1
+			else:
+				hi = line_start
+
+		results = []
+		end = len(data)
+		prefix_len = len(prefix)
+		while lo < end and data[lo:lo + prefix_len] == prefix:
+			line_end = data.find(b"\n", lo)
+			if line_end == -1:
+				line_end = end
+			cpv = _unicode_decode(data[lo + prefix_len:line_end],
+				encoding=_encodings['repo.content'], errors='strict')
+			# Entries of packages which are missing from the header may
+			# remain if an update was interrupted.
+			if cpv in self._packages:
+				results.append(cpv)
+			lo = line_end + 1
+		return results
+
+	def find_path(self, path):
+		"""
+		Return the cpvs of packages which have the given path (relative
+		to ROOT, with a leading slash) in their CONTENTS.
+		"""
+		return self._search(b"p" + self._encode(path) + b"\0")
+
+	def find_basename(self, name):
+		"""
+		Return the cpvs of packages which have a file with the given
+		basename in their CONTENTS.
+		"""
+		return self._search(b"b" + self._encode(name) + b"\0")
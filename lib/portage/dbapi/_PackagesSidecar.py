@@ -0,0 +1,384 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import mmap
+import struct
+import sys
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.cache.mappings import MutableMapping
+from portage.exception import InvalidData
+from portage.util import atomic_ofstream, writemsg
+from portage.versions import catpkgsplit
+
+class PackagesSidecar(object):
+	"""
+	A compact binary sidecar index for a Packages file, which makes it
+	possible to use a large Packages file without parsing all of it.
+	The sidecar holds the byte offsets of all package entries, grouped
+	by cp, and the values of the keys which are needed in order to
+	inject packages into bindbapi in columnar form. Other metadata
+	is parsed from the memory mapped Packages file when an entry is
+	first accessed, one entry at a time.
+
+	The sidecar is stored next to the Packages file as Packages.idx,
+	and it is valid as long as the TIMESTAMP header of the Packages
+	file and the size of its body do not change, so the header may be
+	rewritten (for example with a new DOWNLOAD_TIMESTAMP) without
+	invalidating the sidecar. When it is invalid, the Packages file is
+	parsed as usual and a new sidecar is written.
+
+	The file format (all integers little endian) is:
+
+		header:   magic, version, body size, key count, cp count,
+		          entry count, (u16 length, TIMESTAMP)
+		keys:     (u16 length, name) for each column
+		cps:      (u16 length, cp, u32 first, u32 count) for each cp
+		cp index: u32 entry index for each entry, grouped by cp
+		offsets:  u64 body offset for each entry
+		lengths:  u32 length for each entry
+		columns:  (u32 length, values) for each column, where the
+		          values of all entries are joined with newlines
+		          (which Packages values cannot contain), and a NUL
+		          character means that the key is missing
+	"""
+
+	_magic = b"PORTPKGI"
+	_format_version = 1
+
+	_header = struct.Struct("<8sIQIII")
+	_cp = struct.Struct("<II")
+	_length = struct.Struct("<I")
+	_name_len = struct.Struct("<H")
+	_missing = "\0"
+
+	# Keys which are needed in order to create _pkg_str instances
+	# and inject packages into bindbapi.
+	columns = ("CPV", "BUILD_ID", "BUILD_TIME", "EAPI", "SIZE", "SLOT",
+		"_mtime_", "repository")
+
+	def __init__(self, pkgindex_file):
+		self._pkgindex_file = pkgindex_file
+		self._filename = pkgindex_file + ".idx"
+
+	@property
+	def filename(self):
+		return self._filename
+
+	def packages(self, pkgindex, cp=None):
+		"""
+		Return a list of package entries from the Packages file, in
+		the same order as PackageIndex.readBody. The header must have
+		been read into pkgindex already, since it supplies inherited
+		values for the entries.
+
+		@param pkgindex: PackageIndex which holds the header
+		@type pkgindex: PackageIndex
+		@param cp: only return entries for this cp
+		@type cp: str
+		@rtype: list
+		"""
+		try:
+			f = open(_unicode_encode(self._pkgindex_file,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise
+			return []
+
+		with f:
+			while f.readline().rstrip(b"\n"):
+				pass
+			body_offset = f.tell()
+			body_size = os.fstat(f.fileno()).st_size - body_offset
+			if not body_size:
+				return []
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		timestamp = pkgindex.header.get("TIMESTAMP", "")
+		sidecar = self._load(timestamp, body_size)
+		if sidecar is None:
+			entries, records, cp_map = self._scan(pkgindex, data,
+				body_offset)
+			data.close()
+			self._write(timestamp, body_size, entries, records, cp_map)
+			if cp is not None:
+				entries = [entries[i] for i in cp_map.get(cp, ())]
+			return entries
+
+		records, cp_map, columns = sidecar
+		if cp is None:
+			indices = range(len(records))
+		else:
+			indices = cp_map.get(cp, ())
+		source = _PackagesSource(pkgindex, data, body_offset, records,
+			columns)
+		return [_LazyPackageEntry(source, i) for i in indices]
+
+	def _scan(self, pkgindex, data, body_offset):
+		"""
+		Parse the body of the Packages file, and return the entries
+		together with their (offset, length) records and a dict which
+		maps each cp to a list of entry indices.
+		"""
+		entries = []
+		records = []
+		cp_map = {}
+		pos = body_offset
+		while pos < len(data):
+			# Entries are terminated by an empty line.
+			end = data.find(b"\n\n", pos)
+			if end == -1:
+				end = len(data)
+			else:
+				end += 2
+			d = pkgindex._readpkgindex(_unicode_decode(data[pos:end],
+				encoding=_encodings['repo.content'],
+				errors='replace').split("\n"))
+			if not d:
+				break
+			start = pos
+			pos = end
+			if not d.get("CPV"):
+				continue
+			pkgindex._apply_pkg_defaults(d)
+			split = catpkgsplit(d["CPV"])
+			if split is not None:
+				cp_map.setdefault(split[0] + "/" + split[1],
+					[]).append(len(entries))
+			entries.append(d)
+			records.append((start - body_offset, end - start))
+		return entries, records, cp_map
+
+	def _load(self, timestamp, body_size):
+		"""
+		Return (records, cp_map, columns) from the sidecar, or None if
+		it does not exist or does not match the Packages file.
+		"""
+		try:
+			with open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				data = f.read()
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE, errno.EACCES):
+				writemsg("!!! Error loading '%s': %s\n" %
+					(self._filename, e), noiselevel=-1)
+			return None
+
+		try:
+			return self._parse(data, timestamp, body_size)
+		except (struct.error, InvalidData, UnicodeDecodeError):
+			return None
+
+	def _parse(self, data, timestamp, body_size):
+		magic, version, size, key_count, cp_count, entry_count = \
+			self._header.unpack_from(data, 0)
+		if magic != self._magic or version != self._format_version:
+			raise InvalidData("unrecognized format")
+		offset = self._header.size
+
+		def read_name(offset):
+			length, = self._name_len.unpack_from(data, offset)
+			offset += self._name_len.size
+			name = _unicode_decode(data[offset:offset + length],
+				encoding=_encodings['repo.content'], errors='strict')
+			return name, offset + length
+
+		sidecar_timestamp, offset = read_name(offset)
+		if size != body_size or sidecar_timestamp != timestamp:
+			return None
+
+		keys = []
+		for i in range(key_count):
+			name, offset = read_name(offset)
+			keys.append(name)
+
+		cp_list = []
+		for i in range(cp_count):
+			name, offset = read_name(offset)
+			first, count = self._cp.unpack_from(data, offset)
+			offset += self._cp.size
+			cp_list.append((name, first, count))
+
+		cp_index = struct.unpack_from("<%dI" % entry_count, data, offset)
+		offset += 4 * entry_count
+		cp_map = {}
+		for name, first, count in cp_list:
+			if first + count > entry_count:
+				raise InvalidData("truncated")
+			cp_map[name] = cp_index[first:first + count]
+
+		offsets = struct.unpack_from("<%dQ" % entry_count, data, offset)
+		offset += 8 * entry_count
+		lengths = struct.unpack_from("<%dI" % entry_count, data, offset)
+		offset += 4 * entry_count
+		records = list(zip(offsets, lengths))
+		for record_offset, length in records:
+			if record_offset + length > body_size:
+				raise InvalidData("truncated")
+
+		columns = {}
+		for k in keys:
+			length, = self._length.unpack_from(data, offset)
+			offset += self._length.size
+			if offset + length > len(data):
+				raise InvalidData("truncated")
+			values = _unicode_decode(data[offset:offset + length],
+				encoding=_encodings['repo.content'],
+				errors='strict').split("\n")
+			offset += length
+			if len(values) != entry_count:
+				raise InvalidData("truncated")
+			columns[k] = [None if v == self._missing else v
+				for v in values]
+
+		return records, cp_map, columns
+
+	def _write(self, timestamp, body_size, entries, records, cp_map):
+
+		def name(s):
+			s = _unicode_encode(s,
+				encoding=_encodings['repo.content'], errors='strict')
+			return self._name_len.pack(len(s)) + s
+
+		buf = [self._header.pack(self._magic, self._format_version,
+			body_size, len(self.columns), len(cp_map), len(entries)),
+			name(timestamp)]
+		buf.extend(name(k) for k in self.columns)
+
+		cp_index = []
+		for cp in sorted(cp_map):
+			indices = cp_map[cp]
+			buf.append(name(cp))
+			buf.append(self._cp.pack(len(cp_index), len(indices)))
+			cp_index.extend(indices)
+		# Entries with an invalid CPV are not listed under any cp.
+		cp_index.extend([0] * (len(entries) - len(cp_index)))
+		buf.append(struct.pack("<%dI" % len(cp_index), *cp_index))
+		buf.append(struct.pack("<%dQ" % len(records),
+			*[record[0] for record in records]))
+		buf.append(struct.pack("<%dI" % len(records),
+			*[record[1] for record in records]))
+
+		for k in self.columns:
+			values = []
+			for d in entries:
+				v = d.get(k)
+				values.append(self._missing if v is None else v)
+			values = _unicode_encode("\n".join(values),
+				encoding=_encodings['repo.content'], errors='strict')
+			buf.append(self._length.pack(len(values)))
+			buf.append(values)
+
+		try:
+			f = atomic_ofstream(self._filename, mode='wb')
+		except EnvironmentError:
+			# The current user doesn't have permission to write
+			# the sidecar, but that's alright.
+			return
+		try:
+			f.write(b"".join(buf))
+		except EnvironmentError:
+			f.abort()
+		else:
+			f.close()
+
+class _PackagesSource(object):
+	"""
+	Holds the sidecar columns, and parses individual entries from a
+	memory mapped Packages file.
+	"""
+
+	__slots__ = ("columns", "_pkgindex", "_data", "_body_offset",
+		"_records")
+
+	def __init__(self, pkgindex, data, body_offset, records, columns):
+		self.columns = columns
+		self._pkgindex = pkgindex
+		self._data = data
+		self._body_offset = body_offset
+		self._records = records
+
+	def read(self, index):
+		offset, length = self._records[index]
+		offset += self._body_offset
+		d = self._pkgindex._readpkgindex(_unicode_decode(
+			self._data[offset:offset + length],
+			encoding=_encodings['repo.content'],
+			errors='replace').split("\n"))
+		self._pkgindex._apply_pkg_defaults(d)
+		return d
+
+class _LazyPackageEntry(MutableMapping):
+	"""
+	A package entry which takes the sidecar columns from the source,
+	and parses the remaining metadata from the Packages file when it
+	is needed. Values which are assigned before that take precedence
+	over the parsed values.
+	"""
+
+	__slots__ = ("_d", "_source", "_index")
+
+	def __init__(self, source, index):
+		self._d = {}
+		self._source = source
+		self._index = index
+
+	def _pull(self):
+		if self._source is not None:
+			d = dict(self._source.read(self._index).items())
+			d.update(self._d)
+			self._d = d
+			self._source = None
+
+	def __getitem__(self, key):
+		try:
+			return self._d[key]
+		except KeyError:
+			if self._source is None:
+				raise
+		values = self._source.columns.get(key)
+		if values is not None:
+			# Columns are complete, so there is no need to parse
+			# the entry if the key is missing.
+			v = values[self._index]
+			if v is None:
+				raise KeyError(key)
+			return v
+		self._pull()
+		return self._d[key]
+
+	def __setitem__(self, key, value):
+		self._d[key] = value
+
+	def __delitem__(self, key):
+		self._pull()
+		del self._d[key]
+
+	def __contains__(self, key):
+		if key in self._d:
+			return True
+		if self._source is None:
+			return False
+		values = self._source.columns.get(key)
+		if values is not None:
+			return values[self._index] is not None
+		self._pull()
+		return key in self._d
+
+	def __iter__(self):
+		self._pull()
+		return iter(self._d)
+
+	def __len__(self):
+		self._pull()
+		return len(self._d)
+
+	def copy(self):
+		self._pull()
+		return self._d.copy()
+
+	if sys.hexversion >= 0x3000000:
+		keys = __iter__
@@ -0,0 +1,430 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import mmap
+import re
+import stat
+import struct
+import sys
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.const import CACHE_PATH
+from portage.exception import InvalidData
+from portage.util import apply_secpass_permissions, atomic_ofstream, \
+	ensure_dirs, writemsg
+from portage.versions import _pkg_str, catsplit, pkgsplit
+
+if sys.hexversion >= 0x3000000:
+	# pylint: disable=W0622
+	long = int
+
+class VdbIndex(object):
+	"""
+	A compact binary index of installed package metadata, which holds
+	every metadata key that is stored in the vdb (except for CONTENTS
+	and environment.bz2), so that vardbapi.cp_list() and aux_get() do
+	not have to open any files in /var/db/pkg. The index is stored in
+	a single file which is memory mapped, and values are only decoded
+	when they are requested.
+
+	Entries are validated per category, using the mtime of the category
+	directory, which is bumped by vardbapi._bump_mtime() for every
+	modification. This costs one stat call per lookup, but the category
+	directories are few and their inodes stay cached, unlike the package
+	directories. When a category is merged or unmerged, only that
+	category is read from the vdb again, and all other entries are
+	copied from the existing index as raw bytes.
+
+	The package directory mtime is stored for the _mtime_ key, which
+	FakeVartree uses to validate its own package instances.
+
+	The file format (all numbers little endian) is:
+
+		header:     magic, version, key count, category count,
+		            package count
+		keys:       (u16 length, name) for each key
+		categories: (u16 length, name, s64 mtime_ns, u32 first package,
+		            u32 package count) for each category
+		packages:   (u16 length, PF, u64 data offset, u32 data length,
+		            f64 package directory mtime) for each package,
+		            grouped by category
+		data:       (u16 key index, u32 length, value) for each key of
+		            each package
+	"""
+
+	_magic = b"PORTVDBI"
+	_format_version = 2
+
+	_header = struct.Struct("<8sIIII")
+	_category = struct.Struct("<qII")
+	_package = struct.Struct("<QId")
+	_item = struct.Struct("<HI")
+	_name_len = struct.Struct("<H")
+
+	# Metadata files which are not included in the index.
+	_excluded_keys = frozenset(["CONTENTS"])
+	_key_re = re.compile(r'^([A-Z][A-Z0-9_]*(\.[A-Z0-9_.]+)?|repository)$')
+
+	def __init__(self, vardb):
+		self._vardb = vardb
+		self._filename = os.path.join(vardb._eroot,
+			CACHE_PATH, "vdb_index")
+		self._loaded = False
+		self._data = None
+		self._keys = None
+		self._categories = None
+		self._file_id = None
+
+	def clear(self):
+		"""
+		Reload the index the next time that it is accessed (it may
+		have been updated by another process).
+		"""
+		if self._data is not None:
+			self._data.close()
+		self._loaded = False
+		self._data = None
+		self._keys = None
+		self._categories = None
+		self._file_id = None
+
+	@staticmethod
+	def _stat_mtime(st):
+		try:
+			return st.st_mtime_ns
+		except AttributeError:
+			return long(st.st_mtime * 1000000000)
+
+	def _category_mtime(self, category):
+		try:
+			return self._stat_mtime(os.stat(self._vardb.getpath(category)))
+		except OSError:
+			return -1
+
+	def _get_file_id(self):
+		try:
+			st = os.stat(self._filename)
+		except OSError:
+			return None
+		return (st.st_dev, st.st_ino, self._stat_mtime(st))
+
+	def _load(self):
+		self._loaded = True
+		self._keys = []
+		self._categories = {}
+		self._file_id = self._get_file_id()
+		try:
+			f = open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE, errno.EACCES):
+				writemsg("!!! Error loading '%s': %s\n" %
+					(self._filename, e), noiselevel=-1)
+			return
+		try:
+			try:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (EnvironmentError, ValueError):
+				# Empty file or mmap is unsupported.
+				return
+		finally:
+			f.close()
+
+		try:
+			keys, categories = self._parse(data)
+		except (struct.error, InvalidData, UnicodeDecodeError) as e:
+			data.close()
+			writemsg("!!! Error loading '%s': %s\n" %
+				(self._filename, e), noiselevel=-1)
+			return
+
+		self._data = data
+		self._keys = keys
+		self._categories = categories
+
+	def _parse(self, data):
+		magic, version, key_count, cat_count, pkg_count = \
+			self._header.unpack_from(data, 0)
+		if magic != self._magic or version != self._format_version:
+			raise InvalidData("unrecognized format")
+		offset = self._header.size
+
+		def read_name(offset):
+			length, = self._name_len.unpack_from(data, offset)
+			offset += self._name_len.size
+			name = _unicode_decode(data[offset:offset + length],
+				encoding=_encodings['repo.content'], errors='strict')
+			return name, offset + length
+
+		keys = []
+		for i in range(key_count):
+			name, offset = read_name(offset)
+			keys.append(name)
+
+		cat_list = []
+		for i in range(cat_count):
+			name, offset = read_name(offset)
+			mtime, first, count = self._category.unpack_from(data, offset)
+			offset += self._category.size
+			cat_list.append((name, mtime, first, count))
+
+		packages = []
+		for i in range(pkg_count):
+			name, offset = read_name(offset)
+			data_offset, data_len, mtime = \
+				self._package.unpack_from(data, offset)
+			offset += self._package.size
+			if data_offset + data_len > len(data):
+				raise InvalidData("truncated")
+			packages.append((name, (data_offset, data_len, mtime)))
+
+		categories = {}
+		for name, mtime, first, count in cat_list:
+			if first + count > pkg_count:
+				raise InvalidData("truncated")
+			categories[name] = (mtime, dict(packages[first:first + count]))
+
+		return keys, categories
+
+	def _valid_category(self, category, mtime=None):
+		if not self._loaded:
+			self._load()
+		if mtime is None:
+			mtime = self._category_mtime(category)
+		cat_data = self._categories.get(category)
+		if cat_data is None or cat_data[0] != mtime:
+			if self._file_id == self._get_file_id():
+				return None
+			# The index has been updated by another process.
+			self.clear()
+			self._load()
+			cat_data = self._categories.get(category)
+			if cat_data is None or cat_data[0] != mtime:
+				return None
+		return cat_data[1]
+
+	def category_pfs(self, category):
+		"""
+		Return a list of PF for the packages that are installed in the
+		given category, or None if the index is not valid for this
+		category.
+		"""
+		pkgs = self._valid_category(category)
+		if pkgs is None:
+			return None
+		return list(pkgs)
+
+	def _decode_record(self, offset, length):
+		data = self._data
+		keys = self._keys
+		end = offset + length
+		metadata = {}
+		while offset < end:
+			key_index, value_len = self._item.unpack_from(data, offset)
+			offset += self._item.size
+			metadata[keys[key_index]] = _unicode_decode(
+				data[offset:offset + value_len],
+				encoding=_encodings['repo.content'], errors='replace')
+			offset += value_len
+		return metadata
+
+	def get(self, cpv, wants):
+		"""
+		Return a dict containing all indexed metadata for the given
+		cpv, or None if the index is not valid for the category, or
+		if it does not contain all of the wanted keys.
+		"""
+		category, pf = catsplit(cpv)
+		pkgs = self._valid_category(category)
+		if pkgs is None:
+			return None
+		pkg = pkgs.get(pf)
+		if pkg is None:
+			return None
+		offset, length, mtime = pkg
+		metadata = self._decode_record(offset, length)
+		metadata["_mtime_"] = mtime
+		vardb = self._vardb
+		for k in wants:
+			if k not in metadata:
+				if k in vardb._aux_cache_keys or \
+					vardb._aux_cache_keys_re.match(k) is not None:
+					metadata[k] = ''
+				else:
+					# Fall back to vardbapi._aux_env_search().
+					return None
+		return metadata
+
+	def stale_categories(self):
+		"""
+		Return the set of categories that need to be indexed again,
+		including categories that no longer exist.
+		"""
+		if not self._loaded:
+			self._load()
+		vardb = self._vardb
+		try:
+			disk_categories = [x for x in os.listdir(vardb._dbroot)
+				if vardb._excluded_dirs.match(x) is None and
+				vardb._category_re.match(x) is not None and
+				os.path.isdir(vardb.getpath(x))]
+		except OSError:
+			disk_categories = []
+		stale = set(self._categories).difference(disk_categories)
+		for category in disk_categories:
+			if self._valid_category(category) is None:
+				stale.add(category)
+		return stale
+
+	def _read_category(self, category, key_map, keys):
+		"""
+		Read all packages of a category from the vdb, and return the
+		category mtime (as observed before reading) together with a
+		list of (pf, data, mtime) tuples.
+		"""
+		vardb = self._vardb
+		cat_dir = vardb.getpath(category)
+		try:
+			mtime = self._stat_mtime(os.stat(cat_dir))
+			dir_list = os.listdir(cat_dir)
+		except OSError:
+			return None, []
+
+		packages = []
+		for pf in sorted(dir_list):
+			if vardb._excluded_dirs.match(pf) is not None or \
+				not pkgsplit(pf):
+				continue
+			try:
+				cpv = _pkg_str(category + "/" + pf, db=vardb)
+			except InvalidData:
+				continue
+			pkg_dir = vardb.getpath(cpv)
+			try:
+				st = os.stat(pkg_dir)
+				if not stat.S_ISDIR(st.st_mode):
+					continue
+				pkg_keys = set(x for x in os.listdir(pkg_dir)
+					if x not in self._excluded_keys and
+					self._key_re.match(x) is not None)
+			except OSError:
+				continue
+			pkg_keys.update(vardb._aux_cache_keys)
+			try:
+				metadata = vardb._aux_get(cpv, sorted(pkg_keys), st=st)
+			except KeyError:
+				continue
+
+			record = []
+			for k in sorted(metadata):
+				key_index = key_map.get(k)
+				if key_index is None:
+					key_index = len(keys)
+					keys.append(k)
+					key_map[k] = key_index
+				value = _unicode_encode(metadata[k],
+					encoding=_encodings['repo.content'], errors='strict')
+				record.append(self._item.pack(key_index, len(value)))
+				record.append(value)
+			packages.append((pf, b"".join(record), st.st_mtime))
+
+		return mtime, packages
+
+	def update(self, categories=None):
+		"""
+		Index the given categories again (or all stale categories if
+		categories is None), and write a new index file. Entries for
+		other categories are copied from the existing index without
+		being decoded, but the whole file is written again, so the
+		cost grows with the size of the index. The caller should hold
+		the vdb lock.
+		"""
+		if categories is None:
+			categories = self.stale_categories()
+		elif not self._loaded:
+			self._load()
+		categories = set(categories)
+		if not categories:
+			return
+
+		keys = list(self._keys)
+		key_map = dict((k, i) for i, k in enumerate(keys))
+		old_data = self._data
+
+		cat_entries = {}
+		for category, (mtime, pkgs) in self._categories.items():
+			if category in categories:
+				continue
+			cat_entries[category] = (mtime,
+				[(pf, old_data[offset:offset + length], pkg_mtime)
+				for pf, (offset, length, pkg_mtime) in sorted(pkgs.items())])
+
+		for category in categories:
+			mtime, packages = self._read_category(category, key_map, keys)
+			if mtime is not None and packages:
+				cat_entries[category] = (mtime, packages)
+
+		try:
+			self._write(keys, cat_entries)
+		except EnvironmentError:
+			# The index remains stale, and it will
+			# be ignored for the affected categories.
+			pass
+		self.clear()
+
+	def _write(self, keys, cat_entries):
+
+		def name(s):
+			s = _unicode_encode(s,
+				encoding=_encodings['repo.content'], errors='strict')
+			return self._name_len.pack(len(s)) + s
+
+		pkg_count = sum(len(packages)
+			for mtime, packages in cat_entries.values())
+		head = [None, b"".join(name(k) for k in keys)]
+
+		pkg_index = 0
+		cat_table = []
+		for category in sorted(cat_entries):
+			mtime, packages = cat_entries[category]
+			cat_table.append(name(category))
+			cat_table.append(self._category.pack(mtime, pkg_index,
+				len(packages)))
+			pkg_index += len(packages)
+		head.append(b"".join(cat_table))
+
+		pkg_names = [name(pf) for category in sorted(cat_entries)
+			for pf, record, mtime in cat_entries[category][1]]
+		data_offset = self._header.size + len(head[1]) + \
+			len(head[2]) + sum(len(x) for x in pkg_names) + \
+			pkg_count * self._package.size
+
+		pkg_table = []
+		records = []
+		i = 0
+		for category in sorted(cat_entries):
+			for pf, record, mtime in cat_entries[category][1]:
+				pkg_table.append(pkg_names[i])
+				pkg_table.append(self._package.pack(data_offset,
+					len(record), mtime))
+				records.append(record)
+				data_offset += len(record)
+				i += 1
+
+		head[0] = self._header.pack(self._magic, self._format_version,
+			len(keys), len(cat_entries), pkg_count)
+
+		ensure_dirs(os.path.dirname(self._filename))
+		f = atomic_ofstream(self._filename, mode='wb')
+		try:
+			f.write(b"".join(head))
+			f.write(b"".join(pkg_table))
+			for record in records:
+				f.write(record)
+		except EnvironmentError:
+			f.abort()
+			raise
+		f.close()
+		apply_secpass_permissions(self._filename, mode=0o644)
@@ -10,6 +10,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum:get_valid_checksum_keys,perform_multiple_checksums,' + \
 		'verify_all,_apply_hash_filter,_hash_filter',
 	'portage.dbapi.dep_expand:dep_expand',
+	'portage.dbapi._PackagesSidecar:PackagesSidecar',
 	'portage.dep:dep_getkey,isjustname,isvalidatom,match_from_list',
 	'portage.output:EOutput,colorize',
 	'portage.locks:lockfile,unlockfile',
@@ -18,6 +19,8 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.util:atomic_ofstream,ensure_dirs,normalize_path,' + \
 		'writemsg,writemsg_stdout',
 	'portage.util.path:first_existing',
+	'portage.util._async.map_concurrent:map_concurrent',
+	'portage.util._DigestCache:get_digest_cache',
 	'portage.util._urlopen:urlopen@_urlopen,have_pep_476@_have_pep_476',
 	'portage.versions:best,catpkgsplit,catsplit,_pkg_str',
 )
@@ -39,6 +42,7 @@ from portage import _unicode_encode
 import codecs
 import errno
 import io
+import shutil
 import stat
 import subprocess
 import sys
@@ -67,6 +71,15 @@ class UseCachedCopyOfRemoteIndex(Exception):
 	# then fetching the remote index can be skipped.
 	pass
 
+class _RemoteIndexResponse(io.BytesIO):
+	"""
+	A remote index which has been read into memory, together with the
+	headers of the response.
+	"""
+	def __init__(self, body, headers):
+		io.BytesIO.__init__(self, body)
+		self.headers = headers
+
 class bindbapi(fakedbapi):
 	_known_keys = frozenset(list(fakedbapi._known_keys) + \
 		["CHOST", "repository", "USE"])
@@ -263,6 +276,11 @@ class bindbapi(fakedbapi):
 
 class binarytree(object):
 	"this tree scans for a list of all packages available in PKGDIR"
+
+	# With FEATURES=binpkg-index-journal, the journal is compacted into
+	# the Packages file when it exceeds this fraction of its size.
+	_pkgindex_journal_ratio = 0.1
+
 	def __init__(self, _unused=DeprecationWarning, pkgdir=None,
 		virtual=DeprecationWarning, settings=None):
 
@@ -310,6 +328,7 @@ class binarytree(object):
 			self._pkgindex_version = 0
 			self._pkgindex_hashes = ["MD5","SHA1"]
 			self._pkgindex_file = os.path.join(self.pkgdir, "Packages")
+			self._pkgindex_journal_file = self._pkgindex_file + ".journal"
 			self._pkgindex_keys = self.dbapi._aux_cache_keys.copy()
 			self._pkgindex_keys.update(["CPV", "SIZE"])
 			self._pkgindex_aux_keys = \
@@ -600,13 +619,19 @@ class binarytree(object):
 				basename = os.path.basename(path)
 				basename_index.setdefault(basename, []).append(d)
 
-			update_pkgindex = False
+			# Stat all packages first, so that the xpak metadata of the
+			# packages which are missing from the index, or which have
+			# changed, can be read in a batch with readahead.
+			pkgdir_files = []
+			stale_paths = []
 			for mydir, file_names in dir_files.items():
 				try:
 					mydir = _unicode_decode(mydir,
 						encoding=_encodings["fs"], errors="strict")
 				except UnicodeDecodeError:
 					continue
+				pkg_files = []
+				pkgdir_files.append((mydir, pkg_files))
 				for myfile in file_names:
 					try:
 						myfile = _unicode_decode(myfile,
@@ -622,45 +647,47 @@ class binarytree(object):
 					if not stat.S_ISREG(s.st_mode):
 						continue
 
+					stale = self._pkgindex_match(basename_index.get(myfile),
+						s, minimum_keys) is None and \
+						os.access(full_path, os.R_OK)
+					if stale:
+						stale_paths.append(full_path)
+					pkg_files.append((myfile, mypath, full_path, s, stale))
+
+			xpak_data = portage.xpak.iter_xpak_data(stale_paths)
+			update_pkgindex = False
+			for mydir, pkg_files in pkgdir_files:
+				for myfile, mypath, full_path, s, stale in pkg_files:
+					binary_metadata = None
+					if stale:
+						# Consume the batch in step with stale_paths, even
+						# if the index has been updated in the meantime.
+						binary_metadata = next(xpak_data)[1]
+
 					# Validate data from the package index and try to avoid
 					# reading the xpak if possible.
-					possibilities = basename_index.get(myfile)
-					if possibilities:
-						match = None
-						for d in possibilities:
-							try:
-								if long(d["_mtime_"]) != s[stat.ST_MTIME]:
-									continue
-							except (KeyError, ValueError):
-								continue
-							try:
-								if long(d["SIZE"]) != long(s.st_size):
-									continue
-							except (KeyError, ValueError):
-								continue
-							if not minimum_keys.difference(d):
-								match = d
-								break
-						if match:
-							mycpv = match["CPV"]
-							instance_key = _instance_key(mycpv)
-							pkg_paths[instance_key] = mypath
-							# update the path if the package has been moved
-							oldpath = d.get("PATH")
-							if oldpath and oldpath != mypath:
+					match = self._pkgindex_match(basename_index.get(myfile),
+						s, minimum_keys)
+					if match is not None:
+						mycpv = match["CPV"]
+						instance_key = _instance_key(mycpv)
+						pkg_paths[instance_key] = mypath
+						# update the path if the package has been moved
+						oldpath = match.get("PATH")
+						if oldpath and oldpath != mypath:
+							update_pkgindex = True
+						# Omit PATH if it is the default path for
+						# the current Packages format version.
+						if mypath != mycpv + ".tbz2":
+							match["PATH"] = mypath
+							if not oldpath:
 								update_pkgindex = True
-							# Omit PATH if it is the default path for
-							# the current Packages format version.
-							if mypath != mycpv + ".tbz2":
-								d["PATH"] = mypath
-								if not oldpath:
-									update_pkgindex = True
-							else:
-								d.pop("PATH", None)
-								if oldpath:
-									update_pkgindex = True
-							self.dbapi.cpv_inject(mycpv)
-							continue
+						else:
+							match.pop("PATH", None)
+							if oldpath:
+								update_pkgindex = True
+						self.dbapi.cpv_inject(mycpv)
+						continue
 					if not os.access(full_path, os.R_OK):
 						writemsg(_("!!! Permission denied to read " \
 							"binary package: '%s'\n") % full_path,
@@ -669,7 +696,8 @@ class binarytree(object):
 						continue
 					pkg_metadata = self._read_metadata(full_path, s,
 						keys=chain(self.dbapi._aux_cache_keys,
-						("PF", "CATEGORY")))
+						("PF", "CATEGORY")),
+						binary_metadata=binary_metadata)
 					mycat = pkg_metadata.get("CATEGORY", "")
 					mypf = pkg_metadata.get("PF", "")
 					slot = pkg_metadata.get("SLOT", "")
@@ -817,6 +845,7 @@ class binarytree(object):
 
 		self._remote_has_index = False
 		self._remotepkgs = {}
+		binhosts = []
 		for base_url in self.settings["PORTAGE_BINHOST"].split():
 			parsed_url = urlparse(base_url)
 			host = parsed_url.netloc
@@ -843,19 +872,26 @@ class binarytree(object):
 					mode='r', encoding=_encodings['repo.content'],
 					errors='replace')
 				try:
-					pkgindex.read(f)
+					# The body is read later, only if the cached copy
+					# is used.
+					pkgindex.readHeader(f)
 				finally:
 					f.close()
 			except EnvironmentError as e:
 				if e.errno != errno.ENOENT:
 					raise
+			binhosts.append((base_url, parsed_url, host, port, user_passwd,
+				pkgindex_file, pkgindex))
+
+		prefetched = self._prefetch_remote_indexes(binhosts,
+			getbinpkg_refresh)
+
+		for (base_url, parsed_url, host, port, user_passwd,
+			pkgindex_file, pkgindex) in binhosts:
+			cached_pkgindex = pkgindex
 			local_timestamp = pkgindex.header.get("TIMESTAMP", None)
-			try:
-				download_timestamp = \
-					float(pkgindex.header.get("DOWNLOAD_TIMESTAMP", 0))
-			except ValueError:
-				download_timestamp = 0
 			remote_timestamp = None
+			remote_etag = None
 			rmt_idx = self._new_pkgindex()
 			proc = None
 			tmp_filename = None
@@ -866,27 +902,26 @@ class binarytree(object):
 				url = base_url.rstrip("/") + "/Packages"
 				f = None
 
-				if not getbinpkg_refresh and local_timestamp:
+				if self._remote_index_is_current(pkgindex,
+					getbinpkg_refresh):
 					raise UseCachedCopyOfRemoteIndex()
 
-				try:
-					ttl = float(pkgindex.header.get("TTL", 0))
-				except ValueError:
-					pass
-				else:
-					if download_timestamp and ttl and \
-						download_timestamp + ttl > time.time():
-						raise UseCachedCopyOfRemoteIndex()
-
 				# Don't use urlopen for https, unless
 				# PEP 476 is supported (bug #469888).
 				if parsed_url.scheme not in ('https',) or _have_pep_476():
 					try:
-						f = _urlopen(url, if_modified_since=local_timestamp)
-						if hasattr(f, 'headers') and f.headers.get('timestamp', ''):
-							remote_timestamp = f.headers.get('timestamp')
+						if url in prefetched:
+							f, e = prefetched.pop(url)
+							if e is not None:
+								raise e
+						else:
+							f = self._fetch_remote_index(url, pkgindex)
+						if f.headers is not None:
+							if f.headers.get('timestamp', ''):
+								remote_timestamp = f.headers.get('timestamp')
+							remote_etag = f.headers.get('etag')
 					except IOError as err:
-						if hasattr(err, 'code') and err.code == 304: # not modified (since local_timestamp)
+						if hasattr(err, 'code') and err.code == 304: # not modified (since local_timestamp or ETAG)
 							raise UseCachedCopyOfRemoteIndex()
 
 						if parsed_url.scheme in ('ftp', 'http', 'https'):
@@ -1020,10 +1055,23 @@ class binarytree(object):
 			if pkgindex is rmt_idx:
 				pkgindex.modified = False # don't update the header
 				pkgindex.header["DOWNLOAD_TIMESTAMP"] = "%d" % time.time()
+				if remote_etag:
+					pkgindex.header["ETAG"] = remote_etag
 				try:
 					ensure_dirs(os.path.dirname(pkgindex_file))
 					f = atomic_ofstream(pkgindex_file)
-					pkgindex.write(f)
+					if pkgindex is cached_pkgindex:
+						# Only the header has been read, so copy the
+						# body from the cached copy.
+						pkgindex.writeHeader(f)
+						with io.open(_unicode_encode(pkgindex_file,
+							encoding=_encodings['fs'], errors='strict'),
+							mode='r', encoding=_encodings['repo.content'],
+							errors='replace') as cached_f:
+							self._new_pkgindex().readHeader(cached_f)
+							shutil.copyfileobj(cached_f, f)
+					else:
+						pkgindex.write(f)
 					f.close()
 				except (IOError, PortageException):
 					if os.access(os.path.dirname(pkgindex_file), os.W_OK):
@@ -1032,7 +1080,12 @@ class binarytree(object):
 					# file, but that's alright.
 			if pkgindex:
 				remote_base_uri = pkgindex.header.get("URI", base_url)
-				for d in pkgindex.packages:
+				if pkgindex is cached_pkgindex:
+					packages = PackagesSidecar(
+						pkgindex_file).packages(pkgindex)
+				else:
+					packages = pkgindex.packages
+				for d in packages:
 					cpv = _pkg_str(d["CPV"], metadata=d,
 						settings=self.settings, db=self.dbapi)
 					# Local package instances override remote instances
@@ -1050,6 +1103,77 @@ class binarytree(object):
 				self._merge_pkgindex_header(pkgindex.header,
 					self._pkgindex_header)
 
+	@staticmethod
+	def _remote_index_is_current(pkgindex, getbinpkg_refresh):
+		"""
+		Return True if the cached copy of a remote index can be used
+		without contacting the binhost.
+		"""
+		if not getbinpkg_refresh and pkgindex.header.get("TIMESTAMP"):
+			return True
+		try:
+			download_timestamp = \
+				float(pkgindex.header.get("DOWNLOAD_TIMESTAMP", 0))
+		except ValueError:
+			download_timestamp = 0
+		try:
+			ttl = float(pkgindex.header.get("TTL", 0))
+		except ValueError:
+			return False
+		return bool(download_timestamp and ttl and
+			download_timestamp + ttl > time.time())
+
+	@staticmethod
+	def _fetch_remote_index(url, pkgindex):
+		"""
+		Download a remote index with urlopen, using a conditional request
+		if there is a cached copy, and return a _RemoteIndexResponse
+		which holds the complete body. Since the connection is closed
+		before this returns, it is safe to call from a worker thread.
+		"""
+		local_timestamp = pkgindex.header.get("TIMESTAMP", None)
+		etag = None
+		if local_timestamp:
+			etag = pkgindex.header.get("ETAG", None)
+		f = _urlopen(url, if_modified_since=local_timestamp,
+			if_none_match=etag)
+		try:
+			return _RemoteIndexResponse(f.read(),
+				getattr(f, 'headers', None))
+		finally:
+			f.close()
+
+	def _prefetch_remote_indexes(self, binhosts, getbinpkg_refresh):
+		"""
+		Concurrently download the remote indexes of all binhosts which
+		use a protocol that is supported by urlopen, so that the latency
+		of each binhost is not added to the total. The indexes are parsed
+		afterwards in PORTAGE_BINHOST order, since the first binhost
+		takes precedence for packages which are available from several
+		binhosts.
+
+		@rtype: dict
+		@return: (response, exception) tuples keyed by index url
+		"""
+		args_list = []
+		for (base_url, parsed_url, host, port, user_passwd,
+			pkgindex_file, pkgindex) in binhosts:
+			if parsed_url.scheme not in ('ftp', 'http', 'https'):
+				continue
+			if parsed_url.scheme == 'https' and not _have_pep_476():
+				continue
+			if self._remote_index_is_current(pkgindex, getbinpkg_refresh):
+				continue
+			args_list.append((base_url.rstrip("/") + "/Packages", pkgindex))
+
+		if len(args_list) <= 1:
+			return {}
+
+		results = map_concurrent(self._fetch_remote_index, args_list,
+			len(args_list))
+		return dict((args[0], result)
+			for args, result in zip(args_list, results))
+
 	def inject(self, cpv, filename=None):
 		"""Add a freshly built package to the database.  This updates
 		$PKGDIR/Packages with the new package metadata (including MD5).
@@ -1145,13 +1269,14 @@ class binarytree(object):
 				binpkg.recompose_mem(portage.xpak.xpak_mem(binary_data))
 
 			self._file_permissions(full_path)
-			pkgindex = self._load_pkgindex()
-			if not self._pkgindex_version_supported(pkgindex):
-				pkgindex = self._new_pkgindex()
-
-			d = self._inject_file(pkgindex, cpv, full_path)
-			self._update_pkgindex_header(pkgindex.header)
-			self._pkgindex_write(pkgindex)
+			d = self._inject_file(None, cpv, full_path)
+			if not self._pkgindex_journal_append(d):
+				pkgindex = self._load_pkgindex()
+				if not self._pkgindex_version_supported(pkgindex):
+					pkgindex = self._new_pkgindex()
+				self._pkgindex_add_entry(pkgindex, d)
+				self._update_pkgindex_header(pkgindex.header)
+				self._pkgindex_write(pkgindex)
 
 		finally:
 			if pkgindex_lock:
@@ -1163,7 +1288,29 @@ class binarytree(object):
 
 		return cpv
 
-	def _read_metadata(self, filename, st, keys=None):
+	@staticmethod
+	def _pkgindex_match(possibilities, st, minimum_keys):
+		"""
+		Return the package index entry which is valid for a binary
+		package with the given stat result, or None if there is no
+		such entry, in which case the xpak has to be read.
+		"""
+		for d in possibilities or ():
+			try:
+				if long(d["_mtime_"]) != st[stat.ST_MTIME]:
+					continue
+			except (KeyError, ValueError):
+				continue
+			try:
+				if long(d["SIZE"]) != long(st.st_size):
+					continue
+			except (KeyError, ValueError):
+				continue
+			if not minimum_keys.difference(d):
+				return d
+		return None
+
+	def _read_metadata(self, filename, st, keys=None, binary_metadata=None):
 		"""
 		Read metadata from a binary package. The returned metadata
 		dictionary will contain empty strings for any values that
@@ -1176,6 +1323,9 @@ class binarytree(object):
 		@type st: os.stat_result
 		@param keys: optional list of specific metadata keys to retrieve
 		@type keys: iterable
+		@param binary_metadata: xpak data which has already been read
+			from the binary package, as returned by tbz2.get_data()
+		@type binary_metadata: dict
 		@rtype: dict
 		@return: package metadata
 		"""
@@ -1184,7 +1334,8 @@ class binarytree(object):
 			metadata = self.dbapi._aux_cache_slot_dict()
 		else:
 			metadata = {}
-		binary_metadata = portage.xpak.tbz2(filename).get_data()
+		if binary_metadata is None:
+			binary_metadata = portage.xpak.tbz2(filename).get_data()
 		for k in keys:
 			if k == "_mtime_":
 				metadata[k] = _unicode(st[stat.ST_MTIME])
@@ -1207,7 +1358,7 @@ class binarytree(object):
 		Add a package to internal data structures, and add an
 		entry to the given pkgindex.
 		@param pkgindex: The PackageIndex instance to which an entry
-			will be added.
+			will be added, or None if the caller adds the entry.
 		@type pkgindex: PackageIndex
 		@param cpv: A _pkg_str instance corresponding to the package
 			being injected.
@@ -1227,21 +1378,158 @@ class binarytree(object):
 		self.dbapi.cpv_inject(cpv)
 		self._pkg_paths[instance_key] = filename[len(self.pkgdir)+1:]
 		d = self._pkgindex_entry(cpv)
+		if pkgindex is not None:
+			self._pkgindex_add_entry(pkgindex, d)
+		return d
 
-		# If found, remove package(s) with duplicate path.
-		path = d.get("PATH", "")
-		for i in range(len(pkgindex.packages) - 1, -1, -1):
-			d2 = pkgindex.packages[i]
-			if path and path == d2.get("PATH"):
-				# Handle path collisions in $PKGDIR/All
-				# when CPV is not identical.
-				del pkgindex.packages[i]
-			elif cpv == d2.get("CPV"):
-				if path == d2.get("PATH", ""):
-					del pkgindex.packages[i]
-
+	@staticmethod
+	def _pkgindex_add_entry(pkgindex, d):
+		"""
+		Add an entry to pkgindex, replacing any entries that it
+		supersedes (see _pkgindex_entry_key).
+		"""
+		key = binarytree._pkgindex_entry_key(d)
+		pkgindex.packages[:] = [d2 for d2 in pkgindex.packages
+			if binarytree._pkgindex_entry_key(d2) != key]
 		pkgindex.packages.append(d)
-		return d
+
+	@staticmethod
+	def _pkgindex_entry_key(d):
+		"""
+		Return a key which identifies the entries that a new entry
+		supersedes: entries with the same PATH (path collisions in
+		$PKGDIR/All when CPV is not identical), or entries with the
+		same CPV if there is no PATH.
+		"""
+		path = d.get("PATH")
+		if path:
+			return ("PATH", path)
+		return ("CPV", d.get("CPV"))
+
+	def _pkgindex_journal_append(self, d):
+		"""
+		With FEATURES=binpkg-index-journal, append an entry to the
+		journal of the Packages file, so that the whole file does not
+		have to be rewritten. The journal belongs to the Packages file
+		with the TIMESTAMP in its header, and it is merged into the
+		Packages file (compacted) the next time that the Packages file
+		is written, which happens when the journal has grown beyond
+		a fraction of the size of the Packages file, or when running
+		`emaint binhost --fix`. The caller must hold the Packages lock.
+
+		@rtype: bool
+		@return: True if the entry has been appended, or False if the
+			Packages file needs to be written instead.
+		"""
+		if "binpkg-index-journal" not in self.settings.features:
+			return False
+
+		pkgindex = self._new_pkgindex()
+		try:
+			f = io.open(_unicode_encode(self._pkgindex_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+		except EnvironmentError:
+			return False
+		with f:
+			pkgindex.readHeader(f)
+			pkgindex_size = os.fstat(f.fileno()).st_size
+		timestamp = pkgindex.header.get("TIMESTAMP")
+		if not timestamp or not self._pkgindex_version_supported(pkgindex):
+			return False
+
+		journal = self._new_pkgindex()
+		journal_size = 0
+		try:
+			f = io.open(_unicode_encode(self._pkgindex_journal_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise
+		else:
+			with f:
+				journal.readHeader(f)
+				journal_size = os.fstat(f.fileno()).st_size
+		if journal.header.get("TIMESTAMP") != timestamp:
+			# The journal belongs to a previous Packages file.
+			journal_size = 0
+		elif journal_size > pkgindex_size * self._pkgindex_journal_ratio:
+			return False
+
+		record = io.StringIO()
+		pkgindex._writepkgindex(record,
+			[(k, d[k]) for k in sorted(d) if d[k]])
+		record = _unicode_encode(record.getvalue(),
+			encoding=_encodings['repo.content'], errors='strict')
+
+		if journal_size:
+			# Append the whole record with a single write, so that
+			# concurrent readers never see a partial record unless
+			# the write was interrupted.
+			fd = os.open(_unicode_encode(self._pkgindex_journal_file,
+				encoding=_encodings['fs'], errors='strict'),
+				os.O_WRONLY | os.O_APPEND)
+			try:
+				os.write(fd, record)
+			finally:
+				os.close(fd)
+		else:
+			header = _unicode_encode("TIMESTAMP: %s\n\n" % (timestamp,),
+				encoding=_encodings['repo.content'], errors='strict')
+			f = atomic_ofstream(self._pkgindex_journal_file, mode='wb')
+			f.write(header + record)
+			f.close()
+			self._file_permissions(self._pkgindex_journal_file)
+		return True
+
+	def _pkgindex_journal_read(self, pkgindex):
+		"""
+		Return the entries of the journal which belongs to the given
+		Packages index, in the order in which they were appended.
+		"""
+		timestamp = pkgindex.header.get("TIMESTAMP")
+		if not timestamp:
+			return []
+		try:
+			f = io.open(_unicode_encode(self._pkgindex_journal_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+		except EnvironmentError:
+			return []
+		with f:
+			contents = f.read()
+		# Ignore a trailing record which is incomplete because
+		# the process that appended it was interrupted.
+		end = contents.rfind("\n\n")
+		if end == -1:
+			return []
+		journal = self._new_pkgindex()
+		f = io.StringIO(contents[:end + 2])
+		journal.readHeader(f)
+		if journal.header.get("TIMESTAMP") != timestamp:
+			return []
+		return list(journal.iterBody(f))
+
+	def _pkgindex_journal_pending(self):
+		"""
+		Return True if the Packages file has journaled entries which
+		have not been compacted into it yet.
+		"""
+		pkgindex = self._new_pkgindex()
+		try:
+			f = io.open(_unicode_encode(self._pkgindex_file,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+		except EnvironmentError:
+			return False
+		with f:
+			pkgindex.readHeader(f)
+		return bool(self._pkgindex_journal_read(pkgindex))
 
 	def _pkgindex_write(self, pkgindex):
 		contents = codecs.getwriter(_encodings['repo.content'])(io.BytesIO())
@@ -1266,6 +1554,14 @@ class binarytree(object):
 			# some seconds might have elapsed since TIMESTAMP
 			os.utime(fname, (atime, mtime))
 
+		# The journal has been compacted into the Packages file, which
+		# has a new TIMESTAMP, so that the journal is ignored by readers
+		# even if they open it before it is removed.
+		try:
+			os.unlink(self._pkgindex_journal_file)
+		except OSError:
+			pass
+
 	def _pkgindex_entry(self, cpv):
 		"""
 		Performs checksums, and gets size and mtime via lstat.
@@ -1626,6 +1922,15 @@ class binarytree(object):
 				pkgindex.read(f)
 			finally:
 				f.close()
+		entries = self._pkgindex_journal_read(pkgindex)
+		if entries:
+			latest = dict((self._pkgindex_entry_key(d), d)
+				for d in entries)
+			packages = [d for d in pkgindex.packages
+				if self._pkgindex_entry_key(d) not in latest]
+			packages.extend(d for d in entries
+				if latest[self._pkgindex_entry_key(d)] is d)
+			pkgindex.packages[:] = packages
 		return pkgindex
 
 	def _get_digests(self, pkg):
@@ -1691,9 +1996,14 @@ class binarytree(object):
 			digests = _apply_hash_filter(digests, hash_filter)
 		eout = EOutput()
 		eout.quiet = self.settings.get("PORTAGE_QUIET") == "1"
-		ok, st = _check_distfile(pkg_path, digests, eout, show_errors=0)
+		digest_cache = get_digest_cache(self.settings)
+		ok, st = _check_distfile(pkg_path, digests, eout, show_errors=0,
+			digest_cache=digest_cache)
 		if not ok:
-			ok, reason = verify_all(pkg_path, digests)
+			if digest_cache is None:
+				ok, reason = verify_all(pkg_path, digests)
+			else:
+				ok, reason = digest_cache.verify_all(pkg_path, digests)
 			if not ok:
 				raise portage.exception.DigestException(
 					(pkg_path,) + tuple(reason))
@@ -13,6 +13,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum:_perform_md5_merge@perform_md5',
 	'portage.data:portage_gid,portage_uid,secpass',
 	'portage.dbapi.dep_expand:dep_expand',
+	'portage.dbapi._MergePool:MergePool',
 	'portage.dbapi._MergeProcess:MergeProcess',
 	'portage.dbapi._SyncfsProcess:SyncfsProcess',
 	'portage.dep:dep_getkey,isjustname,isvalidatom,match_from_list,' + \
@@ -30,6 +31,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.util:apply_secpass_permissions,ConfigProtect,ensure_dirs,' + \
 		'writemsg,writemsg_level,write_atomic,atomic_ofstream,writedict,' + \
 		'grabdict,normalize_path,new_protect_filename',
+	'portage.util.cpuinfo:get_cpu_count',
 	'portage.util.digraph:digraph',
 	'portage.util.env_update:env_update',
 	'portage.util.install_mask:install_mask_dir,InstallMask',
@@ -69,6 +71,8 @@ from portage import _os_merge
 from portage import _selinux_merge
 from portage import _unicode_decode
 from portage import _unicode_encode
+from ._OwnersIndex import OwnersIndex
+from ._VdbIndex import VdbIndex
 from ._VdbMetadataDelta import VdbMetadataDelta
 
 from _emerge.EbuildBuildDir import EbuildBuildDir
@@ -80,6 +84,7 @@ from ._ContentsCaseSensitivityManager import ContentsCaseSensitivityManager
 
 import errno
 import fnmatch
+import functools
 import gc
 import grp
 import io
@@ -191,6 +196,7 @@ class vardbapi(dbapi):
 		self._cache_delta_filename = os.path.join(self._eroot,
 			CACHE_PATH, "vdb_metadata_delta.json")
 		self._cache_delta = VdbMetadataDelta(self)
+		self._vdb_index = VdbIndex(self)
 		self._counter_path = os.path.join(self._eroot,
 			CACHE_PATH, "counter")
 
@@ -198,6 +204,7 @@ class vardbapi(dbapi):
 			os.path.join(self._eroot, PRIVATE_PATH, "preserved_libs_registry"))
 		self._linkmap = LinkageMap(self)
 		self._owners = self._owners_db(self)
+		self._owners_index = OwnersIndex(self)
 
 		self._cached_counter = None
 
@@ -446,13 +453,15 @@ class vardbapi(dbapi):
 			if cpc[0] == mystat:
 				return cpc[1][:]
 		cat_dir = self.getpath(mysplit[0])
-		try:
-			dir_list = os.listdir(cat_dir)
-		except EnvironmentError as e:
-			if e.errno == PermissionDenied.errno:
-				raise PermissionDenied(cat_dir)
-			del e
-			dir_list = []
+		dir_list = self._vdb_index.category_pfs(mysplit[0])
+		if dir_list is None:
+			try:
+				dir_list = os.listdir(cat_dir)
+			except EnvironmentError as e:
+				if e.errno == PermissionDenied.errno:
+					raise PermissionDenied(cat_dir)
+				del e
+				dir_list = []
 
 		returnme = []
 		for x in dir_list:
@@ -554,6 +563,7 @@ class vardbapi(dbapi):
 		self.matchcache.clear()
 		self.cpcache.clear()
 		self._aux_cache_obj = None
+		self._vdb_index.clear()
 
 	def _add(self, pkg_dblink):
 		self._pkgs_changed = True
@@ -571,6 +581,7 @@ class vardbapi(dbapi):
 		self.matchcache.pop(pkg_dblink.cat, None)
 		self.cpcache.pop(pkg_dblink.mysplit[0], None)
 		dircache.pop(pkg_dblink.dbcatdir, None)
+		self._vdb_index.clear()
 
 	def match(self, origdep, use_cache=1):
 		"caching match function"
@@ -644,6 +655,27 @@ class vardbapi(dbapi):
 
 			self._aux_cache["modified"] = set()
 
+		if self._flush_cache_enabled and secpass >= 2:
+			# Index any categories that have been modified since
+			# the index was last updated.
+			self._vdb_index.update()
+
+	def _update_vdb_indexes(self, category):
+		"""
+		Update the binary vdb index and the file owner index for a
+		category that has been modified by a merge or unmerge. The
+		indexes are only written if the current user has superuser
+		privileges, like the aux_get cache. Unlike the aux_get cache,
+		this is also done in MergeProcess subprocesses, since only the
+		modified packages are read again. The owner index is only
+		maintained here if it has been created by a previous owner
+		lookup.
+		"""
+		if secpass >= 2:
+			self._vdb_index.update([category])
+			if os.path.exists(self._owners_index.filename):
+				self._owners_index.update()
+
 	@property
 	def _aux_cache(self):
 		if self._aux_cache_obj is None:
@@ -724,7 +756,18 @@ class vardbapi(dbapi):
 		If an error occurs while loading the cache pickle or the version is
 		unrecognized, the cache will simple be recreated from scratch (it is
 		completely disposable).
+
+		Metadata is taken from the binary vdb index (see VdbIndex) when it
+		is valid for the package's category, which avoids any per-package
+		stat or open calls.
 		"""
+		mydata = self._vdb_index.get(mycpv, wants)
+		if mydata is not None:
+			eapi_attrs = _get_eapi_attrs(mydata['EAPI'])
+			if _get_slot_re(eapi_attrs).match(mydata['SLOT']) is None:
+				mydata['SLOT'] = '0'
+			return [mydata[x] for x in wants]
+
 		cache_these_wants = self._aux_cache_keys.intersection(wants)
 		for x in wants:
 			if self._aux_cache_keys_re.match(x) is not None:
@@ -749,6 +792,9 @@ class vardbapi(dbapi):
 		mydir_mtime = mydir_stat.st_mtime
 		pkg_data = self._aux_cache["packages"].get(mycpv)
 		pull_me = cache_these.union(wants)
+		# Consistently use float mtime, rather than the integer mtime
+		# from _aux_get.
+		pull_me.discard("_mtime_")
 		mydata = {"_mtime_" : mydir_mtime}
 		cache_valid = False
 		cache_incomplete = False
@@ -1147,6 +1193,7 @@ class vardbapi(dbapi):
 			for entry in new_needed:
 				f.write(_unicode(entry))
 			f.close()
+			self._linkmap._discard_needed_cache(pkg.mycpv)
 		f = atomic_ofstream(os.path.join(pkg.dbdir, "CONTENTS"))
 		write_contents(new_contents, root, f)
 		f.close()
@@ -1301,6 +1348,13 @@ class vardbapi(dbapi):
 
 			if not isinstance(path_iter, list):
 				path_iter = list(path_iter)
+
+			owners_index = self._owners_index()
+			if owners_index is not None:
+				for x in self._iter_owners_index(owners_index, path_iter):
+					yield x
+				return
+
 			owners_cache = self._populate()
 			vardb = self._vardb
 			root = vardb._eroot
@@ -1380,6 +1434,79 @@ class vardbapi(dbapi):
 						for cpv, p in owners:
 							yield (dblink(cpv), p)
 
+		def _owners_index(self):
+			"""
+			Return the persistent file owner index if it is consistent
+			with the vdb, updating or creating it first if the current
+			user has sufficient privileges. Returns None if the index
+			is unusable, in which case the basename cache is used.
+			"""
+			vardb = self._vardb
+			if "case-insensitive-fs" in vardb.settings.features:
+				return None
+			owners_index = vardb._owners_index
+			if secpass >= 2 and vardb.writable:
+				if not owners_index.update():
+					return None
+			elif not owners_index.valid():
+				return None
+			return owners_index
+
+		def _iter_owners_index(self, owners_index, path_list):
+			"""
+			Iterate over tuples of (dblink, path), using the persistent
+			file owner index. Paths which are recorded in the index are
+			resolved without reading CONTENTS. Otherwise, the path may
+			still be owned via a symlinked directory, so _match_contents
+			is used for packages that own a file with the same basename.
+			"""
+			vardb = self._vardb
+			root = vardb.settings["ROOT"]
+			eroot_len = len(vardb._eroot)
+			dblink_cache = {}
+
+			def dblink(cpv):
+				x = dblink_cache.get(cpv)
+				if x is None:
+					if len(dblink_cache) > 20:
+						# Ensure that we don't run out of memory.
+						dblink_cache.clear()
+					x = vardb._dblink(cpv)
+					dblink_cache[cpv] = x
+				return x
+
+			for path in path_list:
+				is_basename = os.sep != path[:1]
+				if is_basename:
+					name = path
+				else:
+					name = os.path.basename(path.rstrip(os.path.sep))
+
+				if not name:
+					continue
+
+				if not is_basename:
+					index_path = normalize_path(os.sep + path.lstrip(os.sep))
+					cpvs = owners_index.find_path(index_path)
+					if cpvs:
+						key = root + index_path.lstrip(os.sep)
+						for cpv in cpvs:
+							yield (dblink(cpv), key[eroot_len:])
+						continue
+
+				for cpv in owners_index.find_basename(name):
+					pkg_dblink = dblink(cpv)
+					if is_basename:
+						for p in pkg_dblink._contents.keys():
+							if os.path.basename(p) == name:
+								yield (pkg_dblink,
+									pkg_dblink._contents.unmap_key(
+									p)[eroot_len:])
+					else:
+						key = pkg_dblink._match_contents(path)
+						if key is not False:
+							yield (pkg_dblink, key[eroot_len:])
+
 		def _iter_owners_low_mem(self, path_list):
 			"""
 			This implemention will make a short-lived dblink instance (and
@@ -1561,6 +1688,10 @@ class dblink(object):
 		errno.ENOTDIR, errno.EISDIR,
 		errno.EPERM)
 
+	# Maximum number of regular files that mergeme moves concurrently
+	# (defaults to the number of CPUs).
+	_merge_jobs = None
+
 	def __init__(self, cat, pkg, myroot=None, settings=None, treetype=None,
 		vartree=None, blockers=None, scheduler=None, pipe=None):
 		"""
@@ -2145,6 +2276,7 @@ class dblink(object):
 
 		finally:
 			self.vartree.dbapi._bump_mtime(self.mycpv)
+			self.vartree.dbapi._update_vdb_indexes(self.cat)
 			try:
 					if not eapi_unsupported and os.path.isfile(myebuildpath):
 						if retval != os.EX_OK:
@@ -3460,6 +3592,21 @@ class dblink(object):
 			falign = len("%d" % totfiles)
 			showMessage(_(" %s checking %d files for package collisions\n") % \
 				(colorize("GOOD", "*"), totfiles))
+
+			# Read each destination directory once, so that files which
+			# do not exist yet do not need an lstat call each, and collect
+			# the files of the other packages, so that most ownership
+			# checks are a set lookup.
+			case_insensitive = "case-insensitive-fs" in self.settings.features
+			dest_listings = {}
+			owned_paths = frozenset()
+			if not case_insensitive:
+				dest_listings = self._list_dest_dirs(destroot,
+					chain(file_list, symlink_list))
+				owned_paths = set()
+				for ver in mypkglist:
+					owned_paths.update(ver.getcontents())
+
 			for i, (f, f_type) in enumerate(chain(
 				((f, "reg") for f in file_list),
 				((f, "sym") for f in symlink_list))):
@@ -3484,6 +3631,12 @@ class dblink(object):
 								dirs_ro.add(x)
 							break
 
+				names = dest_listings.get(parent, False)
+				if names is None or (names is not False and
+					os.path.basename(dest_path) not in names):
+					# The file does not exist.
+					continue
+
 				try:
 					dest_lstat = os.lstat(dest_path)
 				except EnvironmentError as e:
@@ -3542,10 +3695,15 @@ class dblink(object):
 
 				isowned = False
 				full_path = os.path.join(destroot, f.lstrip(os.path.sep))
-				for ver in mypkglist:
-					if ver.isowner(f):
-						isowned = True
-						break
+				if normalize_path(full_path) in owned_paths:
+					isowned = True
+				else:
+					# The path may differ from the one in CONTENTS, due
+					# to symlinked directories.
+					for ver in mypkglist:
+						if ver.isowner(f):
+							isowned = True
+							break
 				if not isowned and self.isprotected(full_path):
 					isowned = True
 				if not isowned:
@@ -3561,6 +3719,32 @@ class dblink(object):
 				showMessage(_("100% done\n"))
 			return collisions, dirs_ro, symlink_collisions, plib_collisions
 
+	def _list_dest_dirs(self, destroot, paths):
+		"""
+		List the destination directories of the given image paths, in
+		sorted order, and return a dict which maps each directory to a
+		frozenset of the names it contains, or to None if it does not
+		exist. Directories that cannot be listed for other reasons
+		(for example, because a parent is not a directory) are omitted,
+		so that the caller falls back to lstat for their files.
+		"""
+
+		os = _os_merge
+
+		parents = set()
+		for f in paths:
+			parents.add(os.path.dirname(normalize_path(
+				os.path.join(destroot, f.lstrip(os.path.sep)))))
+
+		listings = {}
+		for parent in sorted(parents):
+			try:
+				listings[parent] = frozenset(os.listdir(parent))
+			except (OSError, UnicodeEncodeError) as e:
+				if getattr(e, 'errno', None) == errno.ENOENT:
+					listings[parent] = None
+		return listings
+
 	def _lstat_inode_map(self, path_iter):
 		"""
 		Use lstat to create a map of the form:
@@ -4689,8 +4873,41 @@ class dblink(object):
 
 		"""
 
+		pool = None
+		if not self.settings.selinux_enabled():
+			pool = MergePool.create(self._merge_jobs or get_cpu_count())
+		if pool is None:
+			return self._mergeme(srcroot, destroot, outfile, secondhand,
+				stufftomerge, cfgfiledict, thismtime, None)
+		try:
+			rval = self._mergeme(srcroot, destroot, outfile, secondhand,
+				stufftomerge, cfgfiledict, thismtime, pool)
+			if not rval:
+				rval = pool.drain()
+			return rval
+		finally:
+			pool.shutdown()
+
+	def _mergeme(self, srcroot, destroot, outfile, secondhand, stufftomerge,
+		cfgfiledict, thismtime, pool):
+		"""
+		Merge files for mergeme. If pool is not None, then regular files
+		are moved in its worker threads, together with the computation
+		of their md5 checksums, and all output is emitted through the
+		pool in order. The caller has to drain the pool.
+		"""
+
 		showMessage = self._display_merge
 		writemsg = self._display_merge
+		outfile_write = outfile.write
+		eerror = self._eerror
+		eqawarn = self._eqawarn
+		if pool is not None:
+			showMessage = pool.wrap(showMessage)
+			writemsg = pool.wrap(writemsg)
+			outfile_write = pool.wrap(outfile_write)
+			eerror = pool.wrap(eerror)
+			eqawarn = pool.wrap(eqawarn)
 
 		os = _os_merge
 		sep = os.sep
@@ -4730,7 +4947,8 @@ class dblink(object):
 				mymtime = mystat[stat.ST_MTIME]
 
 			if stat.S_ISREG(mymode):
-				mymd5 = perform_md5(mysrc, calc_prelink=calc_prelink)
+				if pool is None:
+					mymd5 = perform_md5(mysrc, calc_prelink=calc_prelink)
 			elif stat.S_ISLNK(mymode):
 				# The file name of mysrc and the actual file that it points to
 				# will have earlier been forcefully converted to the 'merge'
@@ -4762,6 +4980,9 @@ class dblink(object):
 					os.path.basename(mydest).startswith(".keep"):
 					protected = False
 
+				if protected and mymd5 is None:
+					mymd5 = perform_md5(mysrc, calc_prelink=calc_prelink)
+
 			destmd5 = None
 			mydest_link = None
 			# handy variables; mydest is the target object on the live filesystems;
@@ -4838,9 +5059,14 @@ class dblink(object):
 						msg.append(_("This symlink will be merged with a different name:"))
 						msg.append("  '%s'" % newdest)
 						msg.append("")
-						self._eerror("preinst", msg)
+						eerror("preinst", msg)
 						mydest = newdest
 
+				if pool is not None and myrealto in pool.pending_dests:
+					# Wait for the target to be merged.
+					if pool.drain():
+						return 1
+
 				# if secondhand is None it means we're operating in "force" mode and should not create a second hand.
 				if (secondhand != None) and (not os.path.exists(myrealto)):
 					# either the target directory doesn't exist yet or the target file doesn't exist -- or
@@ -4865,15 +5091,15 @@ class dblink(object):
 					# symlink then that should trigger an independent warning.
 					if not (os.path.lexists(myrealto) or
 						os.path.lexists(join(srcroot, myabsto))):
-						self._eqawarn('preinst',
+						eqawarn('preinst',
 							[_("QA Notice: Symbolic link /%s points to /%s which does not exist.")
 							% (relative_path, myabsto)])
 
 					showMessage("%s %s -> %s\n" % (zing, mydest, myto))
 					if sys.hexversion >= 0x3030000:
-						outfile.write("sym "+myrealdest+" -> "+myto+" "+str(mymtime // 1000000000)+"\n")
+						outfile_write("sym "+myrealdest+" -> "+myto+" "+str(mymtime // 1000000000)+"\n")
 					else:
-						outfile.write("sym "+myrealdest+" -> "+myto+" "+str(mymtime)+"\n")
+						outfile_write("sym "+myrealdest+" -> "+myto+" "+str(mymtime)+"\n")
 				else:
 					showMessage(_("!!! Failed to move file.\n"),
 						level=logging.ERROR, noiselevel=-1)
@@ -4917,7 +5143,7 @@ class dblink(object):
 						msg.append(_("This file will be renamed to a different name:"))
 						msg.append("  '%s'" % backup_dest)
 						msg.append("")
-						self._eerror("preinst", msg)
+						eerror("preinst", msg)
 						if movefile(mydest, backup_dest,
 							mysettings=self.settings,
 							encoding=_encodings['merge']) is None:
@@ -4974,7 +5200,7 @@ class dblink(object):
 				except OSError:
 					pass
 
-				outfile.write("dir "+myrealdest+"\n")
+				outfile_write("dir "+myrealdest+"\n")
 				# recurse and merge this directory
 				mergelist.extend(join(relative_path, child) for child in
 					os.listdir(join(srcroot, relative_path)))
@@ -4992,7 +5218,7 @@ class dblink(object):
 						msg.append(_("This file will be merged with a different name:"))
 						msg.append("  '%s'" % newdest)
 						msg.append("")
-						self._eerror("preinst", msg)
+						eerror("preinst", msg)
 						mydest = newdest
 
 				# whether config protection or not, we merge the new file the
@@ -5007,25 +5233,36 @@ class dblink(object):
 						hardlink_candidates = []
 						self._hardlink_merge_map[hardlink_key] = hardlink_candidates
 
-					mymtime = movefile(mysrc, mydest, newmtime=thismtime,
+					move = functools.partial(self._merge_reg_file, mysrc,
+						mymd5, calc_prelink, functools.partial(movefile,
+						mysrc, mydest, newmtime=thismtime,
 						sstat=mystat, mysettings=self.settings,
 						hardlink_candidates=hardlink_candidates,
-						encoding=_encodings['merge'])
-					if mymtime is None:
-						return 1
-					hardlink_candidates.append(mydest)
-					zing = ">>>"
+						encoding=_encodings['merge']))
+					merged = functools.partial(self._merged_reg_file,
+						outfile.write, self._display_merge, mydest,
+						myrealdest, hardlink_candidates)
+
+					if pool is not None and mystat.st_nlink == 1:
+						# There are no other hardlinks that depend on
+						# this file, so move it concurrently.
+						if pool.submit(mydest, move, merged):
+							return 1
+						continue
 
-					try:
-						self._merged_path(mydest, os.lstat(mydest))
-					except OSError:
-						pass
+					# Emit queued output before the output of this file,
+					# and wait for earlier hardlinks to be merged.
+					if pool is not None and pool.drain():
+						return 1
+					if merged(move()):
+						return 1
+					continue
 
 				if mymtime != None:
 					if sys.hexversion >= 0x3030000:
-						outfile.write("obj "+myrealdest+" "+mymd5+" "+str(mymtime // 1000000000)+"\n")
+						outfile_write("obj "+myrealdest+" "+mymd5+" "+str(mymtime // 1000000000)+"\n")
 					else:
-						outfile.write("obj "+myrealdest+" "+mymd5+" "+str(mymtime)+"\n")
+						outfile_write("obj "+myrealdest+" "+mymd5+" "+str(mymtime)+"\n")
 				showMessage("%s %s\n" % (zing,mydest))
 			else:
 				# we are merging a fifo or device node
@@ -5045,11 +5282,46 @@ class dblink(object):
 					else:
 						return 1
 				if stat.S_ISFIFO(mymode):
-					outfile.write("fif %s\n" % myrealdest)
+					outfile_write("fif %s\n" % myrealdest)
 				else:
-					outfile.write("dev %s\n" % myrealdest)
+					outfile_write("dev %s\n" % myrealdest)
 				showMessage(zing + " " + mydest + "\n")
 
+	@staticmethod
+	def _merge_reg_file(mysrc, mymd5, calc_prelink, move):
+		"""
+		Compute the md5 of a regular file unless it is already known, and
+		then move it with the given movefile partial. This is called in a
+		MergePool worker thread by _mergeme.
+		"""
+		if mymd5 is None:
+			mymd5 = perform_md5(mysrc, calc_prelink=calc_prelink)
+		return mymd5, move()
+
+	def _merged_reg_file(self, outfile_write, showMessage, mydest,
+		myrealdest, hardlink_candidates, result):
+		"""
+		Record a regular file which has been moved by _merge_reg_file.
+		Returns 1 if movefile failed.
+		"""
+		os = _os_merge
+		mymd5, mymtime = result
+		if mymtime is None:
+			return 1
+		hardlink_candidates.append(mydest)
+
+		try:
+			self._merged_path(mydest, os.lstat(mydest))
+		except OSError:
+			pass
+
+		if sys.hexversion >= 0x3030000:
+			outfile_write("obj "+myrealdest+" "+mymd5+" "+str(mymtime // 1000000000)+"\n")
+		else:
+			outfile_write("obj "+myrealdest+" "+mymd5+" "+str(mymtime)+"\n")
+		showMessage(">>> %s\n" % mydest)
+		return None
+
 	def _protect(self, cfgfiledict, protect_if_modified, src_md5,
 		src_link, dest, dest_real, dest_mode, dest_md5, dest_link):
 
@@ -5212,6 +5484,7 @@ class dblink(object):
 			else:
 				self.vartree.dbapi._linkmap._clear_cache()
 			self.vartree.dbapi._bump_mtime(self.mycpv)
+			self.vartree.dbapi._update_vdb_indexes(self.cat)
 			if not parallel_install:
 				self.unlockdb()
 
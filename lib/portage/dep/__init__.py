@@ -1170,6 +1170,19 @@ class _use_dep(object):
 		return _use_dep(tokens, self._eapi_attrs, enabled_flags=enabled_flags, disabled_flags=disabled_flags,
 			missing_enabled=missing_enabled, missing_disabled=missing_disabled, required=self.required)
 
+# Parsed Atom attributes, keyed on the constructor arguments. The same
+# atoms are created many times, for example by use_reduce for the
+# dependencies of different packages, so this avoids redundant parsing,
+# and allows the cpv, use and without_use attributes to be shared.
+# Instances are not shared, since some callers (like dep_check) rely on
+# the identity of atoms. The cache is cleared when it reaches
+# _atom_cache_max entries, in order to bound memory usage.
+_atom_cache = {}
+_atom_cache_max = 0x10000
+
+# Atom.__setattr__ raises AttributeError, since atoms are immutable.
+_atom_setattr = object.__setattr__
+
 class Atom(_unicode):
 
 	"""
@@ -1177,6 +1190,16 @@ class Atom(_unicode):
 	class emulates most of the str methods that are useful with atoms.
 	"""
 
+	__slots__ = ("blocker", "build_id", "cp", "cpv", "eapi",
+		"extended_syntax", "operator", "repo", "slot", "slot_operator",
+		"sub_slot", "unevaluated_atom", "use", "version", "without_use",
+		"_orig_atom")
+
+	# Attributes which are stored in _atom_cache. The unevaluated_atom
+	# and without_use attributes are stored as None when they refer to
+	# the atom itself.
+	_cached_attrs = __slots__[:-1]
+
 	# Distiguishes package atoms from other atom types
 	package = True
 
@@ -1213,10 +1236,22 @@ class Atom(_unicode):
 
 		_unicode.__init__(s)
 
+		cache_key = None
+		if unevaluated_atom is None and _use is None:
+			cache_key = (s, allow_wildcard, allow_repo, eapi, allow_build_id)
+			cached = _atom_cache.get(cache_key)
+			if cached is not None:
+				for k, v in zip(self._cached_attrs, cached):
+					_atom_setattr(self, k, self if v is None and
+						k in ("unevaluated_atom", "without_use") else v)
+				if is_valid_flag is not None and eapi is not None:
+					self._check_use_conditionals(is_valid_flag)
+				return
+
 		eapi_attrs = _get_eapi_attrs(eapi)
 		atom_re = _get_atom_re(eapi_attrs)
 
-		self.__dict__['eapi'] = eapi
+		_atom_setattr(self, 'eapi', eapi)
 		if eapi is not None:
 			# Ignore allow_repo when eapi is specified.
 			allow_repo = eapi_attrs.repo_deps
@@ -1240,7 +1275,7 @@ class Atom(_unicode):
 				s = s[1:]
 		else:
 			blocker = False
-		self.__dict__['blocker'] = blocker
+		_atom_setattr(self, 'blocker', blocker)
 		m = atom_re.match(s)
 		build_id = None
 		extended_syntax = False
@@ -1316,48 +1351,48 @@ class Atom(_unicode):
 
 		else:
 			raise AssertionError(_("required group not found in atom: '%s'") % self)
-		self.__dict__['cp'] = cp
+		_atom_setattr(self, 'cp', cp)
 		try:
-			self.__dict__['cpv'] = _pkg_str(cpv)
-			self.__dict__['version'] = self.cpv.version
+			_atom_setattr(self, 'cpv', _pkg_str(cpv))
+			_atom_setattr(self, 'version', self.cpv.version)
 		except InvalidData:
 			# plain cp, wildcard, or something
-			self.__dict__['cpv'] = cpv
-			self.__dict__['version'] = extended_version
-		self.__dict__['repo'] = repo
+			_atom_setattr(self, 'cpv', cpv)
+			_atom_setattr(self, 'version', extended_version)
+		_atom_setattr(self, 'repo', repo)
 		if slot is None:
-			self.__dict__['slot'] = None
-			self.__dict__['sub_slot'] = None
-			self.__dict__['slot_operator'] = None
+			_atom_setattr(self, 'slot', None)
+			_atom_setattr(self, 'sub_slot', None)
+			_atom_setattr(self, 'slot_operator', None)
 		else:
 			slot_re = _get_slot_dep_re(eapi_attrs)
 			slot_match = slot_re.match(slot)
 			if slot_match is None:
 				raise InvalidAtom(self)
 			if eapi_attrs.slot_operator:
-				self.__dict__['slot'] = slot_match.group(1)
+				_atom_setattr(self, 'slot', slot_match.group(1))
 				sub_slot = slot_match.group(2)
 				if sub_slot is not None:
 					sub_slot = sub_slot.lstrip("/")
 				if sub_slot in ("*", "="):
-					self.__dict__['sub_slot'] = None
-					self.__dict__['slot_operator'] = sub_slot
+					_atom_setattr(self, 'sub_slot', None)
+					_atom_setattr(self, 'slot_operator', sub_slot)
 				else:
 					slot_operator = None
 					if sub_slot is not None and sub_slot[-1:] == "=":
 						slot_operator = sub_slot[-1:]
 						sub_slot = sub_slot[:-1]
-					self.__dict__['sub_slot'] = sub_slot
-					self.__dict__['slot_operator'] = slot_operator
+					_atom_setattr(self, 'sub_slot', sub_slot)
+					_atom_setattr(self, 'slot_operator', slot_operator)
 				if self.slot is not None and self.slot_operator == "*":
 					raise InvalidAtom(self)
 			else:
-				self.__dict__['slot'] = slot
-				self.__dict__['sub_slot'] = None
-				self.__dict__['slot_operator'] = None
-		self.__dict__['operator'] = op
-		self.__dict__['extended_syntax'] = extended_syntax
-		self.__dict__['build_id'] = build_id
+				_atom_setattr(self, 'slot', slot)
+				_atom_setattr(self, 'sub_slot', None)
+				_atom_setattr(self, 'slot_operator', None)
+		_atom_setattr(self, 'operator', op)
+		_atom_setattr(self, 'extended_syntax', extended_syntax)
+		_atom_setattr(self, 'build_id', build_id)
 
 		if not (repo is None or allow_repo):
 			raise InvalidAtom(self)
@@ -1382,13 +1417,13 @@ class Atom(_unicode):
 			else:
 				without_use = self
 
-		self.__dict__['use'] = use
-		self.__dict__['without_use'] = without_use
+		_atom_setattr(self, 'use', use)
+		_atom_setattr(self, 'without_use', without_use)
 
 		if unevaluated_atom:
-			self.__dict__['unevaluated_atom'] = unevaluated_atom
+			_atom_setattr(self, 'unevaluated_atom', unevaluated_atom)
 		else:
-			self.__dict__['unevaluated_atom'] = self
+			_atom_setattr(self, 'unevaluated_atom', self)
 
 		if eapi is not None:
 			if not isinstance(eapi, basestring):
@@ -1408,29 +1443,54 @@ class Atom(_unicode):
 					raise InvalidAtom(
 						_("Use dep defaults are not allowed in EAPI %s: '%s'") \
 						% (eapi, self), category='EAPI.incompatible')
-				if is_valid_flag is not None and self.use.conditional:
-					invalid_flag = None
-					try:
-						for conditional_type, flags in \
-							self.use.conditional.items():
-							for flag in flags:
-								if not is_valid_flag(flag):
-									invalid_flag = (conditional_type, flag)
-									raise StopIteration()
-					except StopIteration:
-						pass
-					if invalid_flag is not None:
-						conditional_type, flag = invalid_flag
-						conditional_str = _use_dep._conditional_strings[conditional_type]
-						msg = _("USE flag '%s' referenced in " + \
-							"conditional '%s' in atom '%s' is not in IUSE") \
-							% (flag, conditional_str % flag, self)
-						raise InvalidAtom(msg, category='IUSE.missing')
+				if is_valid_flag is not None:
+					self._check_use_conditionals(is_valid_flag)
 			if self.blocker and self.blocker.overlap.forbid and not eapi_attrs.strong_blocks:
 				raise InvalidAtom(
 					_("Strong blocks are not allowed in EAPI %s: '%s'") \
 						% (eapi, self), category='EAPI.incompatible')
 
+		if cache_key is not None:
+			if len(_atom_cache) >= _atom_cache_max:
+				_atom_cache.clear()
+			_atom_cache[cache_key] = tuple(
+				None if v is self else v for v in
+				(getattr(self, k) for k in self._cached_attrs))
+
+	def _check_use_conditionals(self, is_valid_flag):
+		"""
+		Raise InvalidAtom if a USE flag that is referenced in a USE
+		conditional is not valid according to is_valid_flag.
+		"""
+		if not (self.use and self.use.conditional):
+			return
+		invalid_flag = None
+		try:
+			for conditional_type, flags in \
+				self.use.conditional.items():
+				for flag in flags:
+					if not is_valid_flag(flag):
+						invalid_flag = (conditional_type, flag)
+						raise StopIteration()
+		except StopIteration:
+			pass
+		if invalid_flag is not None:
+			conditional_type, flag = invalid_flag
+			conditional_str = _use_dep._conditional_strings[conditional_type]
+			msg = _("USE flag '%s' referenced in " + \
+				"conditional '%s' in atom '%s' is not in IUSE") \
+				% (flag, conditional_str % flag, self)
+			raise InvalidAtom(msg, category='IUSE.missing')
+
+	def __getstate__(self):
+		return dict((k, getattr(self, k)) for k in self.__slots__
+			if hasattr(self, k))
+
+	def __setstate__(self, state):
+		for k, v in state.items():
+			_atom_setattr(self, k, v)
+
+
 	@property
 	def slot_operator_built(self):
 		"""
@@ -0,0 +1,101 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import re
+
+from portage.dep import use_reduce
+
+# Matches conditional USE deps of atoms, such as "flag?", "!flag=" or
+# "flag(-)?", and captures the flag.
+_conditional_use_dep_re = re.compile(r'^!?([^(]+?)(?:\([+-]\))?[?=]$')
+
+class CompiledDepString(object):
+	"""
+	A dependency string which is parsed and validated once, so that it
+	can be evaluated for any number of USE flag combinations without
+	redundant parsing. The result of use_reduce only depends on the
+	USE flags that are referenced by the dependency string, either
+	in USE conditional groups or in conditional USE deps of atoms, so
+	results are memoized for each distinct combination of those flags.
+	The flags are found by scanning the tokens of the dependency string,
+	and the string is parsed and validated by the first evaluation.
+
+	Each evaluation returns a new list, which the caller is free to
+	modify, but the atoms in the list are shared between evaluations
+	that have the same result.
+	"""
+
+	__slots__ = ("depstr", "flags", "_kwargs", "_results")
+
+	def __init__(self, depstr, eapi=None, is_valid_flag=None,
+		token_class=None, opconvert=False):
+		"""
+		@param depstr: dependency string
+		@type depstr: String
+		@param eapi: Indicates the EAPI the dep string has to comply to
+		@type eapi: String
+		@param is_valid_flag: Function that decides if a given use flag
+			might be used in use conditionals
+		@type is_valid_flag: Function
+		@param token_class: Convert all non operator tokens into this class
+		@type token_class: Class
+		@param opconvert: Put every operator as first element into it's
+			argument list
+		@type opconvert: Bool
+		"""
+		self.depstr = depstr
+		self._kwargs = {
+			"eapi": eapi,
+			"is_valid_flag": is_valid_flag,
+			"token_class": token_class,
+			"opconvert": opconvert,
+		}
+		self._results = {}
+
+		# Flags which are not valid flag names are harmless here, since
+		# they are never in the uselist, and an invalid string is
+		# reported by use_reduce.
+		flags = set()
+		for token in depstr.split():
+			if token[-1:] == "?":
+				flags.add(token.lstrip("!")[:-1])
+			elif token[-1:] == "]" and "[" in token:
+				for use_dep in token[token.index("[") + 1:-1].split(","):
+					m = _conditional_use_dep_re.match(use_dep)
+					if m is not None:
+						flags.add(m.group(1))
+
+		self.flags = frozenset(flags)
+
+	def evaluate(self, uselist=(), masklist=(), excludeall=()):
+		"""
+		Evaluate the dependency string for the given USE flags, with
+		the same result as use_reduce.
+
+		@param uselist: List of use enabled flags
+		@type uselist: List
+		@param masklist: List of masked flags (always treated as disabled)
+		@type masklist: List
+		@param excludeall: List of flags for which negated conditionals
+			are always treated as inactive.
+		@type excludeall: List
+		@rtype: List
+		@return: The use reduced depend array
+		@raise InvalidDependString: if the dependency string is invalid
+		"""
+		flags = self.flags
+		cache_key = (flags.intersection(uselist),
+			flags.intersection(masklist), flags.intersection(excludeall))
+		result = self._results.get(cache_key)
+		if result is None:
+			result = use_reduce(self.depstr, uselist=cache_key[0],
+				masklist=cache_key[1], excludeall=cache_key[2],
+				**self._kwargs)
+			self._results[cache_key] = result
+		return _copy_dep_struct(result)
+
+def _copy_dep_struct(dep_struct):
+	return [_copy_dep_struct(x) if isinstance(x, list) else x
+		for x in dep_struct]
@@ -194,7 +194,7 @@ def _expand_new_virtuals(mysplit, edebug, mydbapi, mysettings, myroot="/",
 			# Allow the depgraph to map this atom back to the
 			# original, in order to avoid distortion in places
 			# like display or conflict resolution code.
-			virt_atom.__dict__['_orig_atom'] = x
+			object.__setattr__(virt_atom, '_orig_atom', x)
 
 			# According to GLEP 37, RDEPEND is the only dependency
 			# type that is valid for new-style virtuals. Repoman
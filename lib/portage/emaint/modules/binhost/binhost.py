@@ -1,4 +1,4 @@
-# Copyright 2005-2014 Gentoo Foundation
+# Copyright 2005-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -86,6 +86,9 @@ class BinhostHandler(object):
 		stale = set(metadata).difference(cpv_all)
 		for cpv in stale:
 			errors.append("'%s' is not in the repository" % cpv)
+		if self._bintree._pkgindex_journal_pending():
+			errors.append("Packages has journaled entries which "
+				"need to be compacted")
 		if errors:
 			return (False, errors)
 		return (True, None)
@@ -117,7 +120,7 @@ class BinhostHandler(object):
 			if not d or self._need_update(cpv, d):
 				missing.append(cpv)
 
-		if missing or stale:
+		if missing or stale or bintree._pkgindex_journal_pending():
 			from portage import locks
 			pkgindex_lock = locks.lockfile(
 				self._pkgindex_file, wantnewlockfile=1)
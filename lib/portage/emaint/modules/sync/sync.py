@@ -1,10 +1,16 @@
-# Copyright 2014-2017 Gentoo Foundation
+# Copyright 2014-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 import logging
 import os
+import re
 import sys
 
+try:
+	from urllib.parse import urlparse
+except ImportError:
+	from urlparse import urlparse
+
 import portage
 portage._internal_caller = True
 portage._sync_mode = True
@@ -226,12 +232,16 @@ class SyncRepos(object):
 		sync_manager = SyncManager(
 			self.emerge_config.target_config.settings, emergelog)
 
-		max_jobs = (self.emerge_config.opts.get('--jobs', 1)
-			if 'parallel-fetch' in self.emerge_config.
-			target_config.settings.features else 1)
+		settings = self.emerge_config.target_config.settings
+		max_jobs = None
+		if 'parallel-fetch' in settings.features:
+			max_jobs = self.emerge_config.opts.get('--jobs')
+		if max_jobs is None:
+			max_jobs = _sync_jobs(settings, 'PORTAGE_SYNC_JOBS', 1)
+		max_host_jobs = _sync_jobs(settings, 'PORTAGE_SYNC_HOST_JOBS', None)
 		sync_scheduler = SyncScheduler(emerge_config=self.emerge_config,
 			selected_repos=selected_repos, sync_manager=sync_manager,
-			max_jobs=max_jobs,
+			max_jobs=max_jobs, max_host_jobs=max_host_jobs,
 			event_loop=global_event_loop() if portage._internal_caller else
 				EventLoop(main=False))
 
@@ -319,22 +329,67 @@ class SyncRepos(object):
 		return messages
 
 
+def _sync_jobs(settings, key, default):
+	"""
+	Return the positive number of jobs that is given by the settings
+	variable key, or default if it is unset or invalid.
+	"""
+	value = settings.get(key)
+	if not value:
+		return default
+	try:
+		jobs = int(value)
+		if jobs < 1:
+			raise ValueError(value)
+	except ValueError:
+		writemsg_level("!!! Invalid %s: '%s'\n" % (key, value),
+			level=logging.ERROR, noiselevel=-1)
+		return default
+	return jobs
+
+
+def _sync_uri_host(sync_uri):
+	"""
+	Return the lower case host name of sync_uri, which may be a URI or
+	use the [user@]host:path syntax of ssh and rsync, or None if it does
+	not refer to a remote host.
+	"""
+	if not sync_uri:
+		return None
+	if '://' in sync_uri:
+		return urlparse(sync_uri).hostname or None
+	match = re.match(r'^(?:[^@/:]+@)?([^@/:]+):', sync_uri)
+	if match is None:
+		return None
+	return match.group(1).lower()
+
+
 class SyncScheduler(AsyncScheduler):
 	'''
 	Sync repos in parallel, but don't sync a given repo until all
-	of its masters have synced.
+	of its masters have synced. The max_jobs limit applies to all
+	repos, and the max_host_jobs limit applies to the repos which
+	are synced from the same host. The post-sync stage of each repo,
+	which runs its hooks and transfers its metadata, does not count
+	against these limits, so that other repos can be synced while it
+	is running.
 	'''
 	def __init__(self, **kwargs):
 		'''
 		@param emerge_config: an emerge_config instance
 		@param selected_repos: list of RepoConfig instances
 		@param sync_manager: a SyncManger instance
+		@param max_host_jobs: maximum number of concurrent syncs from
+			the same host, or None for no limit
 		'''
 		self._emerge_config = kwargs.pop('emerge_config')
 		self._selected_repos = kwargs.pop('selected_repos')
 		self._sync_manager = kwargs.pop('sync_manager')
+		self._max_host_jobs = kwargs.pop('max_host_jobs', None)
 		AsyncScheduler.__init__(self, **kwargs)
 		self._init_graph()
+		self._syncing_tasks = set()
+		self._host_jobs = {}
 		self.retvals = []
 		self.msgs = []
 
@@ -359,29 +414,45 @@ class SyncScheduler(AsyncScheduler):
 		self._hooks_repos = set()
 		self._update_leaf_nodes()
 
-	def _task_exit(self, task):
+	def _sync_exit(self, task):
 		'''
-		Remove the task from the graph, in order to expose
-		more leaf nodes.
+		Remove the repo from the graph when its sync operation has
+		completed, in order to expose more leaf nodes, and release its
+		jobs while its post-sync stage is running.
 		'''
-		self._running_tasks.discard(task)
+		if task not in self._syncing_tasks:
+			return
+		self._syncing_tasks.remove(task)
 		# Set hooks_enabled = True by default, in order to ensure
 		# that hooks will be called in a backward-compatible manner
 		# even if all sync tasks have failed.
 		hooks_enabled = True
+		if task.sync_returncode == os.EX_OK:
+			hooks_enabled = task.result[3]
+		repo = task.kwargs['repo']
+		host = _sync_uri_host(repo.sync_uri)
+		if host is not None:
+			self._host_jobs[host] -= 1
+		self._running_repos.remove(repo.name)
+		self._sync_graph.remove(repo.name)
+		self._update_leaf_nodes()
+		if hooks_enabled:
+			self._hooks_repos.add(repo.name)
+		self._schedule()
+
+	def _task_exit(self, task):
+		'''
+		Record the result when both the sync operation and the
+		post-sync stage of a repo have completed.
+		'''
+		self._sync_exit(task)
 		returncode = task.returncode
 		if task.returncode == os.EX_OK:
 			returncode, message, updatecache_flg, hooks_enabled = task.result
 			if message:
 				self.msgs.append(message)
-		repo = task.kwargs['repo'].name
-		self._running_repos.remove(repo)
-		self.retvals.append((repo, returncode))
-		self._sync_graph.remove(repo)
-		self._update_leaf_nodes()
-		if hooks_enabled:
-			self._hooks_repos.add(repo)
-		super(SyncScheduler, self)._task_exit(self)
+		self.retvals.append((task.kwargs['repo'].name, returncode))
+		super(SyncScheduler, self)._task_exit(task)
 
 	def _master_hooks(self, repo_name):
 		"""
@@ -417,15 +488,29 @@ class SyncScheduler(AsyncScheduler):
 		self._sync_graph. If a circular master relationship
 		is discovered, choose a random node to break the cycle.
 		'''
-		if self._sync_graph and not self._leaf_nodes:
-			self._leaf_nodes = [obj for obj in
-				self._sync_graph.leaf_nodes()
-				if obj not in self._running_repos]
+		self._leaf_nodes = [obj for obj in
+			self._sync_graph.leaf_nodes()
+			if obj not in self._running_repos]
+
+		if self._sync_graph and \
+			not (self._leaf_nodes or self._running_repos):
+			# If there is a circular master relationship,
+			# choose a random node to break the cycle.
+			self._leaf_nodes = [next(iter(self._sync_graph))]
 
-			if not (self._leaf_nodes or self._running_repos):
-				# If there is a circular master relationship,
-				# choose a random node to break the cycle.
-				self._leaf_nodes = [next(iter(self._sync_graph))]
+	def _next_node(self):
+		'''
+		Return the next leaf node whose host does not have
+		max_host_jobs running, or None if there is none.
+		'''
+		for node in reversed(self._leaf_nodes):
+			if self._max_host_jobs is None:
+				return node
+			host = _sync_uri_host(self._repo_map[node].sync_uri)
+			if host is None or \
+				self._host_jobs.get(host, 0) < self._max_host_jobs:
+				return node
+		return None
 
 	def _next_task(self):
 		'''
@@ -433,18 +518,36 @@ class SyncScheduler(AsyncScheduler):
 		'''
 		if not self._sync_graph:
 			raise StopIteration()
-		# If self._sync_graph is non-empty, then self._leaf_nodes
-		# is guaranteed to be non-empty, since otherwise
+		# If self._sync_graph is non-empty, then self._next_node()
+		# is guaranteed to return a node, since otherwise
 		# _can_add_job would have returned False and prevented
 		# _next_task from being immediately called.
-		node = self._leaf_nodes.pop()
+		node = self._next_node()
+		self._leaf_nodes.remove(node)
 		self._running_repos.add(node)
 		self._update_leaf_nodes()
+		repo = self._repo_map[node]
+		host = _sync_uri_host(repo.sync_uri)
+		if host is not None:
+			self._host_jobs[host] = self._host_jobs.get(host, 0) + 1
 
-		return self._sync_manager.sync_async(
+		task = self._sync_manager.sync_async(
 			emerge_config=self._emerge_config,
-			repo=self._repo_map[node],
+			repo=repo,
 			master_hooks=self._master_hooks(node))
+		task.sync_exit_listener = self._sync_exit
+		self._syncing_tasks.add(task)
+		return task
+
+	def _running_job_count(self):
+		'''
+		Only count tasks whose sync operation is running, since the
+		post-sync stage does not count against the job limits.
+		'''
+		return len(self._syncing_tasks)
+
+	def _is_work_scheduled(self):
+		return bool(self._running_tasks)
 
 	def _can_add_job(self):
 		'''
@@ -452,7 +555,8 @@ class SyncScheduler(AsyncScheduler):
 		'''
 		if not AsyncScheduler._can_add_job(self):
 			return False
-		return bool(self._leaf_nodes) and not self._terminated.is_set()
+		return self._next_node() is not None and \
+			not self._terminated.is_set()
 
 	def _keep_scheduling(self):
 		'''
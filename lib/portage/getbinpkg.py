@@ -891,6 +891,13 @@ class PackageIndex(object):
 		self.header.update(self._readpkgindex(pkgfile, pkg_entry=False))
 
 	def readBody(self, pkgfile):
+		self.packages.extend(self.iterBody(pkgfile))
+
+	def iterBody(self, pkgfile):
+		"""
+		Generate package entries from pkgfile one at a time, so that
+		they do not have to be held in memory together.
+		"""
 		while True:
 			d = self._readpkgindex(pkgfile)
 			if not d:
@@ -898,17 +905,20 @@ class PackageIndex(object):
 			mycpv = d.get("CPV")
 			if not mycpv:
 				continue
-			if self._default_pkg_data:
-				for k, v in self._default_pkg_data.items():
+			self._apply_pkg_defaults(d)
+			yield d
+
+	def _apply_pkg_defaults(self, d):
+		if self._default_pkg_data:
+			for k, v in self._default_pkg_data.items():
+				d.setdefault(k, v)
+		if self._inherited_keys:
+			for k in self._inherited_keys:
+				v = self.header.get(k)
+				if v is not None:
 					d.setdefault(k, v)
-			if self._inherited_keys:
-				for k in self._inherited_keys:
-					v = self.header.get(k)
-					if v is not None:
-						d.setdefault(k, v)
-			self.packages.append(d)
 
-	def write(self, pkgfile):
+	def writeHeader(self, pkgfile):
 		if self.modified:
 			self.header["TIMESTAMP"] = str(long(time.time()))
 			self.header["PACKAGES"] = str(len(self.packages))
@@ -916,6 +926,9 @@ class PackageIndex(object):
 		keys.sort()
 		self._writepkgindex(pkgfile, [(k, self.header[k]) \
 			for k in keys if self.header[k]])
+
+	def write(self, pkgfile):
+		self.writeHeader(pkgfile)
 		for metadata in sorted(self.packages,
 			key=portage.util.cmp_sort_key(_cmp_cpv)):
 			metadata = metadata.copy()
@@ -14,9 +14,12 @@ import warnings
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum:get_valid_checksum_keys,perform_multiple_checksums,' + \
-		'verify_all,_apply_hash_filter,_filter_unaccelarated_hashes',
+		'verify_all,_apply_hash_filter,_filter_unaccelarated_hashes,' + \
+		'_hashes_hold_gil',
 	'portage.repository.config:_find_invalid_path_char',
 	'portage.util:write_atomic,writemsg_level',
+	'portage.util.cpuinfo:get_cpu_count',
+	'portage.util._async.map_concurrent:map_concurrent',
 )
 
 from portage import os
@@ -128,13 +131,14 @@ class Manifest(object):
 	def __init__(self, pkgdir, distdir=None, fetchlist_dict=None,
 		manifest1_compat=DeprecationWarning, from_scratch=False, thin=False,
 		allow_missing=False, allow_create=True, hashes=None, required_hashes=None,
-		find_invalid_path_char=None, strict_misc_digests=True):
+		find_invalid_path_char=None, strict_misc_digests=True, max_jobs=None):
 		""" Create new Manifest instance for package in pkgdir.
 		    Do not parse Manifest file if from_scratch == True (only for internal use)
 			The fetchlist_dict parameter is required only for generation of
 			a Manifest (not needed for parsing and checking sums).
 			If thin is specified, then the manifest carries only info for
-			distfiles."""
+			distfiles. The max_jobs parameter limits the number of files that
+			are hashed concurrently (defaults to the number of CPUs)."""
 
 		if manifest1_compat is not DeprecationWarning:
 			warnings.warn("The manifest1_compat parameter of the "
@@ -179,6 +183,17 @@ class Manifest(object):
 		self.allow_missing = allow_missing
 		self.allow_create = allow_create
 		self.strict_misc_digests = strict_misc_digests
+		self.max_jobs = max_jobs
+
+	def _hash_files(self, paths, hashes):
+		"""
+		Compute the given hashes for each file in paths, concurrently.
+		Returns a list of (digests, exception) tuples in the same order.
+		"""
+		max_jobs = self.max_jobs or get_cpu_count()
+		return map_concurrent(perform_multiple_checksums,
+			[(path, hashes) for path in paths], max_jobs,
+			fork=_hashes_hold_gil(hashes))
 
 	def getFullname(self):
 		""" Returns the absolute path to the Manifest file for this instance """
@@ -471,7 +486,8 @@ class Manifest(object):
 			allow_create=self.allow_create, hashes=self.hashes,
 			required_hashes=self.required_hashes,
 			find_invalid_path_char=self._find_invalid_path_char,
-			strict_misc_digests=self.strict_misc_digests)
+			strict_misc_digests=self.strict_misc_digests,
+			max_jobs=self.max_jobs)
 		pn = os.path.basename(self.pkgdir.rstrip(os.path.sep))
 		cat = self._pkgdir_category()
 
@@ -496,6 +512,7 @@ class Manifest(object):
 		required_hash_types = set()
 		required_hash_types.add("size")
 		required_hash_types.update(self.required_hashes)
+		unhashed = []
 		for f in distlist:
 			fname = os.path.join(self.distdir, f)
 			mystat = None
@@ -512,11 +529,15 @@ class Manifest(object):
 				distfilehashes[f]["size"] == mystat.st_size)):
 				self.fhashdict["DIST"][f] = distfilehashes[f]
 			else:
-				try:
-					self.fhashdict["DIST"][f] = perform_multiple_checksums(fname, self.hashes)
-				except FileNotFound:
-					if f in requiredDistfiles:
-						raise
+				unhashed.append(f)
+
+		results = self._hash_files(
+			[os.path.join(self.distdir, f) for f in unhashed], self.hashes)
+		for f, (digests, e) in zip(unhashed, results):
+			if e is None:
+				self.fhashdict["DIST"][f] = digests
+			elif not isinstance(e, FileNotFound) or f in requiredDistfiles:
+				raise e
 
 	def _is_cpv(self, cat, pn, filename):
 		if not filename.endswith(".ebuild"):
@@ -552,6 +573,8 @@ class Manifest(object):
 
 	def _update_thick_pkgdir(self, cat, pn, pkgdir):
 		cpvlist = []
+		# (type, name, path) tuples for files that need to be hashed
+		unhashed = []
 		for pkgdir, pkgdir_dirs, pkgdir_files in os.walk(pkgdir):
 			break
 		for f in pkgdir_files:
@@ -571,7 +594,7 @@ class Manifest(object):
 				mytype = "MISC"
 			else:
 				continue
-			self.fhashdict[mytype][f] = perform_multiple_checksums(self.pkgdir+f, self.hashes)
+			unhashed.append((mytype, f, self.pkgdir+f))
 		recursive_files = []
 
 		pkgdir = self.pkgdir
@@ -589,8 +612,15 @@ class Manifest(object):
 			if self._find_invalid_path_char(f) != -1 or \
 				not manifest2AuxfileFilter(f):
 				continue
-			self.fhashdict["AUX"][f] = perform_multiple_checksums(
-				os.path.join(self.pkgdir, "files", f.lstrip(os.sep)), self.hashes)
+			unhashed.append(("AUX", f,
+				os.path.join(self.pkgdir, "files", f.lstrip(os.sep))))
+
+		results = self._hash_files(
+			[path for mytype, f, path in unhashed], self.hashes)
+		for (mytype, f, path), (digests, e) in zip(unhashed, results):
+			if e is not None:
+				raise e
+			self.fhashdict[mytype][f] = digests
 		return cpvlist
 
 	def _pkgdir_category(self):
@@ -606,27 +636,53 @@ class Manifest(object):
 		return absname	
 	
 	def checkAllHashes(self, ignoreMissingFiles=False):
-		for t in MANIFEST2_IDENTIFIERS:
-			self.checkTypeHashes(t, ignoreMissingFiles=ignoreMissingFiles)
+		self._check_hashes([(t, f) for t in MANIFEST2_IDENTIFIERS
+			for f in self.fhashdict[t]], ignoreMissingFiles, None)
 	
 	def checkTypeHashes(self, idtype, ignoreMissingFiles=False, hash_filter=None):
-		for f in self.fhashdict[idtype]:
-			self.checkFileHashes(idtype, f, ignoreMissing=ignoreMissingFiles,
-				hash_filter=hash_filter)
-	
-	def checkFileHashes(self, ftype, fname, ignoreMissing=False, hash_filter=None):
+		self._check_hashes([(idtype, f) for f in self.fhashdict[idtype]],
+			ignoreMissingFiles, hash_filter)
+
+	def _check_hashes(self, files, ignoreMissing, hash_filter):
+		"""
+		Verify the given (type, name) files concurrently, and handle
+		the results in order, like checkFileHashes.
+		"""
+		args_list = []
+		for ftype, fname in files:
+			args_list.append((self._getAbsname(ftype, fname),
+				self._get_check_digests(ftype, fname, hash_filter)))
+		max_jobs = self.max_jobs or get_cpu_count()
+		results = map_concurrent(verify_all, args_list, max_jobs,
+			fork=_hashes_hold_gil(set().union(
+			*(digests for path, digests in args_list))))
+		for (ftype, fname), result in zip(files, results):
+			self._check_file_hashes_result(ftype, fname, result,
+				ignoreMissing)
+
+	def _get_check_digests(self, ftype, fname, hash_filter):
 		digests = _filter_unaccelarated_hashes(self.fhashdict[ftype][fname])
 		if hash_filter is not None:
 			digests = _apply_hash_filter(digests, hash_filter)
-		try:
-			ok, reason = verify_all(self._getAbsname(ftype, fname), digests)
-			if not ok:
-				raise DigestException(tuple([self._getAbsname(ftype, fname)]+list(reason)))
-			return ok, reason
-		except FileNotFound as e:
-			if not ignoreMissing:
-				raise
+		return digests
+
+	def _check_file_hashes_result(self, ftype, fname, result, ignoreMissing):
+		value, e = result
+		if e is not None:
+			if not isinstance(e, FileNotFound) or not ignoreMissing:
+				raise e
 			return False, _("File Not Found: '%s'") % str(e)
+		ok, reason = value
+		if not ok:
+			raise DigestException(tuple([self._getAbsname(ftype, fname)]+list(reason)))
+		return ok, reason
+	
+	def checkFileHashes(self, ftype, fname, ignoreMissing=False, hash_filter=None):
+		digests = self._get_check_digests(ftype, fname, hash_filter)
+		return self._check_file_hashes_result(ftype, fname,
+			map_concurrent(verify_all,
+			[(self._getAbsname(ftype, fname), digests)], 1)[0],
+			ignoreMissing)
 
 	def checkCpvHashes(self, cpv, checkDistfiles=True, onlyDistfiles=False, checkMiscfiles=False):
 		""" check the hashes for all files associated to the given cpv, include all
@@ -174,7 +174,10 @@ environ_filter += [
 	"PORTAGE_REPO_DUPLICATE_WARN",
 	"PORTAGE_RO_DISTDIRS",
 	"PORTAGE_RSYNC_EXTRA_OPTS", "PORTAGE_RSYNC_OPTS",
-	"PORTAGE_RSYNC_RETRIES", "PORTAGE_SSH_OPTS", "PORTAGE_SYNC_STALE",
+	"PORTAGE_RSYNC_RETRIES",
+	"PORTAGE_SCHEDULER_CPU_BUDGET", "PORTAGE_SCHEDULER_MEMORY_BUDGET",
+	"PORTAGE_SSH_OPTS", "PORTAGE_SYNC_HOST_JOBS", "PORTAGE_SYNC_JOBS",
+	"PORTAGE_SYNC_STALE",
 	"PORTAGE_USE",
 	"PORTAGE_LOGDIR", "PORTAGE_LOGDIR_CLEAN",
 	"QUICKPKG_DEFAULT_OPTS", "REPOMAN_DEFAULT_OPTS",
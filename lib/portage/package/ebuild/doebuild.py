@@ -575,6 +575,104 @@ _doebuild_commands_without_builddir = (
 	'fetch', 'fetchall', 'help', 'manifest'
 )
 
+def _check_ebuild_manifest(myebuild, mydo, mysettings, tree):
+	"""
+	For FEATURES=strict, verify the digest of the ebuild, and verify
+	that all ebuilds in the same directory are listed in the Manifest.
+
+	@rtype: tuple
+	@return: (returncode, manifest) where manifest is None if it has
+		not been loaded
+	"""
+	global _doebuild_manifest_cache
+	features = mysettings.features
+	pkgdir = os.path.dirname(myebuild)
+	manifest_path = os.path.join(pkgdir, "Manifest")
+	if tree == "porttree":
+		repo_config = mysettings.repositories.get_repo_for_location(
+			os.path.dirname(os.path.dirname(pkgdir)))
+	else:
+		repo_config = None
+
+	mf = None
+	if "strict" in features and \
+		"digest" not in features and \
+		tree == "porttree" and \
+		not repo_config.thin_manifest and \
+		mydo not in ("digest", "manifest", "help") and \
+		not portage._doebuild_manifest_exempt_depend and \
+		not (repo_config.allow_missing_manifest and not os.path.exists(manifest_path)):
+		# Always verify the ebuild checksums before executing it.
+		global _doebuild_broken_ebuilds
+
+		if myebuild in _doebuild_broken_ebuilds:
+			return 1, None
+
+		# Avoid checking the same Manifest several times in a row during a
+		# regen with an empty cache.
+		if _doebuild_manifest_cache is None or \
+			_doebuild_manifest_cache.getFullname() != manifest_path:
+			_doebuild_manifest_cache = None
+			if not os.path.exists(manifest_path):
+				out = portage.output.EOutput()
+				out.eerror(_("Manifest not found for '%s'") % (myebuild,))
+				_doebuild_broken_ebuilds.add(myebuild)
+				return 1, None
+			mf = repo_config.load_manifest(pkgdir, mysettings["DISTDIR"])
+
+		else:
+			mf = _doebuild_manifest_cache
+
+		try:
+			mf.checkFileHashes("EBUILD", os.path.basename(myebuild))
+		except KeyError:
+			if not (mf.allow_missing and
+				os.path.basename(myebuild) not in mf.fhashdict["EBUILD"]):
+				out = portage.output.EOutput()
+				out.eerror(_("Missing digest for '%s'") % (myebuild,))
+				_doebuild_broken_ebuilds.add(myebuild)
+				return 1, None
+		except FileNotFound:
+			out = portage.output.EOutput()
+			out.eerror(_("A file listed in the Manifest "
+				"could not be found: '%s'") % (myebuild,))
+			_doebuild_broken_ebuilds.add(myebuild)
+			return 1, None
+		except DigestException as e:
+			out = portage.output.EOutput()
+			out.eerror(_("Digest verification failed:"))
+			out.eerror("%s" % e.value[0])
+			out.eerror(_("Reason: %s") % e.value[1])
+			out.eerror(_("Got: %s") % e.value[2])
+			out.eerror(_("Expected: %s") % e.value[3])
+			_doebuild_broken_ebuilds.add(myebuild)
+			return 1, None
+
+		if mf.getFullname() in _doebuild_broken_manifests:
+			return 1, None
+
+		if mf is not _doebuild_manifest_cache and not mf.allow_missing:
+
+			# Make sure that all of the ebuilds are
+			# actually listed in the Manifest.
+			for f in os.listdir(pkgdir):
+				pf = None
+				if f[-7:] == '.ebuild':
+					pf = f[:-7]
+				if pf is not None and not mf.hasFile("EBUILD", f):
+					f = os.path.join(pkgdir, f)
+					if f not in _doebuild_broken_ebuilds:
+						out = portage.output.EOutput()
+						out.eerror(_("A file is not listed in the "
+							"Manifest: '%s'") % (f,))
+					_doebuild_broken_manifests.add(manifest_path)
+					return 1, None
+
+		# We cache it only after all above checks succeed.
+		_doebuild_manifest_cache = mf
+
+	return os.EX_OK, mf
+
 def doebuild(myebuild, mydo, _unused=DeprecationWarning, settings=None, debug=0, listonly=0,
 	fetchonly=0, cleanup=0, dbkey=DeprecationWarning, use_cache=1, fetchall=0, tree=None,
 	mydbapi=None, vartree=None, prev_mtimes=None,
@@ -716,91 +814,9 @@ def doebuild(myebuild, mydo, _unused=DeprecationWarning, settings=None, debug=0,
 			noiselevel=-1)
 		return 1
 
-	global _doebuild_manifest_cache
-	pkgdir = os.path.dirname(myebuild)
-	manifest_path = os.path.join(pkgdir, "Manifest")
-	if tree == "porttree":
-		repo_config = mysettings.repositories.get_repo_for_location(
-			os.path.dirname(os.path.dirname(pkgdir)))
-	else:
-		repo_config = None
-
-	mf = None
-	if "strict" in features and \
-		"digest" not in features and \
-		tree == "porttree" and \
-		not repo_config.thin_manifest and \
-		mydo not in ("digest", "manifest", "help") and \
-		not portage._doebuild_manifest_exempt_depend and \
-		not (repo_config.allow_missing_manifest and not os.path.exists(manifest_path)):
-		# Always verify the ebuild checksums before executing it.
-		global _doebuild_broken_ebuilds
-
-		if myebuild in _doebuild_broken_ebuilds:
-			return 1
-
-		# Avoid checking the same Manifest several times in a row during a
-		# regen with an empty cache.
-		if _doebuild_manifest_cache is None or \
-			_doebuild_manifest_cache.getFullname() != manifest_path:
-			_doebuild_manifest_cache = None
-			if not os.path.exists(manifest_path):
-				out = portage.output.EOutput()
-				out.eerror(_("Manifest not found for '%s'") % (myebuild,))
-				_doebuild_broken_ebuilds.add(myebuild)
-				return 1
-			mf = repo_config.load_manifest(pkgdir, mysettings["DISTDIR"])
-
-		else:
-			mf = _doebuild_manifest_cache
-
-		try:
-			mf.checkFileHashes("EBUILD", os.path.basename(myebuild))
-		except KeyError:
-			if not (mf.allow_missing and
-				os.path.basename(myebuild) not in mf.fhashdict["EBUILD"]):
-				out = portage.output.EOutput()
-				out.eerror(_("Missing digest for '%s'") % (myebuild,))
-				_doebuild_broken_ebuilds.add(myebuild)
-				return 1
-		except FileNotFound:
-			out = portage.output.EOutput()
-			out.eerror(_("A file listed in the Manifest "
-				"could not be found: '%s'") % (myebuild,))
-			_doebuild_broken_ebuilds.add(myebuild)
-			return 1
-		except DigestException as e:
-			out = portage.output.EOutput()
-			out.eerror(_("Digest verification failed:"))
-			out.eerror("%s" % e.value[0])
-			out.eerror(_("Reason: %s") % e.value[1])
-			out.eerror(_("Got: %s") % e.value[2])
-			out.eerror(_("Expected: %s") % e.value[3])
-			_doebuild_broken_ebuilds.add(myebuild)
-			return 1
-
-		if mf.getFullname() in _doebuild_broken_manifests:
-			return 1
-
-		if mf is not _doebuild_manifest_cache and not mf.allow_missing:
-
-			# Make sure that all of the ebuilds are
-			# actually listed in the Manifest.
-			for f in os.listdir(pkgdir):
-				pf = None
-				if f[-7:] == '.ebuild':
-					pf = f[:-7]
-				if pf is not None and not mf.hasFile("EBUILD", f):
-					f = os.path.join(pkgdir, f)
-					if f not in _doebuild_broken_ebuilds:
-						out = portage.output.EOutput()
-						out.eerror(_("A file is not listed in the "
-							"Manifest: '%s'") % (f,))
-					_doebuild_broken_manifests.add(manifest_path)
-					return 1
-
-		# We cache it only after all above checks succeed.
-		_doebuild_manifest_cache = mf
+	rval, mf = _check_ebuild_manifest(myebuild, mydo, mysettings, tree)
+	if rval != os.EX_OK:
+		return rval
 
 	logfile=None
 	builddir_lock = None
@@ -42,6 +42,7 @@ from portage.output import colorize, EOutput
 from portage.util import apply_recursive_permissions, \
 	apply_secpass_permissions, ensure_dirs, grabdict, shlex_split, \
 	varexpand, writemsg, writemsg_level, writemsg_stdout
+from portage.util._DigestCache import get_digest_cache
 from portage.process import spawn
 
 _userpriv_spawn_kwargs = (
@@ -176,12 +177,15 @@ def _checksum_failure_temp_file(distdir, basename):
 	os.rename(filename, temp_filename)
 	return temp_filename
 
-def _check_digests(filename, digests, show_errors=1):
+def _check_digests(filename, digests, show_errors=1, digest_cache=None):
 	"""
 	Check digests and display a message if an error occurs.
 	@return True if all digests match, False otherwise.
 	"""
-	verified_ok, reason = verify_all(filename, digests)
+	if digest_cache is None:
+		verified_ok, reason = verify_all(filename, digests)
+	else:
+		verified_ok, reason = digest_cache.verify_all(filename, digests)
 	if not verified_ok:
 		if show_errors:
 			writemsg(_("!!! Previously fetched"
@@ -194,7 +198,8 @@ def _check_digests(filename, digests, show_errors=1):
 		return False
 	return True
 
-def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None):
+def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None,
+	digest_cache=None):
 	"""
 	@return a tuple of (match, stat_obj) where match is True if filename
 	matches all given digests (if any) and stat_obj is a stat result, or
@@ -223,7 +228,8 @@ def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None):
 		digests = _filter_unaccelarated_hashes(digests)
 		if hash_filter is not None:
 			digests = _apply_hash_filter(digests, hash_filter)
-		if _check_digests(filename, digests, show_errors=show_errors):
+		if _check_digests(filename, digests, show_errors=show_errors,
+			digest_cache=digest_cache):
 			eout.ebegin("%s %s ;-)" % (os.path.basename(filename),
 				" ".join(sorted(digests))))
 			eout.eend(0)
@@ -369,6 +375,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	hash_filter = _hash_filter(mysettings.get("PORTAGE_CHECKSUM_FILTER", ""))
 	if hash_filter.transparent:
 		hash_filter = None
+	digest_cache = get_digest_cache(mysettings)
 	skip_manifest = mysettings.get("EBUILD_SKIP_MANIFEST") == "1"
 	if skip_manifest:
 		allow_missing_digests = True
@@ -660,7 +667,8 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 				eout = EOutput()
 				eout.quiet = mysettings.get("PORTAGE_QUIET") == "1"
 				match, mystat = _check_distfile(
-					myfile_path, pruned_digests, eout, hash_filter=hash_filter)
+					myfile_path, pruned_digests, eout, hash_filter=hash_filter,
+					digest_cache=digest_cache)
 				if match:
 					# Skip permission adjustment for symlinks, since we don't
 					# want to modify anything outside of the primary DISTDIR,
@@ -732,7 +740,8 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 					for x in ro_distdirs:
 						filename = os.path.join(x, myfile)
 						match, mystat = _check_distfile(
-							filename, pruned_digests, eout, hash_filter=hash_filter)
+							filename, pruned_digests, eout, hash_filter=hash_filter,
+							digest_cache=digest_cache)
 						if match:
 							readonly_file = filename
 							break
@@ -822,7 +831,11 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 							digests = _filter_unaccelarated_hashes(mydigests[myfile])
 							if hash_filter is not None:
 								digests = _apply_hash_filter(digests, hash_filter)
-							verified_ok, reason = verify_all(myfile_path, digests)
+							if digest_cache is None:
+								verified_ok, reason = verify_all(myfile_path, digests)
+							else:
+								verified_ok, reason = digest_cache.verify_all(
+									myfile_path, digests)
 							if not verified_ok:
 								writemsg(_("!!! Previously fetched"
 									" file: '%s'\n") % myfile, noiselevel=-1)
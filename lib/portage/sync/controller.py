@@ -1,4 +1,4 @@
-# Copyright 2014-2017 Gentoo Foundation
+# Copyright 2014-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import print_function
@@ -128,12 +128,28 @@ class SyncManager(object):
 		self.settings, self.trees, self.mtimedb = emerge_config
 		self.xterm_titles = "notitles" not in self.settings.features
 		self.portdb = self.trees[self.settings['EROOT']]['porttree'].dbapi
-		return SyncRepo(sync_task=AsyncFunction(target=self.sync,
+		return SyncRepo(sync_task=AsyncFunction(target=self._sync,
 			kwargs=dict(emerge_config=emerge_config, repo=repo,
 			master_hooks=master_hooks)),
+			post_sync_task=AsyncFunction(target=self.perform_post_sync_hook,
+			args=(repo.name, repo.sync_uri, repo.location)),
 			sync_callback=self._sync_callback)
 
 	def sync(self, emerge_config=None, repo=None, master_hooks=True):
+		exitcode, message, updatecache_flg, hooks_enabled, post_sync = \
+			self._sync(emerge_config=emerge_config, repo=repo,
+			master_hooks=master_hooks)
+		if post_sync:
+			self.perform_post_sync_hook(
+				repo.name, repo.sync_uri, repo.location)
+		return exitcode, message, updatecache_flg, hooks_enabled
+
+	def _sync(self, emerge_config=None, repo=None, master_hooks=True):
+		"""
+		Sync repo, but do not run its repo.postsync.d hooks. In addition
+		to the values that are returned by sync, return True if the hooks
+		should be run, and False otherwise.
+		"""
 		self.callback = None
 		self.repo = repo
 		self.exitcode = 1
@@ -144,11 +160,12 @@ class SyncManager(object):
 		else:
 			msg = "\n%s: Sync module '%s' is not an installed/known type'\n" \
 				% (bad("ERROR"), repo.sync_type)
-			return self.exitcode, msg, self.updatecache_flg, hooks_enabled
+			return (self.exitcode, msg, self.updatecache_flg,
+				hooks_enabled, False)
 
 		rval = self.pre_sync(repo)
 		if rval != os.EX_OK:
-			return rval, None, self.updatecache_flg, hooks_enabled
+			return rval, None, self.updatecache_flg, hooks_enabled, False
 
 		# need to pass the kwargs dict to the modules
 		# so they are available if needed.
@@ -167,13 +184,13 @@ class SyncManager(object):
 		taskmaster = TaskHandler(callback=self.do_callback)
 		taskmaster.run_tasks(tasks, func, status, options=task_opts)
 
-		if (master_hooks or self.updatecache_flg or
-			not repo.sync_hooks_only_on_change):
+		post_sync = (master_hooks or self.updatecache_flg or
+			not repo.sync_hooks_only_on_change)
+		if post_sync:
 			hooks_enabled = True
-			self.perform_post_sync_hook(
-				repo.name, repo.sync_uri, repo.location)
 
-		return self.exitcode, None, self.updatecache_flg, hooks_enabled
+		return (self.exitcode, None, self.updatecache_flg,
+			hooks_enabled, post_sync)
 
 
 	def do_callback(self, result):
@@ -343,7 +360,8 @@ class SyncManager(object):
 	def _sync_callback(self, proc):
 		"""
 		This is called in the parent process, serially, for each of the
-		sync jobs when they complete. Some cache backends such as sqlite
+		sync jobs when they complete, after their repo.postsync.d hooks
+		have been run. Some cache backends such as sqlite
 		may require that cache access be performed serially in the
 		parent process like this.
 		"""
@@ -368,16 +386,24 @@ class SyncManager(object):
 
 class SyncRepo(CompositeTask):
 	"""
-	Encapsulates a sync operation and the callback which executes afterwards,
-	so both can be considered as a single composite task. This is useful
-	since we don't want to consider a particular repo's sync operation as
-	complete until after the callback has executed (bug 562264).
+	Encapsulates a sync operation and the post-sync stage which executes
+	afterwards, so both can be considered as a single composite task. This
+	is useful since we don't want to consider a particular repo's sync
+	operation as complete until after the post-sync stage has executed
+	(bug 562264). The post-sync stage runs the post_sync_task, if the sync
+	operation has enabled repo.postsync.d hooks, followed by the
+	sync_callback.
+
+	If sync_exit_listener is set, then it is called when the sync operation
+	itself has completed, so that a scheduler can start other sync
+	operations while the post-sync stage is running.
 
 	The kwargs and result properties expose attributes that are accessed
 	by SyncScheduler.
 	"""
 
-	__slots__ = ('sync_task', 'sync_callback')
+	__slots__ = ('post_sync_task', 'sync_callback', 'sync_exit_listener',
+		'sync_task')
 
 	@property
 	def kwargs(self):
@@ -385,14 +411,41 @@ class SyncRepo(CompositeTask):
 
 	@property
 	def result(self):
-		return self.sync_task.result
+		result = self.sync_task.result
+		if result is not None:
+			# Discard the value that SyncManager._sync returns in order
+			# to indicate whether hooks should be run.
+			result = result[:4]
+		return result
+
+	@property
+	def sync_returncode(self):
+		"""
+		The returncode of the sync operation, which is available before
+		the post-sync stage has completed.
+		"""
+		return self.sync_task.returncode
 
 	def _start(self):
 		self._start_task(self.sync_task, self._sync_task_exit)
 
 	def _sync_task_exit(self, sync_task):
 		self._current_task = None
-		self.returncode = sync_task.returncode
-		self.sync_callback(self.sync_task)
-		self._async_wait()
+		if self.sync_exit_listener is not None:
+			self.sync_exit_listener(self)
+		if (self.post_sync_task is not None and not self.cancelled and
+			sync_task.returncode == os.EX_OK and
+			len(sync_task.result) > 4 and sync_task.result[4]):
+			self._start_task(self.post_sync_task, self._post_sync_task_exit)
+		else:
+			self._post_sync_task_exit(None)
 
+	def _post_sync_task_exit(self, post_sync_task):
+		self._current_task = None
+		# Hooks report their own failures, and do not affect the
+		# returncode, like when SyncManager.sync runs them.
+		self.returncode = self.sync_task.returncode
+		if self.cancelled and self.returncode == os.EX_OK:
+			self.returncode = self._cancelled_returncode
+		self.sync_callback(self)
+		self._async_wait()
@@ -0,0 +1,2 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
@@ -0,0 +1,66 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+import portage
+from portage.tests import TestCase
+
+class SqliteCacheTestCase(TestCase):
+
+	def _metadata(self, cpv, description):
+		metadata = dict((k, "") for k in portage.auxdbkeys)
+		metadata.update({
+			"DESCRIPTION": description,
+			"EAPI": "7",
+			"SLOT": "0",
+			"_eclasses_": {},
+			"_md5_": "d41d8cd98f00b204e9800998ecf8427e",
+		})
+		return metadata
+
+	def testSqliteCache(self):
+		try:
+			from portage.cache.sqlite import database
+			import sqlite3
+		except ImportError:
+			self.skipTest("sqlite3 is not available")
+
+		tempdir = tempfile.mkdtemp()
+		try:
+			writer = database(tempdir, "test_repo", portage.auxdbkeys)
+			# egencache only batches writes for caches with bulk_writes.
+			self.assertEqual(writer.bulk_writes, True)
+			cpvs = ["dev-libs/A-%d" % i for i in range(1, 101)]
+			writer.update_many((cpv, self._metadata(cpv, "'%s'" % cpv))
+				for cpv in cpvs)
+
+			cursor = writer._db_cursor
+			cursor.execute("PRAGMA journal_mode")
+			self.assertEqual(cursor.fetchone()[0].lower(), "wal")
+
+			self.assertEqual(sorted(writer), sorted(cpvs))
+			self.assertEqual("dev-libs/A-1" in writer, True)
+			self.assertEqual("dev-libs/B-1" in writer, False)
+			self.assertEqual(writer["dev-libs/A-7"]["DESCRIPTION"],
+				"'dev-libs/A-7'")
+			self.assertEqual(writer["dev-libs/A-7"]["_md5_"],
+				"d41d8cd98f00b204e9800998ecf8427e")
+
+			# A reader is not blocked by an uncommitted write.
+			reader = database(tempdir, "test_repo", portage.auxdbkeys,
+				readonly=True)
+			writer.sync(rate=1000)
+			writer["dev-libs/A-7"] = self._metadata("dev-libs/A-7", "new")
+			del writer["dev-libs/A-8"]
+			self.assertEqual(reader["dev-libs/A-7"]["DESCRIPTION"],
+				"'dev-libs/A-7'")
+			self.assertEqual("dev-libs/A-8" in reader, True)
+
+			writer.commit()
+			self.assertEqual(reader["dev-libs/A-7"]["DESCRIPTION"], "new")
+			self.assertEqual("dev-libs/A-8" in reader, False)
+			self.assertRaises(KeyError, reader.__getitem__, "dev-libs/A-8")
+		finally:
+			shutil.rmtree(tempdir)
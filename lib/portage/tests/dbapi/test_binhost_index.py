@@ -0,0 +1,133 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import functools
+import threading
+
+from portage.dbapi._PackagesSidecar import _LazyPackageEntry
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class _BinhostState(object):
+
+	def __init__(self, content):
+		self.content = content
+		self.requests = []
+		self.concurrent = True
+		self.not_modified = 0
+		self.lock = threading.Lock()
+		self.all_requested = threading.Event()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+	def __init__(self, state, *args, **kwargs):
+		self.state = state
+		BaseHTTPRequestHandler.__init__(self, *args, **kwargs)
+
+	def do_GET(self):
+		state = self.state
+		doc = state.content.get(self.path)
+		if doc is None:
+			self.send_error(404, "File not found")
+			return
+
+		with state.lock:
+			state.requests.append(self.path)
+			if len(state.requests) % len(state.content) == 0:
+				state.all_requested.set()
+
+		# Respond only after all binhosts have been requested, which
+		# happens in time only if the requests are concurrent.
+		if not state.all_requested.wait(10):
+			state.concurrent = False
+
+		etag = '"%s"' % len(doc)
+		if self.headers.get("If-None-Match") == etag:
+			with state.lock:
+				state.not_modified += 1
+			self.send_response(304)
+			self.end_headers()
+			return
+
+		self.send_response(200)
+		self.send_header("Content-type", "text/plain")
+		self.send_header("Content-Length", len(doc))
+		self.send_header("ETag", etag)
+		self.end_headers()
+		self.wfile.write(doc)
+
+	def log_message(self, fmt, *args):
+		pass
+
+
+class BinhostIndexTestCase(TestCase):
+
+	def _packages(self, cpv, timestamp):
+		return ("VERSION: 0\nTIMESTAMP: %s\n\n"
+			"CPV: %s\nEAPI: 7\nSLOT: 0\nUSE: foo\n\n" % (timestamp, cpv)).encode("utf_8")
+
+	def testConcurrentBinhostIndex(self):
+		state = _BinhostState({
+			"/a/Packages": self._packages("dev-libs/A-1", 1000),
+			"/b/Packages": self._packages("dev-libs/B-1", 2000),
+		})
+		httpd = _ThreadingHTTPServer(("127.0.0.1", 0),
+			functools.partial(_Handler, state))
+		server_thread = threading.Thread(target=httpd.serve_forever)
+		server_thread.daemon = True
+		server_thread.start()
+
+		binhost = "http://127.0.0.1:%s" % httpd.server_port
+		playground = ResolverPlayground(user_config={
+			"make.conf": ('PORTAGE_BINHOST="%s/a %s/b"' % (binhost, binhost),),
+		})
+		try:
+			bintree = playground.trees[playground.eroot]["bintree"]
+			bintree.populate(getbinpkgs=True)
+			self.assertEqual(state.concurrent, True)
+			self.assertEqual(state.not_modified, 0)
+			self.assertEqual(sorted(bintree.dbapi.cpv_all()),
+				["dev-libs/A-1", "dev-libs/B-1"])
+			self.assertEqual(sorted((d["CPV"], d["PKGINDEX_URI"])
+				for d in bintree._remotepkgs.values()),
+				[("dev-libs/A-1", binhost + "/a/Packages"),
+				("dev-libs/B-1", binhost + "/b/Packages")])
+
+			# The ETag of the cached index is used for a conditional
+			# request, and the cached index is used if it matches.
+			state.all_requested.clear()
+			bintree.populated = False
+			bintree.populate(getbinpkgs=True)
+			self.assertEqual(state.concurrent, True)
+			self.assertEqual(len(state.requests), 4)
+			self.assertEqual(state.not_modified, 2)
+			self.assertEqual(sorted(bintree.dbapi.cpv_all()),
+				["dev-libs/A-1", "dev-libs/B-1"])
+
+			# The cached copies are now loaded through their sidecar
+			# indexes, and entries are parsed on demand.
+			state.all_requested.clear()
+			bintree.populated = False
+			bintree.populate(getbinpkgs=True)
+			self.assertEqual(state.not_modified, 4)
+			for d in bintree._remotepkgs.values():
+				self.assertTrue(isinstance(d, _LazyPackageEntry))
+			self.assertEqual(bintree.dbapi.aux_get("dev-libs/B-1",
+				["EAPI", "SLOT", "USE"]), ["7", "0", "foo"])
+		finally:
+			playground.cleanup()
+			httpd.shutdown()
+			httpd.server_close()
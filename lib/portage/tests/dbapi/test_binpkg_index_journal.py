@@ -0,0 +1,85 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.dbapi.bintree import binarytree
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class BinpkgIndexJournalTestCase(TestCase):
+
+	def _read(self, filename):
+		with open(filename, "rb") as f:
+			return f.read()
+
+	def testBinpkgIndexJournal(self):
+		binpkgs = {
+			"dev-libs/A-1": {"EAPI": "7"},
+			"dev-libs/B-1": {"EAPI": "7"},
+		}
+		user_config = {
+			"make.conf": ('FEATURES="binpkg-index-journal"',),
+		}
+		playground = ResolverPlayground(binpkgs=binpkgs,
+			user_config=user_config)
+		try:
+			settings = playground.settings
+			bintree = playground.trees[playground.eroot]["bintree"]
+			bintree.populate()
+			pkgindex_file = bintree._pkgindex_file
+			journal_file = bintree._pkgindex_journal_file
+			packages = self._read(pkgindex_file)
+			self.assertFalse(os.path.exists(journal_file))
+
+			# New packages are appended to the journal, and the Packages
+			# file is not rewritten. The journal would be compacted
+			# quickly because the Packages file is small.
+			bintree._pkgindex_journal_ratio = 100
+			playground._create_binpkgs({
+				"dev-libs/C-1": {"EAPI": "7"},
+				"dev-libs/D-1": {"EAPI": "7"},
+			})
+			bintree.inject("dev-libs/C-1")
+			bintree.inject("dev-libs/D-1")
+			playground._create_binpkgs({
+				"dev-libs/C-1": {"EAPI": "7", "IUSE": "rebuilt"},
+			})
+			bintree.inject("dev-libs/C-1")
+			self.assertEqual(self._read(pkgindex_file), packages)
+			self.assertTrue(bintree._pkgindex_journal_pending())
+
+			# An interrupted append is ignored.
+			with open(journal_file, "ab") as f:
+				f.write(b"CPV: dev-libs/E-1\nEAPI: 7")
+
+			pkgindex = bintree._load_pkgindex()
+			self.assertEqual(sorted(d["CPV"] for d in pkgindex.packages),
+				["dev-libs/A-1", "dev-libs/B-1", "dev-libs/C-1",
+				"dev-libs/D-1"])
+			self.assertEqual([d.get("IUSE") for d in pkgindex.packages
+				if d["CPV"] == "dev-libs/C-1"], ["rebuilt"])
+
+			# Other readers see the merged view, without rewriting the
+			# Packages file.
+			reader = binarytree(pkgdir=settings["PKGDIR"],
+				settings=settings)
+			reader.populate()
+			self.assertEqual(sorted(reader.dbapi.cpv_all()),
+				["dev-libs/A-1", "dev-libs/B-1", "dev-libs/C-1",
+				"dev-libs/D-1"])
+			self.assertEqual(reader.dbapi.aux_get("dev-libs/C-1",
+				["IUSE"]), ["rebuilt"])
+			self.assertEqual(self._read(pkgindex_file), packages)
+
+			# The journal is compacted when it grows too large.
+			bintree._pkgindex_journal_ratio = 0
+			playground._create_binpkgs({"dev-libs/E-1": {"EAPI": "7"}})
+			bintree.inject("dev-libs/E-1")
+			self.assertFalse(os.path.exists(journal_file))
+			self.assertFalse(bintree._pkgindex_journal_pending())
+			pkgindex = bintree._load_pkgindex()
+			self.assertEqual(sorted(d["CPV"] for d in pkgindex.packages),
+				["dev-libs/A-1", "dev-libs/B-1", "dev-libs/C-1",
+				"dev-libs/D-1", "dev-libs/E-1"])
+		finally:
+			playground.cleanup()
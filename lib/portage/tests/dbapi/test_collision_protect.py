@@ -0,0 +1,78 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.dbapi.vartree import dblink
+from portage.package.ebuild.config import config
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import ensure_dirs
+
+class CollisionProtectTestCase(TestCase):
+
+	def testCollisionProtect(self):
+		installed = {
+			"dev-libs/A-1": {"EAPI": "7"},
+			"dev-libs/B-1": {"EAPI": "7"},
+		}
+		playground = ResolverPlayground(installed=installed)
+		try:
+			settings = config(clone=playground.settings)
+			settings["COLLISION_IGNORE"] = "/usr/share/ignored"
+			eprefix = settings["EPREFIX"]
+			eroot = settings["EROOT"]
+			vardb = playground.trees[eroot]["vartree"].dbapi
+
+			def touch(path):
+				path = os.path.join(eroot, path.lstrip(os.sep))
+				ensure_dirs(os.path.dirname(path))
+				with open(path, "w"):
+					pass
+
+			for path in ("usr/bin/owned", "usr/bin/collision",
+				"usr/lib/lib64/owned_via_symlink",
+				"usr/share/ignored/file", "usr/share/notadir"):
+				touch(path)
+			os.symlink("lib", os.path.join(eroot, "usr/lib64"))
+			ensure_dirs(os.path.join(eroot, "usr/share/dir"))
+
+			with open(vardb.getpath("dev-libs/A-1", filename="CONTENTS"),
+				"w") as f:
+				f.write("obj %s/usr/bin/owned 0 0\n" % eprefix)
+				f.write("obj %s/usr/lib64/lib64/owned_via_symlink 0 0\n" %
+					eprefix)
+
+			file_list = [eprefix + x for x in (
+				"/usr/bin/owned",
+				"/usr/bin/collision",
+				"/usr/bin/new",
+				"/usr/lib/lib64/owned_via_symlink",
+				"/usr/share/ignored/file",
+				"/usr/share/notadir/file",
+				"/usr/missing/file",
+			)]
+			symlink_list = [eprefix + x for x in (
+				"/usr/share/dir",
+				"/usr/share/newlink",
+			)]
+
+			mylink = dblink("dev-libs", "B-2", settings=settings,
+				vartree=playground.trees[eroot]["vartree"],
+				treetype="vartree")
+			mylink._display_merge = lambda *args, **kwargs: None
+			others = [vardb._dblink("dev-libs/A-1")]
+			collisions, dirs_ro, symlink_collisions, plib_collisions = \
+				mylink._collision_protect(eroot, eroot, others,
+				file_list, symlink_list)
+
+			self.assertEqual(collisions, [eprefix + x for x in (
+				"/usr/bin/collision",
+				"/usr/share/notadir",
+				"/usr/share/dir",
+			)])
+			self.assertEqual(symlink_collisions,
+				[eprefix + "/usr/share/dir"])
+			self.assertEqual(plib_collisions, {})
+			self.assertEqual(dirs_ro, set())
+		finally:
+			playground.cleanup()
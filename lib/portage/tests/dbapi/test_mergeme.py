@@ -0,0 +1,100 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import shutil
+import sys
+
+from portage import os
+from portage.package.ebuild.config import config
+from portage.dbapi.vartree import dblink
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class MergemeTestCase(TestCase):
+
+	def _create_image(self, image_dir):
+		os.makedirs(os.path.join(image_dir, "etc"))
+		os.makedirs(os.path.join(image_dir, "usr/share/a/b"))
+		with open(os.path.join(image_dir, "etc/a.conf"), "w") as f:
+			f.write("new\n")
+		for i in range(50):
+			with open(os.path.join(image_dir,
+				"usr/share/a/%s" % i), "w") as f:
+				f.write("%s\n" % i * (i + 1))
+		with open(os.path.join(image_dir, "usr/share/a/b/hardlink1"),
+			"w") as f:
+			f.write("hardlink\n")
+		os.link(os.path.join(image_dir, "usr/share/a/b/hardlink1"),
+			os.path.join(image_dir, "usr/share/a/b/hardlink2"))
+		os.symlink("../49", os.path.join(image_dir, "usr/share/a/b/link"))
+
+	def _merge(self, playground, merge_jobs):
+		settings = config(clone=playground.settings)
+		eroot = settings["EROOT"]
+		image_dir = os.path.join(settings["PORTAGE_TMPDIR"], "image")
+		settings["D"] = image_dir + os.sep
+		dest_dir = os.path.join(eroot, "usr/share/a")
+		for path in (image_dir, dest_dir):
+			if os.path.exists(path):
+				shutil.rmtree(path)
+		self._create_image(image_dir)
+		etc_dir = os.path.join(eroot, "etc")
+		if os.path.exists(etc_dir):
+			shutil.rmtree(etc_dir)
+		os.makedirs(etc_dir)
+		with open(os.path.join(etc_dir, "a.conf"), "w") as f:
+			f.write("old\n")
+
+		mylink = dblink("dev-libs", "A-1", settings=settings,
+			vartree=playground.trees[eroot]["vartree"], treetype="vartree")
+		mylink._merge_jobs = merge_jobs
+		messages = []
+		mylink._display_merge = lambda msg, level=0, noiselevel=0: \
+			messages.append(msg)
+		outfile = io.StringIO()
+		thismtime = 1000
+		if sys.hexversion >= 0x3030000:
+			thismtime *= 1000000000
+		secondhand = []
+		self.assertEqual(mylink.mergeme(image_dir, eroot, outfile,
+			secondhand, ["etc", "usr"], {"IGNORE": 0}, thismtime), None)
+		self.assertEqual(mylink.mergeme(image_dir, eroot, outfile,
+			None, secondhand, {"IGNORE": 0}, thismtime), None)
+
+		files = {}
+		for parent, dirs, filenames in os.walk(os.path.join(eroot, "usr")):
+			for filename in filenames:
+				path = os.path.join(parent, filename)
+				if os.path.islink(path):
+					files[path] = os.readlink(path)
+				else:
+					with open(path) as f:
+						files[path] = (f.read(), os.stat(path).st_nlink)
+		# Merged symlinks are recorded with their own mtime, which
+		# is the time when they were created.
+		contents = "".join(line.rsplit(" ", 1)[0] + "\n"
+			if line.startswith("sym ") else line
+			for line in outfile.getvalue().splitlines(True))
+		return contents, messages, files, sorted(os.listdir(etc_dir))
+
+	def testMergeme(self):
+		playground = ResolverPlayground(user_config={
+			"make.conf": ('CONFIG_PROTECT="/etc"',),
+		})
+		try:
+			serial = self._merge(playground, 1)
+			parallel = self._merge(playground, 4)
+			self.assertEqual(serial, parallel)
+
+			contents, messages, files, etc_files = parallel
+			self.assertEqual(etc_files, ["._cfg0000_a.conf", "a.conf"])
+			self.assertTrue("obj /usr/share/a/b/hardlink2 " in contents)
+			self.assertEqual(files[os.path.join(playground.eroot,
+				"usr/share/a/b/hardlink1")], ("hardlink\n", 2))
+			self.assertEqual(files[os.path.join(playground.eroot,
+				"usr/share/a/b/link")], "../49")
+			self.assertEqual(len([x for x in contents.splitlines()
+				if x.startswith("obj ")]), 53)
+		finally:
+			playground.cleanup()
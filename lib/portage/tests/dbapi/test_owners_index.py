@@ -0,0 +1,88 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import write_atomic
+
+class OwnersIndexTestCase(TestCase):
+
+	def _write_contents(self, vardb, cpv, paths):
+		eprefix = vardb.settings["EPREFIX"]
+		lines = []
+		for path in paths:
+			lines.append("obj %s%s d41d8cd98f00b204e9800998ecf8427e 0\n" %
+				(eprefix, path))
+		write_atomic(vardb.getpath(cpv, filename="CONTENTS"), "".join(lines))
+		# Simulate vardbapi._bump_mtime, with a distinct mtime.
+		mtime = time.time() + 10
+		for path in (vardb.getpath(cpv), os.path.dirname(vardb.getpath(cpv))):
+			os.utime(path, (mtime, mtime))
+
+	def testOwnersIndex(self):
+		installed = {
+			"app-misc/A-1": {"COUNTER": "1"},
+			"app-misc/B-1": {"COUNTER": "2"},
+			"dev-libs/C-1": {"COUNTER": "3"},
+		}
+
+		playground = ResolverPlayground(installed=installed)
+		try:
+			vardb = playground.trees[playground.eroot]["vartree"].dbapi
+			self._write_contents(vardb, "app-misc/A-1",
+				["/usr/bin/foo", "/usr/share/doc/A-1/README"])
+			self._write_contents(vardb, "app-misc/B-1",
+				["/usr/lib/foo", "/usr/share/doc/B-1/README"])
+			self._write_contents(vardb, "dev-libs/C-1",
+				["/usr/lib/libc-test.so"])
+
+			eprefix = playground.settings["EPREFIX"]
+			owners_index = vardb._owners_index
+			self.assertEqual(owners_index.valid(), False)
+
+			# The index is written once, even if the packages are read
+			# in multiple batches.
+			writes = []
+			def _write(*args):
+				writes.append(args)
+				return type(owners_index)._write(owners_index, *args)
+			owners_index._write = _write
+			owners_index._update_batch_size = 2
+
+			def owners(paths):
+				paths = [eprefix + path if path.startswith(os.sep) else path
+					for path in paths]
+				return dict((pkg.mycpv, sorted(files)) for pkg, files in
+					vardb._owners.get_owners(paths).items())
+
+			self.assertEqual(owners(["/usr/bin/foo"]),
+				{"app-misc/A-1": ["usr/bin/foo"]})
+			self.assertEqual(os.path.exists(owners_index.filename), True)
+			self.assertEqual(owners_index.valid(), True)
+			self.assertEqual(len(writes), 1)
+
+			self.assertEqual(owners(["foo"]),
+				{"app-misc/A-1": ["usr/bin/foo"],
+				"app-misc/B-1": ["usr/lib/foo"]})
+			self.assertEqual(owners(["/usr/lib/libc-test.so", "/usr/bin/bar"]),
+				{"dev-libs/C-1": ["usr/lib/libc-test.so"]})
+			self.assertEqual(owners(["/usr/share/doc/A-1/README",
+				"/usr/share/doc/B-1/README"]),
+				{"app-misc/A-1": ["usr/share/doc/A-1/README"],
+				"app-misc/B-1": ["usr/share/doc/B-1/README"]})
+
+			# A modified package is indexed again.
+			self._write_contents(vardb, "app-misc/B-1", ["/usr/bin/bar"])
+			self.assertEqual(owners_index.valid(), False)
+			self.assertEqual(owners(["/usr/bin/bar", "/usr/lib/foo"]),
+				{"app-misc/B-1": ["usr/bin/bar"]})
+			self.assertEqual(owners_index.find_basename("foo"),
+				["app-misc/A-1"])
+			self.assertEqual(owners_index.find_path(
+				eprefix + "/usr/lib/libc-test.so"),
+				["dev-libs/C-1"])
+		finally:
+			playground.cleanup()
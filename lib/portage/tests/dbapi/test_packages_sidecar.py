@@ -0,0 +1,103 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import io
+import shutil
+import tempfile
+
+from portage import os
+from portage.dbapi._PackagesSidecar import PackagesSidecar, _LazyPackageEntry
+from portage.getbinpkg import PackageIndex
+from portage.tests import TestCase
+
+class PackagesSidecarTestCase(TestCase):
+
+	def _new_pkgindex(self):
+		return PackageIndex(
+			allowed_pkg_keys=("CPV", "BUILD_ID", "EAPI", "IUSE", "SLOT",
+				"USE", "_mtime_", "repository"),
+			default_pkg_data={"SLOT": "0"},
+			inherited_keys=("repository",),
+			translated_keys=(("_mtime_", "MTIME"),))
+
+	def _read(self, pkgindex_file, body=True):
+		pkgindex = self._new_pkgindex()
+		with io.open(pkgindex_file, encoding="utf_8") as f:
+			if body:
+				pkgindex.read(f)
+			else:
+				pkgindex.readHeader(f)
+		return pkgindex
+
+	def testPackagesSidecar(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			pkgindex_file = os.path.join(tempdir, "Packages")
+			with io.open(pkgindex_file, "w", encoding="utf_8") as f:
+				f.write("repository: gentoo\nTIMESTAMP: 1000\n\n"
+					"CPV: dev-libs/A-1\nEAPI: 7\nIUSE: foo\nMTIME: 10\n\n"
+					"CPV: dev-libs/B-1\nSLOT: 1\nUSE: bar \u00e9\n"
+					"repository: test_repo\n\n"
+					"CPV: dev-libs/A-2\nBUILD_ID: 2\n\n")
+
+			expected = [dict(d.items()) for d in
+				self._read(pkgindex_file).packages]
+			sidecar = PackagesSidecar(pkgindex_file)
+
+			# The first call parses the Packages file and writes the
+			# sidecar, and the second call uses the sidecar.
+			for i in range(2):
+				packages = sidecar.packages(self._read(pkgindex_file,
+					body=False))
+				self.assertEqual([dict(d.items()) for d in packages],
+					expected)
+				self.assertTrue(os.path.exists(sidecar.filename))
+
+			packages = sidecar.packages(self._read(pkgindex_file,
+				body=False))
+			self.assertTrue(isinstance(packages[0], _LazyPackageEntry))
+			self.assertEqual(packages[1]["SLOT"], "1")
+			self.assertEqual(packages[0].get("BUILD_ID"), None)
+			self.assertEqual(packages[0]._source is not None, True)
+			packages[1]["CPV"] = "dev-libs/B-1"
+			self.assertEqual(packages[1]["USE"], "bar \u00e9")
+			self.assertEqual(packages[1]._source, None)
+			self.assertEqual(packages[1].get("repository"), "test_repo")
+
+			packages = sidecar.packages(self._read(pkgindex_file,
+				body=False), cp="dev-libs/A")
+			self.assertEqual([d["CPV"] for d in packages],
+				["dev-libs/A-1", "dev-libs/A-2"])
+			self.assertEqual(packages[0]["IUSE"], "foo")
+			self.assertEqual(packages[0]["_mtime_"], "10")
+
+			# The header may be rewritten without invalidating the
+			# sidecar.
+			pkgindex = self._read(pkgindex_file, body=False)
+			pkgindex.modified = False
+			pkgindex.header["DOWNLOAD_TIMESTAMP"] = "12345"
+			new_file = pkgindex_file + ".new"
+			with io.open(new_file, "w", encoding="utf_8") as f:
+				pkgindex.writeHeader(f)
+				with io.open(pkgindex_file, encoding="utf_8") as cached_f:
+					self._new_pkgindex().readHeader(cached_f)
+					shutil.copyfileobj(cached_f, f)
+			os.rename(new_file, pkgindex_file)
+			packages = sidecar.packages(self._read(pkgindex_file,
+				body=False))
+			self.assertTrue(isinstance(packages[0], _LazyPackageEntry))
+			self.assertEqual([dict(d.items()) for d in packages],
+				expected)
+
+			# A different body invalidates the sidecar.
+			with io.open(pkgindex_file, "w", encoding="utf_8") as f:
+				f.write("repository: gentoo\nTIMESTAMP: 1000\n\n"
+					"CPV: dev-libs/C-1\nEAPI: 7\nIUSE: foo\nMTIME: 10\n\n")
+			packages = sidecar.packages(self._read(pkgindex_file,
+				body=False))
+			self.assertEqual([dict(d.items()) for d in packages],
+				[dict(d.items()) for d in self._read(pkgindex_file).packages])
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,79 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from _emerge.FakeVartree import FakeVartree
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import write_atomic
+
+class VdbIndexTestCase(TestCase):
+
+	def testVdbIndex(self):
+		installed = {
+			"dev-libs/A-1": {"EAPI": "5", "SLOT": "1",
+				"RDEPEND": "dev-libs/B"},
+			"dev-libs/B-2": {},
+			"app-misc/C-1": {"EAPI": "6"},
+		}
+
+		playground = ResolverPlayground(installed=installed)
+		try:
+			vardb = playground.trees[playground.eroot]["vartree"].dbapi
+			vdb_index = vardb._vdb_index
+			vdb_index.update(vdb_index.stale_categories())
+			self.assertEqual(vdb_index.stale_categories(), set())
+
+			self.assertEqual(sorted(vdb_index.category_pfs("dev-libs")),
+				["A-1", "B-2"])
+			self.assertEqual(vdb_index.category_pfs("sys-apps"), None)
+
+			metadata = vdb_index.get("dev-libs/A-1",
+				["EAPI", "SLOT", "RDEPEND", "NEEDED.ELF.2"])
+			self.assertEqual(metadata["EAPI"], "5")
+			self.assertEqual(metadata["SLOT"], "1")
+			self.assertEqual(metadata["RDEPEND"], "dev-libs/B")
+			self.assertEqual(metadata["NEEDED.ELF.2"], "")
+
+			# Keys that are not indexed fall back to environment.bz2.
+			self.assertEqual(vdb_index.get("dev-libs/A-1", ["SRC_URI"]), None)
+
+			self.assertEqual(vardb.match("dev-libs/A"), ["dev-libs/A-1"])
+			self.assertEqual(vardb.aux_get("app-misc/C-1", ["EAPI"]), ["6"])
+
+			# A modification of one category only invalidates that category.
+			pkg_dir = vardb.getpath("app-misc/C-1")
+			write_atomic(os.path.join(pkg_dir, "EAPI"), "7\n")
+			mtime = time.time() + 10
+			os.utime(vardb.getpath("app-misc"), (mtime, mtime))
+			vardb._clear_cache()
+			self.assertEqual(vdb_index.stale_categories(), set(["app-misc"]))
+			self.assertEqual(vdb_index.get("app-misc/C-1", ["EAPI"]), None)
+			self.assertEqual(vardb.aux_get("app-misc/C-1", ["EAPI"]), ["7"])
+
+			vdb_index.update(["app-misc"])
+			self.assertEqual(vdb_index.stale_categories(), set())
+			self.assertEqual(vdb_index.get("app-misc/C-1", ["EAPI"])["EAPI"],
+				"7")
+			self.assertEqual(vdb_index.get("dev-libs/A-1", ["RDEPEND"])["RDEPEND"],
+				"dev-libs/B")
+
+			# FakeVartree validates its packages with _mtime_, which
+			# is answered from the index, without reading the vdb.
+			self.assertEqual(
+				vdb_index.get("app-misc/C-1", ["_mtime_"])["_mtime_"],
+				os.stat(pkg_dir).st_mtime)
+			def _aux_get(*args, **kwargs):
+				raise AssertionError("vdb read: %s" % (args,))
+			vardb._aux_get = _aux_get
+			fake_vartree = FakeVartree(
+				playground.trees[playground.eroot]["root_config"])
+			fake_vartree.sync()
+			fake_vartree.sync()
+			self.assertEqual(sorted(fake_vartree.dbapi.cpv_all()),
+				["app-misc/C-1", "dev-libs/A-1", "dev-libs/B-2"])
+			del vardb._aux_get
+		finally:
+			playground.cleanup()
@@ -1,6 +1,8 @@
 # Copyright 2006-2012 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import pickle
+
 from portage.tests import TestCase
 from portage.dep import Atom
 from portage.exception import InvalidAtom
@@ -339,3 +341,40 @@ class TestAtom(TestCase):
 			b = a._eval_qa_conditionals(use_mask, use_force)
 			self.assertEqual(str(b), expected_atom)
 			self.assertEqual(str(b.unevaluated_atom), atom)
+
+	def test_atom_cache(self):
+		a = Atom(">=dev-libs/A-1:0=[foo?,-bar]", eapi="5")
+		b = Atom(">=dev-libs/A-1:0=[foo?,-bar]", eapi="5")
+		self.assertEqual(a, b)
+		self.assertFalse(a is b)
+		for k in Atom._cached_attrs:
+			if k in ("unevaluated_atom", "without_use"):
+				continue
+			self.assertEqual(getattr(a, k), getattr(b, k))
+		self.assertTrue(a.use is b.use)
+		self.assertTrue(a.without_use is b.without_use)
+		self.assertTrue(a.unevaluated_atom is a)
+		self.assertTrue(b.unevaluated_atom is b)
+
+		c = Atom("dev-libs/A:0")
+		d = Atom("dev-libs/A:0")
+		self.assertTrue(d.without_use is d)
+		self.assertTrue(c.without_use is c)
+
+		# Validation which depends on constructor arguments is not
+		# bypassed by the cache.
+		self.assertRaises(InvalidAtom, Atom, "dev-libs/A:0=", eapi="4")
+		self.assertRaises(InvalidAtom, Atom, "dev-libs/A[foo?]",
+			eapi="5", is_valid_flag=lambda flag: flag != "foo")
+		Atom("dev-libs/A[foo?]", eapi="5")
+		self.assertRaises(InvalidAtom, Atom, "dev-libs/A[foo?]",
+			eapi="5", is_valid_flag=lambda flag: flag != "foo")
+		self.assertRaises(InvalidAtom, Atom, "dev-libs/A::repo",
+			allow_repo=False)
+
+		self.assertRaises(AttributeError, setattr, a, "slot", "1")
+		e = pickle.loads(pickle.dumps(a, 2))
+		self.assertEqual(e, a)
+		self.assertEqual(str(e.use), str(a.use))
+		self.assertEqual(e.slot_operator, "=")
+		self.assertTrue(e.unevaluated_atom is e)
@@ -0,0 +1,68 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import itertools
+
+from portage.tests import TestCase
+from portage.exception import InvalidDependString
+from portage.dep import Atom, use_reduce
+from portage.dep._compiled_deps import CompiledDepString
+
+class CompiledDepStringTestCase(TestCase):
+
+	def testCompiledDepString(self):
+		depstrs = (
+			"",
+			"dev-libs/A dev-libs/B",
+			"a? ( dev-libs/A ) !a? ( dev-libs/B )",
+			"|| ( a? ( dev-libs/A ) b? ( dev-libs/B ) dev-libs/C )",
+			"|| ( ( a? ( dev-libs/A ) dev-libs/B ) || ( dev-libs/C b? ( dev-libs/D ) ) )",
+			"a? ( b? ( || ( dev-libs/A dev-libs/B ) ) ) c? ( dev-libs/C[a?,!b?,c=] )",
+			"|| ( dev-libs/A[a?] ( !b? ( dev-libs/B:0= ) ) ) >=dev-libs/C-1[-c,b?]",
+			"|| ( a? ( dev-libs/A ) ) b? ( || ( c? ( dev-libs/C ) ) )",
+		)
+		flags = ("a", "b", "c")
+		use_combinations = [set(x) for n in range(len(flags) + 1)
+			for x in itertools.combinations(flags, n)]
+
+		for depstr in depstrs:
+			for opconvert in (False, True):
+				kwargs = {"eapi": "5", "opconvert": opconvert,
+					"token_class": Atom}
+				compiled = CompiledDepString(depstr, **kwargs)
+				for uselist in use_combinations:
+					for masklist in ((), ("b",)):
+						for excludeall in ((), ("c",)):
+							expected = use_reduce(depstr, uselist=uselist,
+								masklist=masklist, excludeall=excludeall,
+								**kwargs)
+							result = compiled.evaluate(uselist=uselist,
+								masklist=masklist, excludeall=excludeall)
+							self.assertEqual(result, expected,
+								msg="%s %s %s %s" % (depstr, uselist,
+								masklist, excludeall))
+
+		compiled = CompiledDepString(
+			"a? ( dev-libs/A ) dev-libs/B[b?,c(-)?]", token_class=Atom)
+		self.assertEqual(compiled.flags, frozenset(["a", "b", "c"]))
+		self.assertEqual(CompiledDepString(
+			"!a? ( dev-libs/A:0=[-b,!c=,d(+)=] )").flags,
+			frozenset(["a", "c", "d"]))
+		self.assertEqual(compiled.evaluate(["a", "x"]),
+			compiled.evaluate(["a", "y"]))
+
+		# Results may be modified by the caller.
+		result = compiled.evaluate(["a"])
+		result.append("dev-libs/C")
+		self.assertEqual(compiled.evaluate(["a"]),
+			["dev-libs/A", "dev-libs/B"])
+
+		# The dependency string is validated when it is evaluated.
+		for depstr, is_valid_flag in (
+			("a? ( dev-libs/A ) b? ( dev-libs/B )", lambda flag: flag == "a"),
+			("a? ( dev-libs/A[b?] )", lambda flag: flag == "a"),
+			("a? ( dev-libs/A", None)):
+			compiled = CompiledDepString(depstr, token_class=Atom,
+				eapi="5", is_valid_flag=is_valid_flag)
+			self.assertRaises(InvalidDependString, compiled.evaluate)
+			self.assertRaises(InvalidDependString, compiled.evaluate, ["a"])
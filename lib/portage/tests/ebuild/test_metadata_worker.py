@@ -0,0 +1,106 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import ensure_dirs, write_atomic
+from portage.util._eventloop.global_event_loop import global_event_loop
+from _emerge.MetadataRegen import MetadataRegen
+
+class MetadataWorkerTestCase(TestCase):
+
+	def _regen(self, portdb, persistent_workers):
+		results = {}
+
+		def consumer(cpv, repo_path, metadata, ebuild_hash, eapi_supported):
+			if metadata is not None:
+				metadata = dict((k, metadata.get(k, ""))
+					for k in ("DEPEND", "RDEPEND", "IUSE", "SLOT",
+					"DEFINED_PHASES", "_eclasses_"))
+				metadata["_eclasses_"] = sorted(metadata["_eclasses_"])
+			results[cpv] = metadata
+
+		regen = MetadataRegen(portdb, consumer=consumer, max_jobs=2,
+			write_auxdb=False, persistent_workers=persistent_workers,
+			event_loop=global_event_loop())
+		regen.start()
+		regen.wait()
+		return regen.returncode, results
+
+	def testMetadataWorker(self):
+		ebuilds = {
+			"dev-libs/A-1": {
+				"EAPI": "6",
+				"IUSE": "foo",
+				"MISC_CONTENT": "src_configure() { :; }",
+			},
+			"dev-libs/A-2": {
+				"EAPI": "7",
+				"RDEPEND": "dev-libs/B",
+			},
+			"dev-libs/B-1": {
+				"EAPI": "7",
+				"MISC_CONTENT": "IUSE_LEAK=1",
+			},
+			"dev-libs/B-2": {
+				"EAPI": "7",
+				"MISC_CONTENT": "if [[ -n ${IUSE_LEAK} ]]; then IUSE=leak; fi",
+			},
+			"dev-libs/C-1": {
+				"EAPI": "7",
+			},
+		}
+
+		user_config = {
+			# Ebuilds are modified after the Manifests are generated.
+			"make.conf": ('FEATURES="-strict"',),
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			user_config=user_config)
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			eclass_dir = os.path.join(
+				portdb.repositories["test_repo"].location, "eclass")
+			ensure_dirs(eclass_dir)
+			write_atomic(os.path.join(eclass_dir, "test-eclass.eclass"),
+				"IUSE=\"eclass-flag\"\nDEPEND=\"dev-libs/B\"\n"
+				"test-eclass_src_compile() { :; }\n"
+				"EXPORT_FUNCTIONS src_compile\n")
+			portdb.repositories["test_repo"].eclass_db.update_eclasses()
+			# The eclass has to be inherited after the playground has
+			# generated the Manifests.
+			for cpv, content in (("dev-libs/A-1", "inherit test-eclass"),
+				("dev-libs/A-2", "inherit test-eclass"),
+				("dev-libs/C-1", "die broken")):
+				with open(portdb.findname(cpv), "a") as f:
+					f.write("\n" + content + "\n")
+			# Invalidate cache entries that have been generated by
+			# the playground.
+			mtime = time.time() + 10
+			for cpv in ebuilds:
+				os.utime(portdb.findname(cpv), (mtime, mtime))
+
+			returncode, expected = self._regen(portdb, False)
+			self.assertEqual(returncode, 1)
+
+			returncode, results = self._regen(portdb, True)
+			self.assertEqual(returncode, 1)
+			self.assertEqual(results, expected)
+
+			self.assertEqual(results["dev-libs/C-1"], None)
+			self.assertEqual(results["dev-libs/A-1"]["_eclasses_"],
+				["test-eclass"])
+			self.assertEqual(results["dev-libs/A-1"]["IUSE"],
+				"foo eclass-flag")
+			self.assertEqual(results["dev-libs/A-1"]["DEFINED_PHASES"],
+				"compile configure")
+			self.assertEqual(results["dev-libs/A-2"]["DEPEND"], "dev-libs/B")
+
+			# Variables from one ebuild do not leak into the next.
+			self.assertEqual(results["dev-libs/B-2"]["IUSE"], "")
+		finally:
+			playground.cleanup()
@@ -0,0 +1,41 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.util.digraph import digraph
+from _emerge._critical_path_lengths import _critical_path_lengths
+
+
+class CriticalPathTestCase(TestCase):
+
+	def testCriticalPathLengths(self):
+		# Children are dependencies: app depends on toolkit and
+		# small, and toolkit depends on compiler.
+		graph = digraph()
+		graph.add("compiler", "toolkit")
+		graph.add("toolkit", "app")
+		graph.add("small", "app")
+		graph.add("other", None)
+		weights = {"compiler": 100, "toolkit": 50, "app": 10,
+			"small": 1, "other": 30}
+
+		lengths = _critical_path_lengths(graph, weights.get)
+		self.assertEqual(lengths, {"compiler": 160, "toolkit": 60,
+			"app": 10, "small": 11, "other": 30})
+
+		# Edges that close a cycle are ignored.
+		graph.add("app", "compiler")
+		lengths = _critical_path_lengths(graph, weights.get)
+		self.assertEqual(lengths["other"], 30)
+		self.assertEqual(sorted(lengths), sorted(weights))
+		self.assertTrue(lengths["compiler"] >= 160)
+		self.assertTrue(lengths["small"] >= 11)
+
+	def testCriticalPathLengthsDeep(self):
+		# Deep chains must not hit the recursion limit.
+		graph = digraph()
+		for i in range(5000):
+			graph.add(i, i + 1)
+		lengths = _critical_path_lengths(graph, lambda node: 1)
+		self.assertEqual(lengths[0], 5001)
+		self.assertEqual(lengths[5000], 1)
@@ -0,0 +1,131 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage.tests import TestCase
+from _emerge.BuildResourceMonitor import BuildResourceMonitor
+from _emerge.BuildStatsDB import BuildStatsDB, makeopts_jobs
+from _emerge.JobResourceBudget import JobResourceBudget
+
+
+class _FakePackage(object):
+
+	def __init__(self, cp, built=False, installed=False):
+		self.cp = cp
+		self.built = built
+		self.installed = installed
+
+
+class ResourceSchedulerTestCase(TestCase):
+
+	def testMakeoptsJobs(self):
+		test_cases = (
+			("", 1),
+			("-j8", 8),
+			("-j 8 -l8", 8),
+			("--jobs=4 --load-average=4", 4),
+			("--jobs 3", 3),
+			("-j", 16),
+			("-j -l8", 16),
+			("-j0", 1),
+			("-k -j2 V=1", 2),
+		)
+		for makeopts, expected in test_cases:
+			self.assertEqual(makeopts_jobs(makeopts, default=16), expected,
+				makeopts)
+
+	def testParseSize(self):
+		self.assertEqual(JobResourceBudget.parse_size("512"), 512 * 1024)
+		self.assertEqual(JobResourceBudget.parse_size("64G"), 64 * 1024 ** 2)
+		self.assertEqual(JobResourceBudget.parse_size("100k"), 100)
+		self.assertEqual(JobResourceBudget.parse_size("1.5G"), None)
+
+	def testBuildStatsDB(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tempdir, "build_stats.json")
+			stats = BuildStatsDB(filename)
+			self.assertEqual(stats.get("dev-libs/A"), None)
+			stats.record("dev-libs/A", 100, 400, 2000000, 8)
+			stats.record("dev-libs/A", 200, 600, 1000000, 8)
+			expected = {"count": 2, "cpu": 3.5, "jobs": 8,
+				"rss": 1500000, "time": 150.0}
+			self.assertEqual(stats.get("dev-libs/A"), expected)
+			stats.store()
+
+			# Entries that are stored by another instance in the
+			# meantime are preserved.
+			other = BuildStatsDB(filename)
+			self.assertEqual(other.get("dev-libs/A"), expected)
+			other.record("dev-libs/B", 10, 10, 1000, 4)
+			stats.record("dev-libs/C", 20, 20, 2000, 4)
+			other.store()
+			stats.store()
+			stats = BuildStatsDB(filename)
+			self.assertEqual(stats.get("dev-libs/A"), expected)
+			self.assertEqual(stats.get("dev-libs/B")["time"], 10.0)
+			self.assertEqual(stats.get("dev-libs/C")["rss"], 2000)
+
+			with open(filename, "w") as f:
+				f.write("{")
+			self.assertEqual(BuildStatsDB(filename).get("dev-libs/A"), None)
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testJobResourceBudget(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			stats = BuildStatsDB(os.path.join(tempdir, "build_stats.json"))
+			# A large build which used 6 CPUs and 6G with -j8.
+			stats.record("www-client/large", 3600, 6 * 3600,
+				6 * 1024 ** 2, 8)
+			stats.record("dev-libs/small", 10, 10, 50 * 1024, 8)
+			budget = JobResourceBudget(stats, 16, 10 * 1024 ** 2, 8)
+
+			large = _FakePackage("www-client/large")
+			small = _FakePackage("dev-libs/small")
+			unknown = _FakePackage("dev-libs/unknown")
+			binary = _FakePackage("www-client/large", built=True)
+
+			self.assertEqual(budget.cost(large), (6, 6 * 1024 ** 2))
+			self.assertEqual(budget.cost(small), (1, 50 * 1024))
+			self.assertEqual(budget.cost(unknown), (1, 0))
+			self.assertEqual(budget.cost(binary), (1, 0))
+
+			# Costs scale with the current number of make jobs.
+			budget.default_jobs = 4
+			self.assertEqual(budget.cost(large), (3, 3 * 1024 ** 2))
+			budget.default_jobs = 8
+
+			self.assertTrue(budget.fits(large))
+			budget.acquire(1, large)
+			# A second large build would exceed the memory budget,
+			# but small builds fit.
+			self.assertFalse(budget.fits(large))
+			self.assertTrue(budget.fits(small))
+			for i in range(10):
+				budget.acquire(2 + i, small)
+			# The CPU budget is exhausted.
+			self.assertFalse(budget.fits(small))
+			self.assertTrue(budget.release(1))
+			self.assertFalse(budget.release(1))
+			self.assertTrue(budget.fits(large))
+
+			for i in range(10):
+				budget.release(2 + i)
+			# A job which exceeds the budget by itself can run alone.
+			budget.cpus = 4
+			self.assertTrue(budget.fits(large))
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testBuildResourceMonitor(self):
+		if not BuildResourceMonitor.supported():
+			self.skipTest("/proc/<pid>/task/<tid>/children is unavailable")
+		pid = os.getpid()
+		self.assertTrue(BuildResourceMonitor.tree_rss(pid) > 0)
+		self.assertTrue(BuildResourceMonitor.cpu_ticks(pid) >= 0)
+		self.assertEqual(BuildResourceMonitor.tree_rss(2 ** 22 + 1), 0)
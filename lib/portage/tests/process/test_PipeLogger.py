@@ -0,0 +1,102 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import gzip
+import shutil
+import tempfile
+import threading
+import time
+
+from portage import os
+from portage.tests import TestCase
+from portage.util._async.PipeLogger import PipeLogger
+from portage.util._eventloop.global_event_loop import global_event_loop
+
+
+class PipeLoggerTestCase(TestCase):
+
+	def _run(self, data, log_file_path, background=True, stdout_fd=None,
+		log_file_exclusive=True, append=None):
+		loop = global_event_loop()
+		pr, pw = os.pipe()
+
+		def write(buf):
+			view = memoryview(buf)
+			while view:
+				view = view[os.write(pw, view[:8192]):]
+
+		def producer():
+			if append is None:
+				write(data)
+			else:
+				# Something else appends to the log while the logger
+				# waits for more output.
+				write(data[:8192])
+				while os.path.getsize(log_file_path) < 8192:
+					time.sleep(0.01)
+				with open(log_file_path, "ab") as f:
+					f.write(append)
+				write(data[8192:])
+			os.close(pw)
+
+		logger = PipeLogger(background=background, input_fd=pr,
+			log_file_exclusive=log_file_exclusive,
+			log_file_path=log_file_path, scheduler=loop,
+			stdout_fd=stdout_fd)
+		logger.start()
+		splice = logger._splice_fd is not None
+		thread = threading.Thread(target=producer)
+		thread.start()
+		try:
+			loop.run_until_complete(logger.async_wait())
+		finally:
+			thread.join()
+		self.assertEqual(logger.returncode, os.EX_OK)
+		return splice
+
+	def testPipeLogger(self):
+		data = b"".join(b"line %d of build output\n" % i
+			for i in range(100000))
+		tempdir = tempfile.mkdtemp()
+		try:
+			# Output is appended to an existing log, via splice if
+			# it is supported.
+			log_file_path = os.path.join(tempdir, "build.log")
+			with open(log_file_path, "wb") as f:
+				f.write(b"previous phase\n")
+			splice = self._run(data, log_file_path)
+			self.assertEqual(splice, hasattr(os, "splice"))
+			with open(log_file_path, "rb") as f:
+				self.assertEqual(f.read(), b"previous phase\n" + data)
+
+			# Output is not spliced if the log may be shared, and
+			# appends by other writers are preserved otherwise.
+			log_file_path = os.path.join(tempdir, "fetch.log")
+			self.assertFalse(self._run(data, log_file_path,
+				log_file_exclusive=False))
+			log_file_path = os.path.join(tempdir, "shared.log")
+			self._run(data, log_file_path, append=b"message\n")
+			with open(log_file_path, "rb") as f:
+				self.assertEqual(f.read(),
+					data[:8192] + b"message\n" + data[8192:])
+
+			# In the foreground, output is also copied to stdout_fd.
+			log_file_path = os.path.join(tempdir, "foreground.log")
+			stdout_path = os.path.join(tempdir, "stdout")
+			stdout_fd = os.open(stdout_path,
+				os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+			self.assertFalse(self._run(data, log_file_path,
+				background=False, stdout_fd=stdout_fd))
+			for path in (log_file_path, stdout_path):
+				with open(path, "rb") as f:
+					self.assertEqual(f.read(), data)
+
+			# Compressed logs are written by a separate thread, and
+			# they are complete when the logger exits.
+			log_file_path = os.path.join(tempdir, "build.log.gz")
+			self.assertFalse(self._run(data, log_file_path))
+			self._run(b"second phase\n", log_file_path)
+			with gzip.open(log_file_path, "rb") as f:
+				self.assertEqual(f.read(), data + b"second phase\n")
+		finally:
+			shutil.rmtree(tempdir)
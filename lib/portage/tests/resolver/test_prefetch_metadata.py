@@ -0,0 +1,67 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import (ResolverPlayground,
+	ResolverPlaygroundTestCase)
+
+class PrefetchMetadataTestCase(TestCase):
+
+	def testPrefetchMetadata(self):
+		ebuilds = {
+			"dev-libs/A-1": {
+				"EAPI": "7",
+				"RDEPEND": "dev-libs/B || ( dev-libs/C dev-libs/D )",
+				"DEPEND": "!dev-libs/E",
+			},
+			"dev-libs/B-1": {"EAPI": "7"},
+			"dev-libs/C-1": {"EAPI": "7"},
+			"dev-libs/C-2": {"EAPI": "7"},
+			"dev-libs/D-1": {"EAPI": "7"},
+			"dev-libs/E-1": {"EAPI": "7"},
+		}
+
+		user_config = {
+			# Metadata cache entries are invalidated after the Manifests
+			# are generated.
+			"make.conf": ('FEATURES="-strict"',),
+		}
+
+		test_case = ResolverPlaygroundTestCase(
+			["dev-libs/A"],
+			success=True,
+			mergelist=["dev-libs/B-1", "dev-libs/C-2", "dev-libs/A-1"])
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			user_config=user_config)
+		try:
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			mtime = time.time() + 10
+			for cpv in ebuilds:
+				os.utime(portdb.findname(cpv), (mtime, mtime))
+
+			portdb.freeze()
+			try:
+				playground.run_TestCase(test_case)
+				self.assertEqual(test_case.test_success, True,
+					test_case.fail_msg)
+				self.assertEqual(sorted(portdb._aux_cache),
+					["dev-libs/A-1", "dev-libs/B-1", "dev-libs/C-1",
+					"dev-libs/C-2", "dev-libs/D-1"])
+
+				# Prefetching reuses the dependency strings which are
+				# compiled when the deps are added to the graph.
+				result = playground.run(["dev-libs/A"])
+				self.assertEqual(result.success, True)
+				compiled_deps = result.depgraph._frozen_config._compiled_deps
+				self.assertTrue(compiled_deps)
+				self.assertEqual(
+					[validate_iuse for pkg, dep_string, validate_iuse
+					in compiled_deps if not validate_iuse], [])
+			finally:
+				portdb.melt()
+		finally:
+			playground.cleanup()
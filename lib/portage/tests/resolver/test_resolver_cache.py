@@ -0,0 +1,111 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
+import _emerge.depgraph
+from _emerge.ResolverCache import ResolverCache
+
+class ResolverCacheTestCase(TestCase):
+
+	def testResolverCache(self):
+		ebuilds = {
+			"dev-libs/A-1": { "RDEPEND": "dev-libs/B" },
+			"dev-libs/A-2": { "RDEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { },
+			}
+		installed = {
+			"dev-libs/A-1": { "RDEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { },
+			}
+		user_config = {
+			"make.conf" : ('FEATURES="resolver-cache"',),
+			}
+
+		test_case = ResolverPlaygroundTestCase(
+			["dev-libs/A"],
+			options = { "--update": True },
+			success = True,
+			mergelist = ["dev-libs/A-2"])
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			installed=installed, user_config=user_config, debug=False)
+		try:
+			options = test_case.options.copy()
+			options["--pretend"] = True
+			resolver_cache = ResolverCache(playground.settings,
+				playground.trees, options, None, test_case.requests[0])
+			self.assertEqual(resolver_cache.get(), None)
+
+			playground.run_TestCase(test_case)
+			self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+
+			# The first run populates the cache.
+			resolver_cache = ResolverCache(playground.settings,
+				playground.trees, options, None, test_case.requests[0])
+			resume_data = resolver_cache.get()
+			self.assertNotEqual(resume_data, None)
+			self.assertEqual([x[2] for x in resume_data["mergelist"]],
+				["dev-libs/A-2"])
+
+			# The second run is served from the cache, without
+			# resolving the graph.
+			resolve = _emerge.depgraph._backtrack_depgraph_resolve
+			resolve_calls = []
+			def counting_resolve(*args, **kwargs):
+				resolve_calls.append(args)
+				return resolve(*args, **kwargs)
+			_emerge.depgraph._backtrack_depgraph_resolve = counting_resolve
+			try:
+				playground.run_TestCase(test_case)
+			finally:
+				_emerge.depgraph._backtrack_depgraph_resolve = resolve
+			self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+			self.assertEqual(resolve_calls, [])
+
+			# Different options result in a different fingerprint.
+			other_options = options.copy()
+			other_options["--deep"] = True
+			self.assertNotEqual(resolver_cache.fingerprint,
+				ResolverCache(playground.settings, playground.trees,
+				other_options, None, test_case.requests[0]).fingerprint)
+
+			# Display options do not alter the fingerprint.
+			other_options = options.copy()
+			other_options["--verbose"] = True
+			self.assertEqual(resolver_cache.fingerprint,
+				ResolverCache(playground.settings, playground.trees,
+				other_options, None, test_case.requests[0]).fingerprint)
+
+			# The repository has no metadata cache, so adding or
+			# modifying an ebuild invalidates the entry.
+			pkg_dir = os.path.join(playground.settings.repositories[
+				"test_repo"].location, "dev-libs", "A")
+			new_ebuild = os.path.join(pkg_dir, "A-3.ebuild")
+			with open(new_ebuild, "w") as f:
+				f.write("EAPI=5\nSLOT=0\nKEYWORDS=x86\n")
+			self.assertNotEqual(resolver_cache.fingerprint,
+				ResolverCache(playground.settings, playground.trees,
+				options, None, test_case.requests[0]).fingerprint)
+			os.unlink(new_ebuild)
+			st = os.stat(pkg_dir)
+			os.utime(pkg_dir, (st.st_atime, st.st_mtime - 10))
+			resolver_cache = ResolverCache(playground.settings,
+				playground.trees, options, None, test_case.requests[0])
+			ebuild = os.path.join(pkg_dir, "A-2.ebuild")
+			st = os.stat(ebuild)
+			os.utime(ebuild, (st.st_atime, st.st_mtime + 10))
+			self.assertNotEqual(resolver_cache.fingerprint,
+				ResolverCache(playground.settings, playground.trees,
+				options, None, test_case.requests[0]).fingerprint)
+
+			# Any change to the installed packages invalidates the entry.
+			vardb = playground.trees[playground.eroot]["vartree"].dbapi
+			st = os.stat(vardb._dbroot)
+			os.utime(vardb._dbroot, (st.st_atime, st.st_mtime + 10))
+			resolver_cache = ResolverCache(playground.settings,
+				playground.trees, options, None, test_case.requests[0])
+			self.assertEqual(resolver_cache.get(), None)
+		finally:
+			playground.cleanup()
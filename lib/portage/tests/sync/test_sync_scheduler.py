@@ -0,0 +1,131 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.emaint.modules.sync.sync import SyncScheduler, _sync_uri_host
+from portage.sync.controller import SyncRepo
+from portage.tests import TestCase
+from portage.util._async.AsyncFunction import AsyncFunction
+from portage.util._eventloop.global_event_loop import global_event_loop
+
+
+class _FakeRepo(object):
+
+	def __init__(self, name, sync_uri, masters=()):
+		self.name = name
+		self.sync_uri = sync_uri
+		self.masters = masters
+
+
+def _fake_sync(repo=None, delay=None, post_sync=None):
+	time.sleep(delay)
+	return os.EX_OK, None, False, post_sync, post_sync
+
+
+class _RecordingSyncRepo(SyncRepo):
+
+	__slots__ = ("events",)
+
+	def _start(self):
+		self.events.append(("start", self.kwargs["repo"].name))
+		SyncRepo._start(self)
+
+	def _sync_task_exit(self, sync_task):
+		self.events.append(("synced", self.kwargs["repo"].name))
+		SyncRepo._sync_task_exit(self, sync_task)
+
+	def _post_sync_task_exit(self, post_sync_task):
+		if post_sync_task is not None:
+			self.events.append(("hooks", self.kwargs["repo"].name))
+		SyncRepo._post_sync_task_exit(self, post_sync_task)
+
+
+class _FakeSyncManager(object):
+	"""
+	Creates SyncRepo tasks which sleep instead of syncing, and records
+	when their stages start and exit.
+	"""
+
+	def __init__(self, no_hooks=()):
+		self.events = []
+		self._no_hooks = no_hooks
+
+	def sync_async(self, emerge_config=None, repo=None, master_hooks=True):
+		return _RecordingSyncRepo(events=self.events,
+			sync_task=AsyncFunction(target=_fake_sync, kwargs=dict(
+			repo=repo, delay=0.1,
+			post_sync=repo.name not in self._no_hooks)),
+			post_sync_task=AsyncFunction(target=time.sleep, args=(0.3,)),
+			sync_callback=lambda task: self.events.append(
+			("done", task.kwargs["repo"].name)))
+
+
+class SyncSchedulerTestCase(TestCase):
+
+	def testSyncUriHost(self):
+		test_cases = (
+			("rsync://rsync.gentoo.org/gentoo-portage", "rsync.gentoo.org"),
+			("https://user@GitHub.com:443/gentoo/gentoo.git", "github.com"),
+			("git@github.com:gentoo/gentoo.git", "github.com"),
+			("rsync.example.org::gentoo-portage", "rsync.example.org"),
+			("file:///var/repositories/gentoo", None),
+			("/var/repositories/gentoo", None),
+			("", None),
+			(None, None),
+		)
+		for sync_uri, host in test_cases:
+			self.assertEqual(_sync_uri_host(sync_uri), host, sync_uri)
+
+	def testSyncScheduler(self):
+		a = _FakeRepo("a", "rsync://host1/a")
+		b = _FakeRepo("b", "git@host1:b.git")
+		c = _FakeRepo("c", "https://host2/c.git")
+		d = _FakeRepo("d", "https://host2/d.git", masters=(a,))
+		e = _FakeRepo("e", "/var/repositories/e")
+		f = _FakeRepo("f", "file:///var/repositories/f")
+		repos = (a, b, c, d, e, f)
+
+		sync_manager = _FakeSyncManager(no_hooks=("f",))
+		scheduler = SyncScheduler(emerge_config=None,
+			selected_repos=repos, sync_manager=sync_manager,
+			max_jobs=3, max_host_jobs=1, event_loop=global_event_loop())
+		scheduler.start()
+		scheduler.wait()
+		events = sync_manager.events
+
+		self.assertEqual(scheduler.returncode, os.EX_OK)
+		self.assertEqual(sorted(scheduler.retvals),
+			[(repo.name, os.EX_OK) for repo in repos])
+		self.assertTrue(scheduler.global_hooks_enabled)
+
+		# The job limits only apply to running sync operations.
+		hosts = dict((repo.name, _sync_uri_host(repo.sync_uri))
+			for repo in repos)
+		syncing = set()
+		for event, name in events:
+			if event == "start":
+				syncing.add(name)
+				self.assertTrue(len(syncing) <= 3, events)
+				host = hosts[name]
+				if host is not None:
+					self.assertEqual(1, len([other for other in syncing
+						if hosts[other] == host]), events)
+			elif event == "synced":
+				syncing.remove(name)
+
+		# A repo is synced after its master, and its post-sync stage
+		# runs after its sync operation.
+		self.assertTrue(events.index(("synced", "a")) <
+			events.index(("start", "d")), events)
+		for repo in repos:
+			stages = [event for event, name in events if name == repo.name]
+			if repo.name == "f":
+				self.assertEqual(stages, ["start", "synced", "done"])
+			else:
+				self.assertEqual(stages, ["start", "synced", "hooks", "done"])
+
+		# Repos are synced while the post-sync stage of others runs.
+		self.assertTrue(events.index(("start", "d")) <
+			events.index(("done", "a")), events)
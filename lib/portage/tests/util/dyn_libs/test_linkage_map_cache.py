@@ -0,0 +1,100 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import write_atomic
+from portage.util._dyn_libs.LinkageMapELF import LinkageMapELF
+
+
+class LinkageMapCacheTestCase(TestCase):
+
+	def _write_needed(self, vardb, cpv, lines, counter):
+		write_atomic(vardb.getpath(cpv, filename="NEEDED.ELF.2"),
+			"".join(line + "\n" for line in lines))
+		write_atomic(vardb.getpath(cpv, filename="COUNTER"),
+			"%s\n" % counter)
+
+	def testLinkageMapCache(self):
+		installed = {
+			"dev-libs/A-1": {"EAPI": "7", "COUNTER": "1"},
+			"app-misc/B-1": {"EAPI": "7", "COUNTER": "2"},
+		}
+		playground = ResolverPlayground(installed=installed)
+		try:
+			vardb = playground.trees[playground.eroot]["vartree"].dbapi
+			self._write_needed(vardb, "dev-libs/A-1",
+				["X86_64;/usr/lib64/liba.so.1;liba.so.1;;libc.so.6;x86_64"], 1)
+			self._write_needed(vardb, "app-misc/B-1",
+				["X86_64;/usr/bin/b;;/usr/lib64;liba.so.1,libc.so.6;x86_64"], 2)
+
+			parsed = []
+			class _LinkageMap(LinkageMapELF):
+				def _parse_needed(self, location, l):
+					parsed.append(location)
+					return LinkageMapELF._parse_needed(self, location, l)
+
+			linkmap = _LinkageMap(vardb)
+			linkmap.rebuild()
+			self.assertEqual(len(parsed), 2)
+			self.assertTrue(os.path.exists(linkmap._needed_cache_filename))
+			self.assertEqual(linkmap.getSoname("/usr/lib64/liba.so.1"),
+				"liba.so.1")
+			self.assertEqual(linkmap.findProviders("/usr/bin/b"),
+				{"liba.so.1": set(["/usr/lib64/liba.so.1"]), "libc.so.6": set()})
+
+			# A new instance loads the parsed entries from the cache.
+			del parsed[:]
+			linkmap = _LinkageMap(vardb)
+			linkmap.rebuild()
+			self.assertEqual(parsed, [])
+			self.assertEqual(linkmap.getOwners("/usr/bin/b"), ("app-misc/B-1",))
+
+			# Only packages with a new COUNTER are parsed again.
+			self._write_needed(vardb, "dev-libs/A-1",
+				["X86_64;/usr/lib64/liba.so.2;liba.so.2;;libc.so.6;x86_64"], 3)
+			linkmap = _LinkageMap(vardb)
+			linkmap.rebuild()
+			self.assertEqual(parsed,
+				[vardb.getpath("dev-libs/A-1", filename="NEEDED.ELF.2")])
+			self.assertEqual(linkmap.findProviders("/usr/bin/b"),
+				{"liba.so.1": set(), "libc.so.6": set()})
+			self.assertEqual(linkmap.getSoname("/usr/lib64/liba.so.2"),
+				"liba.so.2")
+
+			# Excluded packages are omitted, but they remain cached.
+			del parsed[:]
+			linkmap.rebuild(exclude_pkgs=("dev-libs/A-1",))
+			self.assertEqual(parsed, [])
+			self.assertFalse("/usr/lib64/liba.so.2" in
+				linkmap.listLibraryObjects())
+			linkmap.rebuild()
+			self.assertEqual(parsed, [])
+			self.assertTrue("/usr/lib64/liba.so.2" in
+				linkmap.listLibraryObjects())
+
+			# Files removed from CONTENTS are also removed from the
+			# cached entries, even though COUNTER does not change.
+			self._write_needed(vardb, "dev-libs/A-1",
+				["X86_64;/usr/lib64/liba.so.2;liba.so.2;;libc.so.6;x86_64",
+				"X86_64;/usr/lib64/libx.so.1;libx.so.1;;libc.so.6;x86_64"], 4)
+			write_atomic(vardb.getpath("dev-libs/A-1", filename="CONTENTS"),
+				"obj /usr/lib64/liba.so.2 0 0\n"
+				"obj /usr/lib64/libx.so.1 0 0\n")
+			vardb._linkmap.rebuild()
+			self.assertTrue("/usr/lib64/libx.so.1" in
+				vardb._linkmap.listLibraryObjects())
+			vardb.removeFromContents("dev-libs/A-1",
+				["/usr/lib64/libx.so.1"])
+			del parsed[:]
+			linkmap = _LinkageMap(vardb)
+			linkmap.rebuild()
+			self.assertEqual(parsed,
+				[vardb.getpath("dev-libs/A-1", filename="NEEDED.ELF.2")])
+			for linkmap in (linkmap, vardb._linkmap):
+				linkmap.rebuild()
+				self.assertEqual(sorted(linkmap.listLibraryObjects()),
+					["/usr/lib64/liba.so.2"])
+		finally:
+			playground.cleanup()
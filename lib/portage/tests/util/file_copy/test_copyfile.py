@@ -7,7 +7,7 @@ import tempfile
 from portage import os
 from portage.tests import TestCase
 from portage.checksum import perform_md5
-from portage.util.file_copy import copyfile
+from portage.util.file_copy import copyfile, _copy_file_range_copyfile
 
 
 class CopyFileTestCase(TestCase):
@@ -69,3 +69,34 @@ class CopyFileSparseTestCase(TestCase):
 				os.stat(dest_path).st_blocks)
 		finally:
 			shutil.rmtree(tempdir)
+
+
+class CopyFileRangeTestCase(TestCase):
+
+	def testCopyFileRange(self):
+		if not (hasattr(os, 'copy_file_range') and hasattr(os, 'SEEK_DATA')):
+			self.skipTest("os.copy_file_range is not available")
+
+		tempdir = tempfile.mkdtemp()
+		try:
+			src_path = os.path.join(tempdir, 'src')
+			dest_path = os.path.join(tempdir, 'dest')
+
+			with open(src_path, 'wb') as f:
+				f.write(b'foo' * 100000)
+				f.seek(2**18, 1)
+				f.write(b'bar')
+				f.seek(2**17, 1)
+				f.truncate()
+
+			# The destination is truncated, and trailing holes are
+			# preserved.
+			with open(dest_path, 'wb') as f:
+				f.write(b'x' * 2**20)
+			_copy_file_range_copyfile(src_path, dest_path)
+
+			self.assertEqual(os.stat(src_path).st_size,
+				os.stat(dest_path).st_size)
+			self.assertEqual(perform_md5(src_path), perform_md5(dest_path))
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,72 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import os
+import signal
+
+from portage.process import find_binary, spawn
+from portage.tests import TestCase
+from portage.util._eventloop.global_event_loop import _asyncio_enabled
+
+
+class PidfdChildWatcherTestCase(TestCase):
+
+	def testPidfdChildWatcher(self):
+		if not _asyncio_enabled:
+			self.skipTest('asyncio not enabled')
+
+		import asyncio as _real_asyncio
+		from portage.util._eventloop.asyncio_event_loop import (
+			AsyncioEventLoop, _PidfdChildWatcher)
+
+		if not _PidfdChildWatcher.supported():
+			self.skipTest('pidfd_open not supported')
+
+		true_binary = find_binary("true")
+		false_binary = find_binary("false")
+		sleep_binary = find_binary("sleep")
+		self.assertNotEqual(true_binary, None)
+		self.assertNotEqual(false_binary, None)
+		self.assertNotEqual(sleep_binary, None)
+
+		loop = AsyncioEventLoop(loop=_real_asyncio.new_event_loop())
+		try:
+			watcher = loop._asyncio_child_watcher
+			self.assertTrue(isinstance(watcher, _PidfdChildWatcher))
+
+			def watch(args, *callback_args):
+				future = loop.create_future()
+				def callback(pid, returncode, *args):
+					future.set_result((pid, returncode, args))
+				pid = spawn(args, returnpid=True)[0]
+				watcher.add_child_handler(pid, callback, *callback_args)
+				return pid, future
+
+			true_pid, true_future = watch([true_binary], 'hello', 'world')
+			false_pid, false_future = watch([false_binary])
+			sleep_pid, sleep_future = watch([sleep_binary, "10"])
+			os.kill(sleep_pid, signal.SIGTERM)
+
+			self.assertEqual(loop.run_until_complete(true_future),
+				(true_pid, os.EX_OK, ('hello', 'world')))
+			self.assertEqual(loop.run_until_complete(false_future),
+				(false_pid, 1, ()))
+			self.assertEqual(loop.run_until_complete(sleep_future),
+				(sleep_pid, -signal.SIGTERM, ()))
+			self.assertEqual(watcher._callbacks, {})
+
+			# A removed handler is not called, and its pidfd is closed.
+			pid = spawn([true_binary], returnpid=True)[0]
+			watcher.add_child_handler(pid, self.fail)
+			self.assertTrue(watcher.remove_child_handler(pid))
+			self.assertFalse(watcher.remove_child_handler(pid))
+			os.waitpid(pid, 0)
+
+			# A process which has already been reaped is reported
+			# with returncode 255.
+			future = loop.create_future()
+			watcher.add_child_handler(pid,
+				lambda pid, returncode: future.set_result(returncode))
+			self.assertEqual(loop.run_until_complete(future), 255)
+		finally:
+			loop.close()
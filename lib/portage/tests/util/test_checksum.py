@@ -1,10 +1,15 @@
 # Copyright 2011-2017 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import shutil
+import tempfile
+
+from portage import os
 from portage.tests import TestCase
 
-from portage.checksum import checksum_str
-from portage.exception import DigestException
+from portage.checksum import (checksum_str, perform_checksum,
+	perform_multiple_checksums, verify_all)
+from portage.exception import DigestException, FileNotFound
 
 class ChecksumTestCase(TestCase):
 	text = b'Some test string used to check if the hash works'
@@ -104,3 +109,39 @@ class ChecksumTestCase(TestCase):
 					'330f5c26437f4e22c0163c72b12e93b8c27202f0750627355bdee43a0e0b253c90fbf0a27adbe5414019ff01ed84b7b240a1da1cbe10fae3adffc39c2d87a51f')
 		except DigestException:
 			self.skipTest('STREEBOG512 implementation not available')
+
+	def test_multiple_checksums(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tempdir, 'file')
+			# Span multiple blocks, with a partial final block.
+			data = self.text * 50000
+			with open(filename, 'wb') as f:
+				f.write(data)
+
+			hashes = ['MD5', 'SHA256', 'SHA512', 'size']
+			digests = perform_multiple_checksums(filename, hashes)
+			self.assertEqual(sorted(digests), sorted(hashes))
+			self.assertEqual(digests['size'], len(data))
+			for hashname in hashes:
+				if hashname != 'size':
+					self.assertEqual(digests[hashname],
+						checksum_str(data, hashname))
+					self.assertEqual(perform_checksum(filename, hashname),
+						(digests[hashname], len(data)))
+
+			self.assertEqual(verify_all(filename, digests),
+				(True, 'Reason unknown'))
+
+			bad_digests = dict(digests)
+			bad_digests['SHA256'] = checksum_str(b'', 'SHA256')
+			self.assertEqual(verify_all(filename, bad_digests),
+				(False, ('Failed on SHA256 verification',
+				digests['SHA256'], bad_digests['SHA256'])))
+			self.assertRaises(DigestException, verify_all, filename,
+				bad_digests, strict=1)
+
+			self.assertRaises(FileNotFound, perform_multiple_checksums,
+				os.path.join(tempdir, 'missing'), hashes)
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,87 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+import time
+
+from portage import os
+from portage.checksum import checksum_str
+from portage.tests import TestCase
+from portage.util._DigestCache import DigestCache
+
+class DigestCacheTestCase(TestCase):
+
+	def testDigestCache(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			cache_file = os.path.join(tempdir, "digest_cache")
+			distfile = os.path.join(tempdir, "distfile.tar")
+			data = b"distfile content\n"
+			with open(distfile, "wb") as f:
+				f.write(data)
+			# Avoid the racy mtime window.
+			mtime = time.time() - 100
+			os.utime(distfile, (mtime, mtime))
+
+			digests = {
+				"size": len(data),
+				"SHA256": checksum_str(data, "SHA256"),
+				"SHA512": checksum_str(data, "SHA512"),
+			}
+
+			cache = DigestCache(cache_file)
+			self.assertEqual(cache.verify_all(distfile, digests),
+				(True, "Reason unknown"))
+			self.assertEqual(os.stat(cache_file).st_mode & 0o777, 0o644)
+			st = os.stat(distfile)
+			self.assertEqual(cache.get(distfile, st, ["SHA256", "SHA512"]),
+				{"SHA256": digests["SHA256"], "SHA512": digests["SHA512"]})
+
+			# A new instance loads the entry from the file.
+			cached = DigestCache(cache_file)
+			self.assertEqual(cached.get(distfile, st, ["SHA256"]),
+				{"SHA256": digests["SHA256"]})
+			self.assertEqual(cached.get(distfile, st, ["SHA256", "MD5"]),
+				None)
+
+			# A cache file which is writable by other users is ignored,
+			# and it is not written.
+			os.chmod(cache_file, 0o664)
+			untrusted = DigestCache(cache_file)
+			self.assertEqual(untrusted.get(distfile, st, ["SHA256"]), None)
+			size = os.stat(cache_file).st_size
+			self.assertEqual(untrusted.verify_all(distfile, digests),
+				(True, "Reason unknown"))
+			self.assertEqual(os.stat(cache_file).st_size, size)
+			os.chmod(cache_file, 0o644)
+
+			# chmod changes the ctime, so the entry becomes stale.
+			os.chmod(distfile, 0o600)
+			self.assertEqual(cached.get(distfile, os.stat(distfile),
+				["SHA256"]), None)
+
+			bad_digests = dict(digests, SHA256=checksum_str(b"", "SHA256"))
+			self.assertEqual(cache.verify_all(distfile, bad_digests),
+				(False, ("Failed on SHA256 verification", digests["SHA256"],
+				bad_digests["SHA256"])))
+
+			# Modified content with the same size and mtime is detected
+			# through the ctime.
+			with open(distfile, "wb") as f:
+				f.write(data.upper())
+			os.utime(distfile, (mtime, mtime))
+			ok, reason = DigestCache(cache_file).verify_all(distfile, digests)
+			self.assertEqual(ok, False)
+			self.assertEqual(reason[0], "Failed on SHA256 verification")
+
+			# Recently modified files are not cached.
+			with open(distfile, "wb") as f:
+				f.write(data)
+			cache = DigestCache(cache_file)
+			self.assertEqual(cache.verify_all(distfile, digests),
+				(True, "Reason unknown"))
+			self.assertEqual(cache.get(distfile, os.stat(distfile),
+				["SHA256"]), None)
+		finally:
+			shutil.rmtree(tempdir)
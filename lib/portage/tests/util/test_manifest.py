@@ -0,0 +1,66 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage.exception import DigestException, FileNotFound
+from portage.manifest import Manifest
+from portage.tests import TestCase
+
+class ManifestTestCase(TestCase):
+
+	def _create(self, pkgdir, distdir, max_jobs):
+		manifest = Manifest(pkgdir, distdir,
+			fetchlist_dict={"dev-libs/A-1": ["A-1.tar"],
+				"dev-libs/A-2": ["A-2.tar"]},
+			from_scratch=True, hashes=("SHA256", "SHA512"),
+			max_jobs=max_jobs)
+		manifest.create(requiredDistfiles=["A-1.tar"])
+		return manifest
+
+	def testParallelManifest(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			pkgdir = os.path.join(tempdir, "dev-libs", "A")
+			distdir = os.path.join(tempdir, "distfiles")
+			os.makedirs(os.path.join(pkgdir, "files", "sub"))
+			os.makedirs(distdir)
+			for i in range(1, 3):
+				with open(os.path.join(pkgdir, "A-%d.ebuild" % i), "w") as f:
+					f.write("EAPI=7\n" * i)
+			for i in range(10):
+				with open(os.path.join(pkgdir, "files", "sub",
+					"%d.patch" % i), "w") as f:
+					f.write("patch\n" * i)
+			with open(os.path.join(pkgdir, "metadata.xml"), "w") as f:
+				f.write("<pkgmetadata/>\n")
+			with open(os.path.join(distdir, "A-1.tar"), "wb") as f:
+				f.write(b"\0" * 100000)
+
+			serial = self._create(pkgdir, distdir, 1)
+			parallel = self._create(pkgdir, distdir, 4)
+			self.assertEqual(parallel.fhashdict, serial.fhashdict)
+			self.assertEqual(sorted(parallel.fhashdict["AUX"]),
+				sorted(os.path.join("sub", "%d.patch" % i) for i in range(10)))
+			self.assertEqual(list(parallel.fhashdict["DIST"]), ["A-1.tar"])
+			self.assertEqual(parallel.fhashdict["DIST"]["A-1.tar"]["size"],
+				100000)
+			parallel.checkAllHashes()
+
+			# Errors are reported in the same order as serial checks.
+			parallel.fhashdict["AUX"][os.path.join("sub", "3.patch")]["SHA256"] = \
+				parallel.fhashdict["AUX"][os.path.join("sub", "4.patch")]["SHA256"]
+			os.unlink(os.path.join(pkgdir, "files", "sub", "5.patch"))
+			self.assertRaises(DigestException, parallel.checkAllHashes)
+			self.assertRaises(DigestException, parallel.checkTypeHashes,
+				"AUX", ignoreMissingFiles=True)
+			del parallel.fhashdict["AUX"][os.path.join("sub", "3.patch")]
+			self.assertRaises(FileNotFound, parallel.checkTypeHashes, "AUX")
+			parallel.checkTypeHashes("AUX", ignoreMissingFiles=True)
+
+			os.unlink(os.path.join(distdir, "A-1.tar"))
+			self.assertRaises(FileNotFound, self._create, pkgdir, distdir, 4)
+		finally:
+			shutil.rmtree(tempdir)
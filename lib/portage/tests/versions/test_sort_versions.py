@@ -0,0 +1,35 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.util import cmp_sort_key
+from portage.versions import best, sort_versions, vercmp, _pkg_str
+
+class SortVersionsTestCase(TestCase):
+
+	def testSortVersions(self):
+
+		cpvs = ("a/b-1.0.0", "a/b-1.0b", "a/b-1.01", "a/b-1.1",
+			"a/b-1_alpha", "a/b-1", "a/b-1-r1", "a/b-1_p0", "a/b-1.0",
+			"a/b-1.02", "a/b-1.020", "a/b-12.2b", "a/b-12.2.5",
+			"a/b-1_rc1_p2", "a/b-1_rc2", "a/b-1_p1_alpha", "a/b-1-r0")
+
+		expected = sorted(cpvs,
+			key=cmp_sort_key(lambda x, y: vercmp(x[4:], y[4:])))
+		self.assertEqual(sort_versions(cpvs), expected)
+		self.assertEqual(sort_versions(_pkg_str(x) for x in cpvs), expected)
+		self.assertEqual(sort_versions(reversed(cpvs), reverse=True),
+			list(reversed(expected)))
+
+		self.assertEqual(best(cpvs), "a/b-12.2.5")
+		self.assertEqual(best(["a/b-1.0", "a/b-1.0-r0"]), "a/b-1.0")
+		self.assertEqual(best(["a/b-1.0-r0", "a/b-1.0"]), "a/b-1.0-r0")
+		self.assertEqual(best([]), "")
+
+		for x in cpvs:
+			for y in cpvs:
+				x_key = _pkg_str(x).version_key
+				y_key = _pkg_str(y).version_key
+				result = vercmp(x[4:], y[4:])
+				self.assertEqual((x_key > y_key) - (x_key < y_key),
+					(result > 0) - (result < 0), msg="%s %s" % (x, y))
@@ -45,6 +45,12 @@ class VerCmpTestCase(TestCase):
 			("1", "1b"),
 			("1.1", "1.1b"),
 			("12.2b", "12.2.5"),
+			("1.02", "1.1"),
+			("1.05", "1.5"),
+			("1.0", "1.01"),
+			("1_alpha", "1"),
+			("1_p1_alpha", "1_p1"),
+			("1_rc1_p2", "1_rc2"),
 		]
 		for test in tests:
 			self.assertFalse(vercmp(test[0], test[1]) >= 0, msg="%s > %s? Wrong!" % (test[0], test[1]))
@@ -57,7 +63,10 @@ class VerCmpTestCase(TestCase):
 			("1.0-r0", "1.0"),
 			("1.0", "1.0-r0"),
 			("1.0-r0", "1.0-r0"),
-			("1.0-r1", "1.0-r1")
+			("1.0-r1", "1.0-r1"),
+			("1.05", "1.050"),
+			("01.2", "1.2"),
+			("1_p01", "1_p1"),
 		]
 		for test in tests:
 			self.assertFalse(vercmp(test[0], test[1]) != 0, msg="%s != %s? Wrong!" % (test[0], test[1]))
@@ -0,0 +1,71 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import mmap
+import shutil
+import tempfile
+
+from portage import os
+from portage.tests import TestCase
+from portage.xpak import (XpakReader, encodeint, iter_xpak_data,
+	searchindex, tbz2, xpak_mem, xsplit_mem)
+
+class XpakReaderTestCase(TestCase):
+
+	def _write_tbz2(self, filename, data, tarball_size):
+		xpdata = xpak_mem(data)
+		with open(filename, "wb") as f:
+			f.write(b"\0" * tarball_size)
+			f.write(xpdata + encodeint(len(xpdata)) + b"STOP")
+
+	def testXpakReader(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			data = {
+				"CATEGORY": b"dev-libs\n",
+				"PF": b"A-1\n",
+				"environment.bz2": b"x" * 5000,
+			}
+			filenames = []
+			# The xpak segment may start at any offset, including one
+			# which is not a multiple of the allocation granularity.
+			for tarball_size in (0, 1, mmap.ALLOCATIONGRANULARITY + 7):
+				filename = os.path.join(tempdir, "A-%d.tbz2" % tarball_size)
+				self._write_tbz2(filename, data, tarball_size)
+				filenames.append(filename)
+
+				index, segment = xsplit_mem(xpak_mem(data))
+				expected = {}
+				for name in data:
+					datapos, datalen = searchindex(index, name)
+					expected[name.encode("utf_8")] = \
+						segment[datapos:datapos + datalen]
+
+				with XpakReader(filename) as reader:
+					self.assertEqual(sorted(reader.keys()), sorted(expected))
+					value = reader.get("PF")
+					self.assertEqual(bytes(value), b"A-1\n")
+					if isinstance(value, memoryview):
+						value.release()
+					self.assertEqual(reader.get("missing"), None)
+					self.assertEqual(reader.get_data(), expected)
+				self.assertEqual(tbz2(filename).get_data(), expected)
+
+			invalid = os.path.join(tempdir, "invalid.tbz2")
+			with open(invalid, "wb") as f:
+				f.write(b"not a binary package")
+			filenames.append(invalid)
+			with XpakReader(invalid) as reader:
+				self.assertEqual(reader.keys(), [])
+				self.assertEqual(reader.get_data(), {})
+			self.assertEqual(tbz2(invalid).get_data(), {})
+			filenames.append(os.path.join(tempdir, "missing.tbz2"))
+
+			results = list(iter_xpak_data(filenames, readahead=2))
+			self.assertEqual([filename for filename, mydata in results],
+				filenames)
+			self.assertEqual([len(mydata) for filename, mydata in results],
+				[3, 3, 3, 0, 0])
+			self.assertEqual(results[2][1][b"CATEGORY"], b"dev-libs\n")
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,291 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import json
+import sys
+import time
+
+import portage
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.checksum import hashfunc_keys, perform_multiple_checksums
+from portage.const import CACHE_PATH
+from portage.exception import FileNotFound, PortageException
+from portage.localization import _
+from portage.util import apply_secpass_permissions, atomic_ofstream, writemsg
+
+portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.data:portage_gid,portage_uid',
+)
+
+if sys.hexversion >= 0x3000000:
+	# pylint: disable=W0622
+	long = int
+
+class DigestCache(object):
+	"""
+	A persistent cache of file digests, which are recorded together
+	with the stat identity (device, inode, size, mtime and ctime) of
+	each file, so that verification of a file which has not changed
+	since it was last hashed does not need to read the file. This is
+	enabled by FEATURES=digest-cache, and disabling the feature causes
+	all files to be read again (paranoid mode).
+
+	The cache file consists of JSON lines of the form
+	[path, identity, digests], and new entries are appended to it with
+	O_APPEND, so that concurrent processes (such as parallel fetchers)
+	can safely update it. When an entry is loaded, later lines take
+	precedence over earlier lines for the same path, and the file is
+	compacted when it contains too many superseded lines.
+
+	Since a cache entry is a substitute for hashing the file, the cache
+	file is created with mode 0644 and owned by the portage user, and it
+	is ignored if it is writable by its group or others, or if it is
+	owned by another user.
+	"""
+
+	# Files which have been modified more recently than this number of
+	# seconds before hashing began are not cached, since a modification
+	# during or shortly after hashing might not change their mtime.
+	_racy_seconds = 2
+
+	def __init__(self, filename):
+		self._filename = filename
+		self._entries = None
+		self._trusted = True
+		self._write_failed = False
+
+	@property
+	def filename(self):
+		return self._filename
+
+	@staticmethod
+	def _identity(st):
+		try:
+			mtime = st.st_mtime_ns
+			ctime = st.st_ctime_ns
+		except AttributeError:
+			mtime = long(st.st_mtime * 1000000000)
+			ctime = long(st.st_ctime * 1000000000)
+		return [st.st_dev, st.st_ino, st.st_size, mtime, ctime]
+
+	def _load(self):
+		entries = {}
+		line_count = 0
+		try:
+			f = open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE, errno.EACCES):
+				writemsg("!!! Error loading '%s': %s\n" %
+					(self._filename, e), noiselevel=-1)
+		else:
+			with f:
+				st = os.fstat(f.fileno())
+				if not self._trusted_stat(st):
+					writemsg(_("!!! Ignoring '%s', since it is writable by "
+						"other users\n") % (self._filename,), noiselevel=-1)
+					self._entries = entries
+					self._trusted = False
+					return
+				for line in f:
+					line_count += 1
+					try:
+						path, identity, digests = json.loads(
+							_unicode_decode(line, encoding=_encodings['repo.content'],
+							errors='strict'))
+					except (TypeError, ValueError):
+						# Truncated or corrupt line.
+						continue
+					if isinstance(digests, dict):
+						entries[path] = (identity, digests)
+
+		self._entries = entries
+		if line_count > 2 * len(entries) + 1000:
+			self._compact()
+
+	@staticmethod
+	def _trusted_stat(st):
+		"""
+		Return True if only root, the portage user, or the current user
+		can write to a file with the given stat result.
+		"""
+		return not st.st_mode & 0o022 and \
+			st.st_uid in (0, int(portage_uid), os.getuid())
+
+	def _apply_permissions(self):
+		try:
+			apply_secpass_permissions(self._filename, uid=portage_uid,
+				gid=portage_gid, mode=0o644)
+		except (OSError, PortageException):
+			pass
+
+	def _compact(self):
+		entries = self._entries
+		for path in list(entries):
+			try:
+				st = os.stat(path)
+			except OSError:
+				del entries[path]
+				continue
+			if self._identity(st) != entries[path][0]:
+				del entries[path]
+		try:
+			f = atomic_ofstream(self._filename, mode='wb')
+		except EnvironmentError:
+			return
+		try:
+			for path, (identity, digests) in entries.items():
+				f.write(self._encode_entry(path, identity, digests))
+		except EnvironmentError:
+			f.abort()
+		else:
+			f.close()
+			self._apply_permissions()
+
+	@staticmethod
+	def _encode_entry(path, identity, digests):
+		return _unicode_encode(json.dumps([path, identity, digests]) + "\n",
+			encoding=_encodings['repo.content'], errors='strict')
+
+	def get(self, filename, st, hashnames):
+		"""
+		Return a dict of cached digests for the given hash names, or
+		None if some of them are not cached for the current identity of
+		the file.
+
+		@param filename: absolute path of the file
+		@type filename: str
+		@param st: result of os.stat for the file
+		@type st: stat_result
+		@param hashnames: names of the required hashes
+		@type hashnames: iterable
+		"""
+		if self._entries is None:
+			self._load()
+		entry = self._entries.get(_unicode_decode(filename))
+		if entry is None or entry[0] != self._identity(st):
+			return None
+		digests = entry[1]
+		result = {}
+		for hashname in hashnames:
+			if hashname not in digests:
+				return None
+			result[hashname] = digests[hashname]
+		return result
+
+	def set(self, filename, st, digests, start_time):
+		"""
+		Record digests for a file, if its identity is still the same as
+		the given stat result, and it was not modified too close to the
+		time at which hashing began.
+
+		@param filename: absolute path of the file
+		@type filename: str
+		@param st: result of os.stat for the file before hashing began
+		@type st: stat_result
+		@param digests: a dict of digests, which are merged with other
+			digests that are cached for the same identity
+		@type digests: dict
+		@param start_time: time.time() before hashing began
+		@type start_time: float
+		"""
+		if st.st_mtime > start_time - self._racy_seconds:
+			return
+		try:
+			current_st = os.stat(filename)
+		except OSError:
+			return
+		identity = self._identity(current_st)
+		if identity != self._identity(st):
+			return
+
+		if self._entries is None:
+			self._load()
+		filename = _unicode_decode(filename)
+		entry = self._entries.get(filename)
+		if entry is not None and entry[0] == identity:
+			merged = dict(entry[1])
+			merged.update(digests)
+			digests = merged
+		digests.pop("size", None)
+		self._entries[filename] = (identity, digests)
+
+		if self._write_failed or not self._trusted:
+			return
+		created = not os.path.exists(self._filename)
+		try:
+			fd = os.open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'),
+				os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		except OSError:
+			# Insufficient privileges, or missing CACHE_PATH.
+			self._write_failed = True
+			return
+		if created:
+			self._apply_permissions()
+		try:
+			os.write(fd, self._encode_entry(filename, identity, digests))
+		except OSError:
+			self._write_failed = True
+		finally:
+			os.close(fd)
+
+	def verify_all(self, filename, mydict):
+		"""
+		Like portage.checksum.verify_all, but digests are taken from the
+		cache when possible, and computed digests are recorded in the
+		cache. The strict and calc_prelink parameters of verify_all are
+		not supported.
+		"""
+		try:
+			st = os.stat(filename)
+		except OSError as e:
+			if e.errno == errno.ENOENT:
+				raise FileNotFound(filename)
+			return False, (str(e), None, None)
+		if mydict.get("size") is not None and mydict["size"] != st.st_size:
+			return False, (_("Filesize does not match recorded size"),
+				st.st_size, mydict["size"])
+
+		verifiable_hash_types = set(mydict).intersection(hashfunc_keys)
+		verifiable_hash_types.discard("size")
+		if not verifiable_hash_types:
+			expected = set(hashfunc_keys)
+			expected.discard("size")
+			got = set(mydict)
+			got.discard("size")
+			return False, (_("Insufficient data for checksum verification"),
+				" ".join(sorted(got)), " ".join(sorted(expected)))
+
+		abs_filename = os.path.abspath(filename)
+		myhashes = self.get(abs_filename, st, verifiable_hash_types)
+		if myhashes is None:
+			start_time = time.time()
+			myhashes = perform_multiple_checksums(filename,
+				verifiable_hash_types)
+			self.set(abs_filename, st, dict(myhashes), start_time)
+
+		for x in sorted(verifiable_hash_types):
+			if mydict[x] != myhashes[x]:
+				return False, (("Failed on %s verification" % x),
+					myhashes[x], mydict[x])
+
+		return True, "Reason unknown"
+
+_digest_caches = {}
+
+def get_digest_cache(settings):
+	"""
+	Return the DigestCache for the given config, or None if
+	FEATURES=digest-cache is not enabled.
+	"""
+	if "digest-cache" not in settings.features:
+		return None
+	filename = os.path.join(settings["EROOT"], CACHE_PATH, "digest_cache")
+	cache = _digest_caches.get(filename)
+	if cache is None:
+		cache = DigestCache(filename)
+		_digest_caches[filename] = cache
+	return cache
@@ -1,11 +1,23 @@
-# Copyright 2008-2018 Gentoo Foundation
+# Copyright 2008-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 import fcntl
 import errno
 import gzip
+import stat
 import sys
 
+try:
+	import threading
+except ImportError:
+	# dummy_threading will not suffice
+	threading = None
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
 import portage
 from portage import os, _encodings, _unicode_encode
 from _emerge.AbstractPollTask import AbstractPollTask
@@ -18,32 +30,61 @@ class PipeLogger(AbstractPollTask):
 	also monitor for EOF on input_fd, which may be used to detect
 	termination of a child process. If log_file_path ends with
 	'.gz' then the log file is written with compression.
+
+	If log_file_exclusive is True, then the caller guarantees that
+	nothing else appends to the log file until this logger exits,
+	so that output can be moved to the log file with splice.
 	"""
 
-	__slots__ = ("input_fd", "log_file_path", "stdout_fd") + \
-		("_log_file", "_log_file_real")
+	__slots__ = ("input_fd", "log_file_exclusive", "log_file_path",
+		"stdout_fd") + \
+		("_log_file", "_log_file_real", "_splice_fd", "_splice_offset")
+
+	# Read up to the default pipe capacity at once.
+	_bufsize = 65536
+
+	# Write at most this much data at once, when data is read from
+	# the pipe faster than it can be written.
+	_batch_size = 1048576
 
 	def _start(self):
 
+		if isinstance(self.input_fd, int):
+			fd = self.input_fd
+		else:
+			fd = self.input_fd.fileno()
+
 		log_file_path = self.log_file_path
 		if log_file_path is not None:
 
+			# Unbuffered, so that each batch of output is written with
+			# a single write call, without copying it into a buffer.
 			self._log_file = open(_unicode_encode(log_file_path,
-				encoding=_encodings['fs'], errors='strict'), mode='ab')
+				encoding=_encodings['fs'], errors='strict'), mode='ab',
+				buffering=0)
 			if log_file_path.endswith('.gz'):
 				self._log_file_real = self._log_file
-				self._log_file = gzip.GzipFile(filename='', mode='ab',
-					fileobj=self._log_file)
+				self._log_file = _CompressedLogWriter(
+					gzip.GzipFile(filename='', mode='ab',
+					fileobj=self._log_file_real))
+			elif self.log_file_exclusive and \
+				(self.background or self.stdout_fd is None) and \
+				hasattr(os, 'splice') and \
+				stat.S_ISFIFO(os.fstat(fd).st_mode):
+				# Move data from the pipe to the log file inside the
+				# kernel. This requires a file descriptor which is not
+				# in append mode, so seeking to the end of the file and
+				# splicing is not atomic, and it is only safe while this
+				# logger is the only writer.
+				self._splice_fd = os.open(_unicode_encode(log_file_path,
+					encoding=_encodings['fs'], errors='strict'), os.O_WRONLY)
+				self._splice_offset = os.lseek(self._splice_fd, 0,
+					os.SEEK_END)
 
 			portage.util.apply_secpass_permissions(log_file_path,
 				uid=portage.portage_uid, gid=portage.portage_gid,
 				mode=0o660)
 
-		if isinstance(self.input_fd, int):
-			fd = self.input_fd
-		else:
-			fd = self.input_fd.fileno()
-
 		fcntl.fcntl(fd, fcntl.F_SETFL,
 			fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
 
@@ -65,24 +106,70 @@ class PipeLogger(AbstractPollTask):
 		if self.returncode is None:
 			self.returncode = self._cancelled_returncode
 
+	def _splice(self, fd):
+		"""
+		Move data from the pipe to the log file with splice, until the
+		pipe is empty.
+
+		@rtype: bool or None
+		@return: True for EOF, False if the pipe is empty, and None if
+			splice is not supported for the log file, or if something
+			else has appended to the log file
+		"""
+		splice_fd = self._splice_fd
+		while True:
+			if os.lseek(splice_fd, 0, os.SEEK_END) != self._splice_offset:
+				# Something else has appended to the log file, despite
+				# log_file_exclusive, so use append mode from now on.
+				n = None
+			else:
+				try:
+					n = os.splice(fd, splice_fd, self._batch_size,
+						flags=os.SPLICE_F_NONBLOCK)
+				except OSError as e:
+					if e.errno == errno.EAGAIN:
+						return False
+					if e.errno != errno.EINVAL:
+						raise
+					# The file system does not support splice.
+					n = None
+			if n is None:
+				os.close(splice_fd)
+				self._splice_fd = None
+				return None
+			if n == 0:
+				return True
+			self._splice_offset += n
+
 	def _output_handler(self, fd):
 
+		if self._splice_fd is not None:
+			eof = self._splice(fd)
+			if eof is not None:
+				if eof:
+					self._eof()
+				return
+
 		background = self.background
 		stdout_fd = self.stdout_fd
-		log_file = self._log_file 
+		log_file = self._log_file
+		batch = []
+		batch_size = 0
 
 		while True:
 			buf = self._read_buf(fd)
 
 			if buf is None:
 				# not a POLLIN event, EAGAIN, etc...
+				if batch:
+					log_file.write(b''.join(batch))
 				break
 
 			if not buf:
 				# EOF
-				self._unregister()
-				self.returncode = self.returncode or os.EX_OK
-				self._async_wait()
+				if batch:
+					log_file.write(b''.join(batch))
+				self._eof()
 				break
 
 			else:
@@ -120,8 +207,17 @@ class PipeLogger(AbstractPollTask):
 								fcntl.F_GETFL) ^ os.O_NONBLOCK)
 
 				if log_file is not None:
-					log_file.write(buf)
-					log_file.flush()
+					batch.append(buf)
+					batch_size += len(buf)
+					if batch_size >= self._batch_size:
+						log_file.write(b''.join(batch))
+						batch = []
+						batch_size = 0
+
+	def _eof(self):
+		self._unregister()
+		self.returncode = self.returncode or os.EX_OK
+		self._async_wait()
 
 	def _unregister(self):
 		if self.input_fd is not None:
@@ -137,6 +233,10 @@ class PipeLogger(AbstractPollTask):
 			os.close(self.stdout_fd)
 			self.stdout_fd = None
 
+		if self._splice_fd is not None:
+			os.close(self._splice_fd)
+			self._splice_fd = None
+
 		if self._log_file is not None:
 			self._log_file.close()
 			self._log_file = None
@@ -147,3 +247,70 @@ class PipeLogger(AbstractPollTask):
 			self._log_file_real = None
 
 		self._registered = False
+
+
+class _CompressedLogWriter(object):
+	"""
+	Compresses log output in a separate thread, so that compression
+	does not delay the event loop. Data is passed to the thread through
+	a bounded queue, so that the amount of buffered data is limited
+	when compression is slower than the build's output. The compressed
+	stream is flushed when the queue becomes empty, so that the log is
+	readable while the build is running. Without threading support,
+	data is compressed synchronously.
+	"""
+
+	_queue_size = 16
+
+	def __init__(self, gzip_file):
+		self._gzip_file = gzip_file
+		self._exception = None
+		self._thread = None
+		if threading is not None:
+			self._queue = queue.Queue(self._queue_size)
+			self._thread = threading.Thread(target=self._compress_thread)
+			self._thread.daemon = True
+			self._thread.start()
+
+	def _compress_thread(self):
+		gzip_file = self._gzip_file
+		while True:
+			buf = self._queue.get()
+			if buf is None:
+				break
+			if self._exception is not None:
+				continue
+			try:
+				gzip_file.write(buf)
+				if self._queue.empty():
+					gzip_file.flush()
+			except Exception as e:
+				self._exception = e
+
+	def _check_exception(self):
+		if self._exception is not None:
+			e = self._exception
+			self._exception = None
+			raise e
+
+	def write(self, buf):
+		if self._thread is None:
+			self._gzip_file.write(buf)
+			self._gzip_file.flush()
+			return
+		self._check_exception()
+		self._queue.put(buf)
+
+	def close(self):
+		"""
+		Wait for buffered data to be compressed, and close the gzip
+		stream. The underlying file is not closed.
+		"""
+		if self._thread is not None:
+			self._queue.put(None)
+			self._thread.join()
+			self._thread = None
+		try:
+			self._check_exception()
+		finally:
+			self._gzip_file.close()
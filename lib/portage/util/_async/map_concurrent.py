@@ -0,0 +1,49 @@
+# Copyright 2019 Gentoo Authors
+# Distributed under the terms of the GNU General Public License v2
+
+import functools
+
+import portage
+portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.util.futures:asyncio',
+	'portage.util.futures.executor.fork:ForkExecutor',
+	'portage.util._eventloop.EventLoop:EventLoop',
+)
+
+try:
+	from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+	ThreadPoolExecutor = None
+
+def _guarded_call(func, args):
+	try:
+		return func(*args), None
+	except Exception as e:
+		return None, e
+
+def map_concurrent(func, args_list, max_jobs, fork=False):
+	"""
+	Call func with each tuple of arguments in args_list, and return a
+	list of (result, exception) tuples in the same order. Up to max_jobs
+	calls run concurrently in a thread pool, or in forked processes if
+	fork is True, which is needed for functions that hold the GIL.
+	"""
+	if max_jobs <= 1 or len(args_list) <= 1 or \
+		(not fork and ThreadPoolExecutor is None):
+		return [_guarded_call(func, args) for args in args_list]
+
+	max_jobs = min(max_jobs, len(args_list))
+	if not fork:
+		with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+			return list(executor.map(functools.partial(_guarded_call, func),
+				args_list))
+
+	loop = EventLoop(main=False)
+	try:
+		with ForkExecutor(max_workers=max_jobs, loop=loop) as executor:
+			futures = [executor.submit(func, *args) for args in args_list]
+			loop.run_until_complete(asyncio.wait(futures, loop=loop))
+	finally:
+		loop.close()
+	return [(None, future.exception()) if future.exception() is not None
+		else (future.result(), None) for future in futures]
@@ -1,4 +1,4 @@
-# Copyright 1998-2016 Gentoo Foundation
+# Copyright 1998-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -6,21 +6,29 @@ import logging
 import subprocess
 import sys
 
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
 import portage
+from portage import os
 from portage import _encodings
 from portage import _os_merge
 from portage import _unicode_decode
 from portage import _unicode_encode
 from portage.cache.mappings import slot_dict_class
-from portage.const import EPREFIX
+from portage.const import CACHE_PATH, EPREFIX
 from portage.dep.soname.multilib_category import compute_multilib_category
-from portage.exception import CommandNotFound, InvalidData
+from portage.exception import CommandNotFound, InvalidData, \
+	PortageException
 from portage.localization import _
-from portage.util import getlibpaths
+from portage.util import apply_secpass_permissions, atomic_ofstream, \
+	ensure_dirs, getlibpaths
 from portage.util import grabfile
 from portage.util import normalize_path
 from portage.util import varexpand
-from portage.util import writemsg_level
+from portage.util import writemsg, writemsg_level
 from portage.util._dyn_libs.NeededEntry import NeededEntry
 from portage.util.elf.header import ELFHeader
 
@@ -57,6 +65,7 @@ class LinkageMapELF(object):
 	"""Models dynamic linker dependencies."""
 
 	_needed_aux_key = "NEEDED.ELF.2"
+	_needed_cache_version = "2"
 	_soname_map_class = slot_dict_class(
 		("consumers", "providers"), prefix="")
 
@@ -81,6 +90,9 @@ class LinkageMapELF(object):
 		self._obj_key_cache = {}
 		self._defpath = set()
 		self._path_key_cache = {}
+		self._needed_cache = None
+		self._needed_cache_filename = os.path.join(self._dbapi._eroot,
+			CACHE_PATH, "linkage_map.pickle")
 
 	def _clear_cache(self):
 		self._libs.clear()
@@ -226,26 +238,22 @@ class LinkageMapELF(object):
 		libs = self._libs
 		obj_properties = self._obj_properties
 
-		lines = []
+		entries = []
 
 		# Data from include_file is processed first so that it
 		# overrides any data from previously installed files.
 		if include_file is not None:
 			for line in grabfile(include_file):
-				lines.append((None, include_file, line))
+				entry = self._parse_needed(include_file, line)
+				if entry is not None:
+					entries.append((None, entry))
 
-		aux_keys = [self._needed_aux_key]
 		can_lock = os.access(os.path.dirname(self._dbapi._dbroot), os.W_OK)
 		if can_lock:
 			self._dbapi.lock()
 		try:
-			for cpv in self._dbapi.cpv_all():
-				if exclude_pkgs is not None and cpv in exclude_pkgs:
-					continue
-				needed_file = self._dbapi.getpath(cpv,
-					filename=self._needed_aux_key)
-				for line in self._dbapi.aux_get(cpv, aux_keys)[0].splitlines():
-					lines.append((cpv, needed_file, line))
+			for cpv, pkg_entries in self._iter_needed(exclude_pkgs):
+				entries.extend((cpv, entry) for entry in pkg_entries)
 		finally:
 			if can_lock:
 				self._dbapi.unlock()
@@ -310,7 +318,9 @@ class LinkageMapELF(object):
 					entry.multilib_category = compute_multilib_category(elf_header)
 					entry.filename = entry.filename[root_len:]
 					owner = plibs.pop(entry.filename, None)
-					lines.append((owner, "scanelf", _unicode(entry)))
+					entry = self._parse_needed("scanelf", _unicode(entry))
+					if entry is not None:
+						entries.append((owner, entry))
 				proc.wait()
 				proc.stdout.close()
 
@@ -322,49 +332,17 @@ class LinkageMapELF(object):
 			# is important in order to prevent findConsumers from raising
 			# an unwanted KeyError.
 			for x, cpv in plibs.items():
-				lines.append((cpv, "plibs", ";".join(['', x, '', '', ''])))
+				entry = self._parse_needed("plibs",
+					";".join(['', x, '', '', '']))
+				if entry is not None:
+					entries.append((cpv, entry))
 
 		# Share identical frozenset instances when available,
 		# in order to conserve memory.
 		frozensets = {}
 
-		for owner, location, l in lines:
-			l = l.rstrip("\n")
-			if not l:
-				continue
-			if '\0' in l:
-				# os.stat() will raise "TypeError: must be encoded string
-				# without NULL bytes, not str" in this case.
-				writemsg_level(_("\nLine contains null byte(s) " \
-					"in %s: %s\n\n") % (location, l),
-					level=logging.ERROR, noiselevel=-1)
-				continue
-			try:
-				entry = NeededEntry.parse(location, l)
-			except InvalidData as e:
-				writemsg_level("\n%s\n\n" % (e,),
-					level=logging.ERROR, noiselevel=-1)
-				continue
-
-			# If NEEDED.ELF.2 contains the new multilib category field,
-			# then use that for categorization. Otherwise, if a mapping
-			# exists, map e_machine (entry.arch) to an approximate
-			# multilib category. If all else fails, use e_machine, just
-			# as older versions of portage did.
-			arch = entry.multilib_category
-			if arch is None:
-				arch = _approx_multilib_categories.get(
-					entry.arch, entry.arch)
-
-			obj = entry.filename
-			soname = entry.soname
-			expand = {"ORIGIN": os.path.dirname(entry.filename)}
-			path = frozenset(normalize_path(
-				varexpand(x, expand, error_leader=lambda: "%s: " % location))
-				for x in entry.runpaths)
+		for owner, (arch, obj, soname, path, needed) in entries:
 			path = frozensets.setdefault(path, path)
-			needed = frozenset(entry.needed)
-
 			needed = frozensets.setdefault(needed, needed)
 
 			obj_key = self._obj_key(obj)
@@ -409,6 +387,152 @@ class LinkageMapELF(object):
 				soname_node.providers = tuple(set(soname_node.providers))
 				soname_node.consumers = tuple(set(soname_node.consumers))
 
+	def _parse_needed(self, location, l):
+		"""
+		Parse a NEEDED.ELF.2 line, and return an
+		(arch, obj, soname, runpaths, needed) tuple, or None if the line
+		is empty or invalid.
+		"""
+		os = _os_merge
+		l = l.rstrip("\n")
+		if not l:
+			return None
+		if '\0' in l:
+			# os.stat() will raise "TypeError: must be encoded string
+			# without NULL bytes, not str" in this case.
+			writemsg_level(_("\nLine contains null byte(s) " \
+				"in %s: %s\n\n") % (location, l),
+				level=logging.ERROR, noiselevel=-1)
+			return None
+		try:
+			entry = NeededEntry.parse(location, l)
+		except InvalidData as e:
+			writemsg_level("\n%s\n\n" % (e,),
+				level=logging.ERROR, noiselevel=-1)
+			return None
+
+		# If NEEDED.ELF.2 contains the new multilib category field,
+		# then use that for categorization. Otherwise, if a mapping
+		# exists, map e_machine (entry.arch) to an approximate
+		# multilib category. If all else fails, use e_machine, just
+		# as older versions of portage did.
+		arch = entry.multilib_category
+		if arch is None:
+			arch = _approx_multilib_categories.get(
+				entry.arch, entry.arch)
+
+		expand = {"ORIGIN": os.path.dirname(entry.filename)}
+		path = frozenset(normalize_path(
+			varexpand(x, expand, error_leader=lambda: "%s: " % location))
+			for x in entry.runpaths)
+		return (arch, entry.filename, entry.soname, path,
+			frozenset(entry.needed))
+
+	def _iter_needed(self, exclude_pkgs=None):
+		"""
+		Generate (cpv, entries) for all installed packages, where
+		entries are parsed NEEDED.ELF.2 lines as returned by
+		_parse_needed. Parsed entries are cached on disk together with
+		the COUNTER and directory mtime of each package, so that only
+		the NEEDED.ELF.2 files of packages which have been merged or
+		modified since the last call are parsed again. The vardbapi
+		must be locked by the caller, if possible.
+		"""
+		cache = self._needed_cache
+		if cache is None:
+			cache = self._needed_cache = self._load_needed_cache()
+		modified = False
+		installed = set()
+		for cpv in self._dbapi.cpv_all():
+			cpv = _unicode(cpv)
+			installed.add(cpv)
+			if exclude_pkgs is not None and cpv in exclude_pkgs:
+				continue
+			key = tuple(self._dbapi.aux_get(cpv, ["COUNTER", "_mtime_"]))
+			cached = cache.get(cpv)
+			if cached is not None and cached[0] == key:
+				pkg_entries = cached[1]
+			else:
+				needed_file = self._dbapi.getpath(cpv,
+					filename=self._needed_aux_key)
+				pkg_entries = []
+				for line in self._dbapi.aux_get(cpv,
+					[self._needed_aux_key])[0].splitlines():
+					entry = self._parse_needed(needed_file, line)
+					if entry is not None:
+						pkg_entries.append(entry)
+				pkg_entries = tuple(pkg_entries)
+				cache[cpv] = (key, pkg_entries)
+				modified = True
+			yield cpv, pkg_entries
+
+		for cpv in list(cache):
+			if cpv not in installed:
+				del cache[cpv]
+				modified = True
+
+		if modified:
+			self._save_needed_cache(cache)
+
+	def _discard_needed_cache(self, cpv):
+		"""
+		Discard cached entries for a package whose NEEDED.ELF.2 file
+		has been rewritten, since its COUNTER does not change, and its
+		directory mtime may not change either if the rewrite happens
+		within the resolution of file system timestamps.
+		"""
+		cache = self._needed_cache
+		if cache is None:
+			cache = self._needed_cache = self._load_needed_cache()
+		if cache.pop(_unicode(cpv), None) is not None:
+			self._save_needed_cache(cache)
+
+	def _load_needed_cache(self):
+		try:
+			with open(_unicode_encode(self._needed_cache_filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				mypickle = pickle.Unpickler(f)
+				try:
+					mypickle.find_global = None
+				except AttributeError:
+					# TODO: If py3k, override Unpickler.find_class().
+					pass
+				cache = mypickle.load()
+		except (SystemExit, KeyboardInterrupt):
+			raise
+		except Exception as e:
+			if not (isinstance(e, EnvironmentError) and
+				getattr(e, 'errno', None) in (errno.ENOENT, errno.EACCES)):
+				writemsg(_("!!! Error loading '%s': %s\n") % \
+					(self._needed_cache_filename, e), noiselevel=-1)
+			return {}
+
+		if not isinstance(cache, dict) or \
+			cache.get("version") != self._needed_cache_version or \
+			not isinstance(cache.get("packages"), dict):
+			return {}
+		return cache["packages"]
+
+	def _save_needed_cache(self, packages):
+		try:
+			ensure_dirs(os.path.dirname(self._needed_cache_filename))
+			f = atomic_ofstream(self._needed_cache_filename, mode='wb')
+		except (EnvironmentError, PortageException):
+			# The current user doesn't have permission to write
+			# the cache, but that's alright.
+			return
+		try:
+			pickle.dump({"version": self._needed_cache_version,
+				"packages": packages}, f, protocol=2)
+		except EnvironmentError as e:
+			f.abort()
+			writemsg(_("!!! Error writing '%s': %s\n") % \
+				(self._needed_cache_filename, e), noiselevel=-1)
+		else:
+			f.close()
+			apply_secpass_permissions(self._needed_cache_filename,
+				mode=0o644)
+
 	def listBrokenBinaries(self, debug=False):
 		"""
 		Find binaries and their needed sonames, which have no providers.
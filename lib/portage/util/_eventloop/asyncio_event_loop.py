@@ -1,6 +1,8 @@
-# Copyright 2018 Gentoo Foundation
+# Copyright 2018-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
+import errno
+import logging
 import os
 import pdb
 import signal
@@ -15,6 +17,7 @@ except ImportError:
 	_AbstractEventLoop = object
 
 import portage
+from portage.util import writemsg_level
 
 
 class AsyncioEventLoop(_AbstractEventLoop):
@@ -39,7 +42,7 @@ class AsyncioEventLoop(_AbstractEventLoop):
 		self.call_at = loop.call_at
 		self.is_running = loop.is_running
 		self.is_closed = loop.is_closed
-		self.close = loop.close
+		self.close = self._close
 		self.create_future = (loop.create_future
 			if hasattr(loop, 'create_future') else self._create_future)
 		self.create_task = loop.create_task
@@ -54,6 +57,7 @@ class AsyncioEventLoop(_AbstractEventLoop):
 		self.set_debug = loop.set_debug
 		self.get_debug = loop.get_debug
 		self._wakeup_fd = -1
+		self._child_watcher = None
 
 		if portage._internal_caller:
 			loop.set_exception_handler(self._internal_caller_exception_handler)
@@ -95,12 +99,26 @@ class AsyncioEventLoop(_AbstractEventLoop):
 		"""
 		Portage internals use this as a layer of indirection for
 		asyncio.get_child_watcher(), in order to support versions of
-		python where asyncio is not available.
+		python where asyncio is not available. If the kernel supports
+		pidfd_open, then child processes are watched via pidfds that
+		are polled by this event loop. Otherwise, asyncio's child
+		watcher is used.
 
 		@rtype: asyncio.AbstractChildWatcher
 		@return: the internal event loop's AbstractChildWatcher interface
 		"""
-		return _real_asyncio.get_child_watcher()
+		if self._child_watcher is None:
+			if _PidfdChildWatcher.supported():
+				self._child_watcher = _PidfdChildWatcher(self._loop)
+			else:
+				self._child_watcher = _real_asyncio.get_child_watcher()
+		return self._child_watcher
+
+	def _close(self):
+		if isinstance(self._child_watcher, _PidfdChildWatcher):
+			self._child_watcher.close()
+		self._child_watcher = None
+		self._loop.close()
 
 	@property
 	def _asyncio_wrapper(self):
@@ -135,3 +153,110 @@ class AsyncioEventLoop(_AbstractEventLoop):
 			return self._loop.run_until_complete(future)
 		finally:
 			self._wakeup_fd = signal.set_wakeup_fd(-1)
+
+
+class _PidfdChildWatcher(object):
+	"""
+	A child watcher which polls a pidfd for each child process with the
+	event loop, so that each exit is handled as an ordinary I/O event,
+	without SIGCHLD handling, waitpid scans, or a thread per child
+	process. Like asyncio's child watchers, it only reaps the processes
+	that it has been asked to watch.
+	"""
+
+	_supported = None
+
+	def __init__(self, loop):
+		self._loop = loop
+		self._callbacks = {}
+
+	@classmethod
+	def supported(cls):
+		if cls._supported is None:
+			cls._supported = False
+			pidfd_open = getattr(os, 'pidfd_open', None)
+			if pidfd_open is not None:
+				try:
+					os.close(pidfd_open(os.getpid()))
+				except OSError:
+					pass
+				else:
+					cls._supported = True
+		return cls._supported
+
+	def close(self):
+		for pid in list(self._callbacks):
+			self.remove_child_handler(pid)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, a, b, c):
+		pass
+
+	def add_child_handler(self, pid, callback, *args):
+		"""
+		Register a new child handler.
+
+		Arrange for callback(pid, returncode, *args) to be called when
+		process 'pid' terminates. Specifying another callback for the same
+		process replaces the previous handler.
+		"""
+		self.remove_child_handler(pid)
+		try:
+			pidfd = os.pidfd_open(pid)
+		except OSError as e:
+			if e.errno != errno.ESRCH:
+				raise
+			# The process has already been reaped by someone else.
+			self._loop.call_soon(self._reap, pid, callback, args)
+			return
+		self._callbacks[pid] = (pidfd, callback, args)
+		self._loop.add_reader(pidfd, self._pidfd_ready, pid)
+
+	def remove_child_handler(self, pid):
+		"""
+		Removes the handler for process 'pid'.
+
+		The function returns True if the handler was successfully removed,
+		False if there was nothing to remove.
+		"""
+		entry = self._callbacks.pop(pid, None)
+		if entry is None:
+			return False
+		pidfd = entry[0]
+		self._loop.remove_reader(pidfd)
+		os.close(pidfd)
+		return True
+
+	def _pidfd_ready(self, pid):
+		pidfd, callback, args = self._callbacks.pop(pid)
+		self._loop.remove_reader(pidfd)
+		os.close(pidfd)
+		self._reap(pid, callback, args)
+
+	def _reap(self, pid, callback, args):
+		try:
+			wait_pid, status = os.waitpid(pid, os.WNOHANG)
+		except OSError as e:
+			if e.errno != errno.ECHILD:
+				raise
+			wait_pid = None
+
+		if wait_pid == pid:
+			if os.WIFSIGNALED(status):
+				returncode = -os.WTERMSIG(status)
+			elif os.WIFEXITED(status):
+				returncode = os.WEXITSTATUS(status)
+			else:
+				returncode = status
+		else:
+			# The exit status is unknown, since the process has been
+			# reaped by someone else. This is consistent with
+			# asyncio's child watchers.
+			returncode = 255
+			writemsg_level("!!! Unknown child process pid %d, "
+				"will report returncode 255\n" % (pid,),
+				level=logging.WARNING, noiselevel=-1)
+
+		callback(pid, returncode, *args)
@@ -1,4 +1,4 @@
-# Copyright 2012-2014 Gentoo Foundation
+# Copyright 2012-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 import io
@@ -38,7 +38,7 @@ def have_pep_476():
 	return hasattr(__import__('ssl'), '_create_unverified_context')
 
 
-def urlopen(url, if_modified_since=None):
+def urlopen(url, if_modified_since=None, if_none_match=None):
 	parse_result = urllib_parse.urlparse(url)
 	if parse_result.scheme not in ("http", "https"):
 		return _urlopen(url)
@@ -50,6 +50,8 @@ def urlopen(url, if_modified_since=None):
 		request.add_header('User-Agent', 'Gentoo Portage')
 		if if_modified_since:
 			request.add_header('If-Modified-Since', _timestamp_to_http(if_modified_since))
+		if if_none_match:
+			request.add_header('If-None-Match', if_none_match)
 		if parse_result.username is not None:
 			password_manager.add_password(None, url, parse_result.username, parse_result.password)
 		auth_handler = CompressedResponseProcessor(password_manager)
@@ -1,6 +1,7 @@
-# Copyright 2017 Gentoo Foundation
+# Copyright 2017-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
+import errno
 import os
 import shutil
 import tempfile
@@ -30,7 +31,77 @@ def _optimized_copyfile(src, dst):
 		_file_copy(src_file.fileno(), dst_file.fileno())
 
 
-if _file_copy is None:
-	copyfile = shutil.copyfile
-else:
+def _copy_range(src_fd, dst_fd, offset, length):
+	"""
+	Copy length bytes at offset from src_fd to dst_fd, with
+	os.copy_file_range if the kernel supports it for these files,
+	and with pread and pwrite otherwise.
+	"""
+	end = offset + length
+	while offset < end:
+		try:
+			copied = os.copy_file_range(src_fd, dst_fd, end - offset,
+				offset, offset)
+		except OSError as e:
+			if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+				errno.EOPNOTSUPP, errno.EPERM):
+				raise
+			break
+		if copied == 0:
+			# The source file has been truncated concurrently.
+			return
+		offset += copied
+
+	while offset < end:
+		buf = os.pread(src_fd, min(end - offset, 0x100000), offset)
+		if not buf:
+			return
+		while buf:
+			written = os.pwrite(dst_fd, buf, offset)
+			buf = buf[written:]
+			offset += written
+
+
+def _copy_file_range_copyfile(src, dst):
+	"""
+	Copy the contents (no metadata) of the file named src to a file
+	named dst, using os.copy_file_range so that the data is copied
+	within the kernel (and reflinked by file systems that support
+	it). Holes are skipped with SEEK_DATA and SEEK_HOLE, so that sparse
+	files remain sparse. This is used when the reflink_linux extension
+	is not available.
+
+	@param src: path of source file
+	@type src: str
+	@param dst: path of destination file
+	@type dst: str
+	"""
+	with open(src, 'rb', buffering=0) as src_file, \
+		open(dst, 'wb', buffering=0) as dst_file:
+		src_fd = src_file.fileno()
+		dst_fd = dst_file.fileno()
+		size = os.fstat(src_fd).st_size
+		offset = 0
+		while offset < size:
+			try:
+				data = os.lseek(src_fd, offset, os.SEEK_DATA)
+				hole = os.lseek(src_fd, data, os.SEEK_HOLE)
+			except OSError as e:
+				if e.errno == errno.ENXIO:
+					# The rest of the file is a hole.
+					break
+				if e.errno != errno.EINVAL:
+					raise
+				# SEEK_DATA is not supported by this file system.
+				data, hole = offset, size
+			_copy_range(src_fd, dst_fd, data, min(hole, size) - data)
+			offset = hole
+		dst_file.truncate(size)
+
+
+if _file_copy is not None:
 	copyfile = _optimized_copyfile
+elif hasattr(os, 'copy_file_range') and hasattr(os, 'SEEK_DATA'):
+	copyfile = _copy_file_range_copyfile
+else:
+	copyfile = shutil.copyfile
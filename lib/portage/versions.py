@@ -7,7 +7,7 @@ from __future__ import unicode_literals
 __all__ = [
 	'best', 'catpkgsplit', 'catsplit',
 	'cpv_getkey', 'cpv_getversion', 'cpv_sort_key', 'pkgcmp',  'pkgsplit',
-	'ververify', 'vercmp'
+	'sort_versions', 'ververify', 'vercmp'
 ]
 
 import re
@@ -116,6 +116,72 @@ def ververify(myver, silent=1):
 			print(_("!!! syntax error in version: %s") % myver)
 		return False
 
+# Parsed version keys are cached, since the same versions are compared
+# many times during dependency resolution. The cache is cleared when it
+# reaches _ver_key_cache_max entries, in order to bound memory usage.
+_ver_key_cache = {}
+_ver_key_cache_max = 0x10000
+
+def _ver_key(ver):
+	"""
+	Parse a version into a tuple which can be compared with the
+	comparison operators, in order to yield the same ordering as
+	vercmp. Results are cached.
+
+	@param ver: version (see ver_regexp in portage.versions.py)
+	@type ver: string (example: "2.1.2-r3")
+	@rtype: tuple or None
+	@return: the version key, or None if ver is invalid
+	"""
+	try:
+		return _ver_key_cache[ver]
+	except KeyError:
+		pass
+
+	match = ver_regexp.match(ver)
+	if match is None:
+		key = None
+	else:
+		# The first component is always compared as an integer. Other
+		# components with a leading zero are compared as decimal
+		# fractions (so that 1.02 < 1.1), which is equivalent to
+		# comparison of the digit strings with trailing zeros removed,
+		# and they are always less than components without a leading
+		# zero. A missing component is less than any component, since
+		# a shorter tuple is less than a longer one with the same
+		# prefix (so that 1.0 < 1.0.0).
+		components = [(1, int(match.group(1)))]
+		if match.group(2):
+			for component in match.group(2)[1:].split("."):
+				if component[0] == "0":
+					components.append((0, component.rstrip("0")))
+				else:
+					components.append((1, int(component)))
+
+		# NOTE: Behavior changed in r2309 (between portage-2.0.x and
+		# portage-2.1). The new behavior is 12.2.5 > 12.2b (see vercmp).
+		letter = match.group(4)
+		letter = ord(letter) if letter else 0
+
+		# A missing suffix is equivalent to _p-1 (so that 1 < 1_p0),
+		# which is appended to the suffixes so that a shorter list of
+		# suffixes is compared the same way as in vercmp.
+		suffixes = []
+		for suffix in match.group(5).split("_")[1:]:
+			suffix, num = suffix_regexp.match(suffix).groups()
+			suffixes.append((suffix_value[suffix], int(num) if num else 0))
+		suffixes.append((suffix_value["p"], -1))
+
+		rev = match.group(9)
+		rev = int(rev) if rev else 0
+
+		key = (tuple(components), letter, tuple(suffixes), rev)
+
+	if len(_ver_key_cache) >= _ver_key_cache_max:
+		_ver_key_cache.clear()
+	_ver_key_cache[ver] = key
+	return key
+
 def vercmp(ver1, ver2, silent=1):
 	"""
 	Compare two versions
@@ -143,124 +209,20 @@ def vercmp(ver1, ver2, silent=1):
 	if ver1 == ver2:
 		return 0
 
-	match1 = ver_regexp.match(ver1)
-	match2 = ver_regexp.match(ver2)
+	key1 = _ver_key(ver1)
+	key2 = _ver_key(ver2)
 
 	# checking that the versions are valid
-	if not match1 or not match1.groups():
+	if key1 is None:
 		if not silent:
 			print(_("!!! syntax error in version: %s") % ver1)
 		return None
-	if not match2 or not match2.groups():
+	if key2 is None:
 		if not silent:
 			print(_("!!! syntax error in version: %s") % ver2)
 		return None
 
-	# building lists of the version parts before the suffix
-	# first part is simple
-	list1 = [int(match1.group(1))]
-	list2 = [int(match2.group(1))]
-
-	# this part would greatly benefit from a fixed-length version pattern
-	if match1.group(2) or match2.group(2):
-		vlist1 = match1.group(2)[1:].split(".")
-		vlist2 = match2.group(2)[1:].split(".")
-
-		for i in range(0, max(len(vlist1), len(vlist2))):
-			# Implcit .0 is given a value of -1, so that 1.0.0 > 1.0, since it
-			# would be ambiguous if two versions that aren't literally equal
-			# are given the same value (in sorting, for example).
-			if len(vlist1) <= i or len(vlist1[i]) == 0:
-				list1.append(-1)
-				list2.append(int(vlist2[i]))
-			elif len(vlist2) <= i or len(vlist2[i]) == 0:
-				list1.append(int(vlist1[i]))
-				list2.append(-1)
-			# Let's make life easy and use integers unless we're forced to use floats
-			elif (vlist1[i][0] != "0" and vlist2[i][0] != "0"):
-				list1.append(int(vlist1[i]))
-				list2.append(int(vlist2[i]))
-			# now we have to use floats so 1.02 compares correctly against 1.1
-			else:
-				# list1.append(float("0."+vlist1[i]))
-				# list2.append(float("0."+vlist2[i]))
-				# Since python floats have limited range, we multiply both
-				# floating point representations by a constant so that they are
-				# transformed into whole numbers. This allows the practically
-				# infinite range of a python int to be exploited. The
-				# multiplication is done by padding both literal strings with
-				# zeros as necessary to ensure equal length.
-				max_len = max(len(vlist1[i]), len(vlist2[i]))
-				list1.append(int(vlist1[i].ljust(max_len, "0")))
-				list2.append(int(vlist2[i].ljust(max_len, "0")))
-
-	# and now the final letter
-	# NOTE: Behavior changed in r2309 (between portage-2.0.x and portage-2.1).
-	# The new behavior is 12.2.5 > 12.2b which, depending on how you look at,
-	# may seem counter-intuitive. However, if you really think about it, it
-	# seems like it's probably safe to assume that this is the behavior that
-	# is intended by anyone who would use versions such as these.
-	if len(match1.group(4)):
-		list1.append(ord(match1.group(4)))
-	if len(match2.group(4)):
-		list2.append(ord(match2.group(4)))
-
-	for i in range(0, max(len(list1), len(list2))):
-		if len(list1) <= i:
-			return -1
-		elif len(list2) <= i:
-			return 1
-		elif list1[i] != list2[i]:
-			a = list1[i]
-			b = list2[i]
-			rval = (a > b) - (a < b)
-			return rval
-
-	# main version is equal, so now compare the _suffix part
-	list1 = match1.group(5).split("_")[1:]
-	list2 = match2.group(5).split("_")[1:]
-
-	for i in range(0, max(len(list1), len(list2))):
-		# Implicit _p0 is given a value of -1, so that 1 < 1_p0
-		if len(list1) <= i:
-			s1 = ("p","-1")
-		else:
-			s1 = suffix_regexp.match(list1[i]).groups()
-		if len(list2) <= i:
-			s2 = ("p","-1")
-		else:
-			s2 = suffix_regexp.match(list2[i]).groups()
-		if s1[0] != s2[0]:
-			a = suffix_value[s1[0]]
-			b = suffix_value[s2[0]]
-			rval = (a > b) - (a < b)
-			return rval
-		if s1[1] != s2[1]:
-			# it's possible that the s(1|2)[1] == ''
-			# in such a case, fudge it.
-			try:
-				r1 = int(s1[1])
-			except ValueError:
-				r1 = 0
-			try:
-				r2 = int(s2[1])
-			except ValueError:
-				r2 = 0
-			rval = (r1 > r2) - (r1 < r2)
-			if rval:
-				return rval
-
-	# the suffix part is equal to, so finally check the revision
-	if match1.group(9):
-		r1 = int(match1.group(9))
-	else:
-		r1 = 0
-	if match2.group(9):
-		r2 = int(match2.group(9))
-	else:
-		r2 = 0
-	rval = (r1 > r2) - (r1 < r2)
-	return rval
+	return (key1 > key2) - (key1 < key2)
 
 def pkgcmp(pkg1, pkg2):
 	"""
@@ -313,6 +275,10 @@ def _pkgsplit(mypkg, eapi=None):
 _cat_re = re.compile('^%s$' % _cat, re.UNICODE)
 _missing_cat = 'null'
 
+# Results of catpkgsplit for plain strings, which are bounded in the
+# same way as _ver_key_cache.
+_catpkgsplit_cache = {}
+
 def catpkgsplit(mydata, silent=1, eapi=None):
 	"""
 	Takes a Category/Package-Version-Rev and returns a list of each.
@@ -331,6 +297,11 @@ def catpkgsplit(mydata, silent=1, eapi=None):
 		return mydata.cpv_split
 	except AttributeError:
 		pass
+	cache_key = (mydata, eapi)
+	try:
+		return _catpkgsplit_cache[cache_key]
+	except KeyError:
+		pass
 	mysplit = mydata.split('/', 1)
 	p_split = None
 	if len(mysplit) == 1:
@@ -341,8 +312,12 @@ def catpkgsplit(mydata, silent=1, eapi=None):
 		if _cat_re.match(cat) is not None:
 			p_split = _pkgsplit(mysplit[1], eapi=eapi)
 	if not p_split:
-		return None
-	retval = (cat, p_split[0], p_split[1], p_split[2])
+		retval = None
+	else:
+		retval = (cat, p_split[0], p_split[1], p_split[2])
+	if len(_catpkgsplit_cache) >= _ver_key_cache_max:
+		_catpkgsplit_cache.clear()
+	_catpkgsplit_cache[cache_key] = retval
 	return retval
 
 class _pkg_str(_unicode):
@@ -463,6 +438,19 @@ class _pkg_str(_unicode):
 			self.__dict__['_stable'] = stable
 			return stable
 
+	@property
+	def version_key(self):
+		"""
+		A key for comparison of the version of this cpv with the
+		versions of other cpvs, which is equivalent to vercmp.
+		"""
+		try:
+			return self._version_key
+		except AttributeError:
+			version_key = _ver_key(self.version)
+			self.__dict__['_version_key'] = version_key
+			return version_key
+
 def pkgsplit(mypkg, silent=1, eapi=None):
 	"""
 	@param mypkg: either a pv or cpv
@@ -559,30 +547,54 @@ def cpv_sort_key(eapi=None):
 		if split1 is None or split2 is None or split1.cp != split2.cp:
 			return (cpv1 > cpv2) - (cpv1 < cpv2)
 
-		return vercmp(split1.version, split2.version)
+		key1 = split1.version_key
+		key2 = split2.version_key
+		return (key1 > key2) - (key1 < key2)
 
 	return cmp_sort_key(cmp_cpv)
 
 def catsplit(mydep):
 	return mydep.split("/", 1)
 
+def _version_keys(mymatches, eapi=None):
+	"""
+	Generate (version_key, cpv) pairs for the given cpvs, which are
+	assumed to be valid.
+	"""
+	for x in mymatches:
+		try:
+			key = x.version_key
+		except AttributeError:
+			key = _pkg_str(x, eapi=eapi).version_key
+		yield key, x
+
+def sort_versions(mymatches, eapi=None, reverse=False):
+	"""
+	Sort cpvs by version, parsing each version only once. Like best(),
+	this assumes that the cpvs are valid. The sort is stable, so cpvs
+	with equal versions retain their relative order.
+
+	@param mymatches: cpvs to sort
+	@type mymatches: iterable
+	@param reverse: sort in descending order
+	@type reverse: bool
+	@rtype: list
+	@return: a new list of the given cpvs, sorted by version
+	"""
+	decorated = list(_version_keys(mymatches, eapi=eapi))
+	decorated.sort(key=lambda x: x[0], reverse=reverse)
+	return [x for key, x in decorated]
+
 def best(mymatches, eapi=None):
 	"""Accepts None arguments; assumes matches are valid."""
 	if not mymatches:
 		return ""
 	if len(mymatches) == 1:
 		return mymatches[0]
-	bestmatch = mymatches[0]
-	try:
-		v2 = bestmatch.version
-	except AttributeError:
-		v2 = _pkg_str(bestmatch, eapi=eapi).version
-	for x in mymatches[1:]:
-		try:
-			v1 = x.version
-		except AttributeError:
-			v1 = _pkg_str(x, eapi=eapi).version
-		if vercmp(v1, v2) > 0:
+	bestkey = None
+	bestmatch = None
+	for key, x in _version_keys(mymatches, eapi=eapi):
+		if bestmatch is None or key > bestkey:
+			bestkey = key
 			bestmatch = x
-			v2 = v1
 	return bestmatch
@@ -1,4 +1,4 @@
-# Copyright 2001-2014 Gentoo Foundation
+# Copyright 2001-2019 Gentoo Authors
 # Distributed under the terms of the GNU General Public License v2
 
 
@@ -17,13 +17,16 @@
 
 __all__ = [
 	'addtolist', 'decodeint', 'encodeint', 'getboth',
-	'getindex', 'getindex_mem', 'getitem', 'listindex',
+	'getindex', 'getindex_mem', 'getitem', 'iter_xpak_data', 'listindex',
 	'searchindex', 'tbz2', 'xpak_mem', 'xpak', 'xpand',
-	'xsplit', 'xsplit_mem',
+	'XpakReader', 'xsplit', 'xsplit_mem',
 ]
 
 import array
+import collections
 import errno
+import mmap
+import struct
 import sys
 
 import portage
@@ -468,22 +471,12 @@ class tbz2(object):
 
 	def get_data(self):
 		"""Returns all the files from the dataSegment as a map object."""
-		if not self.scan():
+		try:
+			reader = XpakReader(self.file)
+		except EnvironmentError:
 			return {}
-		a = open(_unicode_encode(self.file,
-			encoding=_encodings['fs'], errors='strict'), 'rb')
-		mydata = {}
-		startpos = 0
-		while ((startpos + 8) < self.indexsize):
-			namelen = decodeint(self.index[startpos:startpos + 4])
-			datapos = decodeint(self.index[startpos + 4 + namelen:startpos + 8 + namelen])
-			datalen = decodeint(self.index[startpos + 8 + namelen:startpos + 12 + namelen])
-			myname = self.index[startpos + 4:startpos + 4 + namelen]
-			a.seek(self.datapos + datapos)
-			mydata[myname] = a.read(datalen)
-			startpos = startpos + namelen + 12
-		a.close()
-		return mydata
+		with reader:
+			return reader.get_data()
 
 	def getboth(self):
 		"""Returns an array [indexSegment, dataSegment]"""
@@ -497,3 +490,207 @@ class tbz2(object):
 		a.close()
 
 		return self.index, mydata
+
+# Amount of data at the end of each file which iter_xpak_data asks the
+# kernel to read ahead. This covers the xpak segment of most binary
+# packages, including environment.bz2.
+_xpak_readahead_size = 0x40000
+
+class XpakReader(object):
+	"""
+	Random-access reader for the xpak segment of a tbz2 file. The end of
+	the file is memory mapped, the index is parsed when it is first
+	needed, and get() returns memoryviews of the mapping, so that
+	individual values are not copied. Any memoryviews must be released
+	before the reader is closed, or else the mapping is left for the
+	garbage collector. An invalid or missing xpak segment results in an
+	empty reader, while errors from open() are raised.
+	"""
+
+	_int = struct.Struct(">I")
+	_int_pair = struct.Struct(">II")
+
+	def __init__(self, filename, fileobj=None):
+		"""
+		@param filename: path of the tbz2 file
+		@type filename: str
+		@param fileobj: an already open binary file object for filename,
+			which is closed by the reader after the file is mapped
+		@type fileobj: file
+		"""
+		self.filename = filename
+		self._mmap = None
+		self._view = None
+		self._index = None
+		self._index_pos = 0
+		self._index_size = 0
+		self._data_pos = 0
+		self._data_size = 0
+		if fileobj is None:
+			fileobj = open(_unicode_encode(filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		try:
+			self._map(fileobj)
+		except (EnvironmentError, ValueError, struct.error):
+			self.close()
+		finally:
+			fileobj.close()
+
+	def _map(self, f):
+		size = os.fstat(f.fileno()).st_size
+		if size < 16:
+			return
+		f.seek(-16, 2)
+		trailer = f.read(16)
+		if trailer[-4:] != b'STOP' or trailer[0:8] != b'XPAKSTOP':
+			return
+		xpak_start = size - (self._int.unpack(trailer[8:12])[0] + 8)
+		if xpak_start < 0:
+			return
+		# The offset of the mapping has to be a multiple of the
+		# allocation granularity.
+		offset = xpak_start - xpak_start % mmap.ALLOCATIONGRANULARITY
+		m = mmap.mmap(f.fileno(), size - offset, access=mmap.ACCESS_READ,
+			offset=offset)
+		self._mmap = m
+		base = xpak_start - offset
+		if m[base:base + 8] != b'XPAKPACK':
+			self.close()
+			return
+		self._index_size, self._data_size = \
+			self._int_pair.unpack_from(m, base + 8)
+		self._index_pos = base + 16
+		self._data_pos = self._index_pos + self._index_size
+		if self._data_pos + self._data_size > len(m):
+			self.close()
+			return
+		try:
+			self._view = memoryview(m)
+		except TypeError:
+			# Python 2 mmap objects do not support memoryview, so
+			# values are copied from the mapping instead.
+			self._view = m
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		view = self._view
+		self._view = None
+		if view is not None and view is not self._mmap:
+			view.release()
+		m = self._mmap
+		self._mmap = None
+		self._index = {}
+		if m is not None:
+			try:
+				m.close()
+			except BufferError:
+				# A memoryview returned by get() is still in use.
+				pass
+
+	def _get_index(self):
+		index = self._index
+		if index is None:
+			index = {}
+			m = self._mmap
+			pos = self._index_pos
+			end = pos + self._index_size
+			while pos + 8 < end:
+				namelen, = self._int.unpack_from(m, pos)
+				name = m[pos + 4:pos + 4 + namelen]
+				index[name] = self._int_pair.unpack_from(m,
+					pos + 4 + namelen)
+				pos += namelen + 12
+			self._index = index
+		return index
+
+	def keys(self):
+		"""Return the names of all files in the data segment, as bytes."""
+		return list(self._get_index())
+
+	def get(self, key, default=None):
+		"""
+		Return the value of a file in the data segment as a memoryview
+		(or as bytes with Python 2), without copying it.
+
+		@param key: file name
+		@type key: bytes or str
+		"""
+		key = _unicode_encode(key, encoding=_encodings['repo.content'],
+			errors='backslashreplace')
+		try:
+			datapos, datalen = self._get_index()[key]
+		except KeyError:
+			return default
+		start = self._data_pos + datapos
+		return self._view[start:start + datalen]
+
+	def get_data(self):
+		"""
+		Return all files in the data segment as a dict of bytes, in the
+		same format as tbz2.get_data().
+		"""
+		mydata = {}
+		for name, (datapos, datalen) in self._get_index().items():
+			start = self._data_pos + datapos
+			mydata[name] = self._mmap[start:start + datalen]
+		return mydata
+
+def iter_xpak_data(filenames, readahead=32):
+	"""
+	Generate (filename, data) tuples for the given tbz2 files, in order,
+	where data is a dict of bytes like tbz2.get_data() returns, and it
+	is empty for files which cannot be read or which do not have a valid
+	xpak segment. The next files are opened ahead of time, and the
+	kernel is advised to read the ends of those files, so that the small
+	reads for many packages do not wait for the disk one at a time.
+
+	@param filenames: paths of tbz2 files
+	@type filenames: iterable
+	@param readahead: number of files which are opened ahead of time
+	@type readahead: int
+	"""
+	fadvise = getattr(os, 'posix_fadvise', None)
+	filenames = iter(filenames)
+	pending = collections.deque()
+
+	def open_next():
+		for filename in filenames:
+			try:
+				f = open(_unicode_encode(filename,
+					encoding=_encodings['fs'], errors='strict'), 'rb')
+			except EnvironmentError:
+				f = None
+			else:
+				if fadvise is not None:
+					try:
+						size = os.fstat(f.fileno()).st_size
+						fadvise(f.fileno(),
+							max(0, size - _xpak_readahead_size), 0,
+							os.POSIX_FADV_WILLNEED)
+					except OSError:
+						pass
+			pending.append((filename, f))
+			return True
+		return False
+
+	try:
+		while len(pending) < max(1, readahead) and open_next():
+			pass
+		while pending:
+			filename, f = pending.popleft()
+			open_next()
+			if f is None:
+				mydata = {}
+			else:
+				with XpakReader(filename, fileobj=f) as reader:
+					mydata = reader.get_data()
+			yield filename, mydata
+	finally:
+		for filename, f in pending:
+			if f is not None:
+				f.close()